@@ -0,0 +1,168 @@
+import sqlite3
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import atexit
+from config import config # Import the already loaded config
+import state_manager as sm
+
+logger = logging.getLogger(__name__)
+
+cache_conf = config.get('ai_cache', {})
+ENABLED = cache_conf.get('enabled', False)
+# Skip cache lookups (fresh completions are still stored), e.g. to re-run after changing a prompt
+BYPASS = cache_conf.get('bypass', False)
+# Stored next to the state database unless configured otherwise
+DB_FILE = cache_conf.get('db_file') or os.path.join(os.path.dirname(sm.DB_FILE), 'ai_cache.db')
+TTL_SECONDS = float(cache_conf.get('ttl_hours', 24 * 30)) * 3600
+MAX_ENTRIES = max(1, int(cache_conf.get('max_entries', 5000)))
+
+# Evictions run once per this many stores instead of on every write
+_EVICT_EVERY = 50
+
+_SELECT_SQL = "SELECT response, created_at FROM ai_responses WHERE key = ?"
+_TOUCH_SQL = "UPDATE ai_responses SET last_used_at = ? WHERE key = ?"
+_DELETE_SQL = "DELETE FROM ai_responses WHERE key = ?"
+_UPSERT_SQL = """
+INSERT INTO ai_responses (key, model, response, created_at, last_used_at) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(key) DO UPDATE SET response = excluded.response, created_at = excluded.created_at, last_used_at = excluded.last_used_at
+"""
+
+_conn = None
+_conn_lock = threading.Lock() # Guards the connection and the counters
+_stats = {'hits': 0, 'misses': 0}
+_stores_since_evict = 0
+
+def _get_connection():
+    """Returns the cache database connection, creating the table on first use. Caller must hold _conn_lock."""
+    global _conn
+    if _conn is None:
+        db_dir = os.path.dirname(DB_FILE)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        _conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute("PRAGMA busy_timeout=5000")
+        with _conn:
+            _conn.execute('''
+            CREATE TABLE IF NOT EXISTS ai_responses (
+                key TEXT PRIMARY KEY,  -- SHA-256 of model, temperature, response format and normalized prompt
+                model TEXT,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,   -- For the TTL
+                last_used_at REAL NOT NULL  -- For LRU eviction
+            )''')
+            _conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_responses_last_used ON ai_responses (last_used_at)")
+        logger.debug(f"Opened AI response cache at {DB_FILE}")
+    return _conn
+
+def _normalize_prompt(text):
+    """Collapses whitespace so indentation-only changes to a prompt template still hit the cache."""
+    return re.sub(r'\s+', ' ', text).strip()
+
+def make_key(request):
+    """Returns the cache key of a chat completion request."""
+    key_data = {
+        'model': request.get('model'),
+        'temperature': request.get('temperature'),
+        'response_format': request.get('response_format'),
+        'messages': [[message.get('role'), _normalize_prompt(message.get('content') or '')] for message in request.get('messages', [])],
+    }
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def get(request):
+    """Returns the cached response content for a request, or None on a miss (or if the cache is off)."""
+    if not ENABLED:
+        return None
+    key = make_key(request)
+    now = time.time()
+    with _conn_lock:
+        if BYPASS:
+            _stats['misses'] += 1
+            return None
+        try:
+            conn = _get_connection()
+            row = conn.execute(_SELECT_SQL, (key,)).fetchone()
+            if row and now - row[1] > TTL_SECONDS:
+                with conn:
+                    conn.execute(_DELETE_SQL, (key,))
+                row = None
+            if row is None:
+                _stats['misses'] += 1
+                return None
+            with conn:
+                conn.execute(_TOUCH_SQL, (now, key))
+            _stats['hits'] += 1
+        except sqlite3.Error as e:
+            logger.error(f"AI cache lookup failed: {e}")
+            _stats['misses'] += 1
+            return None
+    logger.debug(f"AI cache hit for {request.get('model')} request {key[:12]}")
+    return row[0]
+
+def put(request, response):
+    """Stores the response content of a successful request."""
+    put_by_key(make_key(request), response, request.get('model'))
+
+def put_by_key(key, response, model=None):
+    """Stores a response under a key from make_key(), for answers that arrive without their request (batch job output)."""
+    global _stores_since_evict
+    if not ENABLED or not response:
+        return
+    now = time.time()
+    with _conn_lock:
+        try:
+            conn = _get_connection()
+            with conn:
+                conn.execute(_UPSERT_SQL, (key, model, response, now, now))
+            _stores_since_evict += 1
+            if _stores_since_evict >= _EVICT_EVERY:
+                _stores_since_evict = 0
+                _evict_locked(conn, now)
+        except sqlite3.Error as e:
+            logger.error(f"AI cache store failed: {e}")
+
+def discard(request):
+    """Drops the cached response of a request, e.g. because it turned out to be unusable."""
+    if not ENABLED:
+        return
+    key = make_key(request)
+    with _conn_lock:
+        try:
+            conn = _get_connection()
+            with conn:
+                conn.execute(_DELETE_SQL, (key,))
+        except sqlite3.Error as e:
+            logger.error(f"AI cache delete failed: {e}")
+            return
+    logger.debug(f"Dropped unusable AI cache entry for {request.get('model')} request {key[:12]}")
+
+def _evict_locked(conn, now):
+    """Drops expired entries and the least recently used ones beyond MAX_ENTRIES. Caller holds _conn_lock."""
+    with conn:
+        expired = conn.execute("DELETE FROM ai_responses WHERE created_at < ?", (now - TTL_SECONDS,)).rowcount
+        over_limit = conn.execute(
+            "DELETE FROM ai_responses WHERE key IN (SELECT key FROM ai_responses ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+            (MAX_ENTRIES,)).rowcount
+    if expired or over_limit:
+        logger.info(f"Evicted {expired} expired and {over_limit} least recently used AI cache entries")
+
+def get_stats():
+    """Returns the hit/miss counters of this run."""
+    with _conn_lock:
+        return dict(_stats)
+
+def close():
+    """Closes the cache database connection."""
+    global _conn
+    with _conn_lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+
+atexit.register(close)
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+import threading
+import weakref
+import httpx
+import openai
+from rate_limiter import CircuitBreaker, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+def _create_http_client(client_cls, proxy):
+    """Creates an httpx (Async)Client routed through the proxy, across httpx versions."""
+    try:
+        return client_cls(proxy=proxy) # httpx >= 0.26
+    except TypeError:
+        # Older httpx versions only accept a proxies mapping
+        return client_cls(proxies={"http://": proxy, "https://": proxy})
+
+def is_endpoint_error(e):
+    """True if an error says something about the endpoint (unreachable, overloaded, key rejected), not the request."""
+    if isinstance(e, openai.APIConnectionError): # Includes timeouts
+        return True
+    status_code = getattr(e, 'status_code', None) if isinstance(e, openai.APIStatusError) else None
+    return status_code is not None and (status_code in (401, 403, 404, 429) or status_code >= 500)
+
+class Endpoint:
+    """One OpenAI-compatible API endpoint (base URL + key), with its clients, load and health."""
+
+    def __init__(self, name, api_key, base_url=None, proxy=None, models=None, model_aliases=None,
+                 max_concurrent=8, failure_threshold=3, cooldown_seconds=30):
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url
+        self.proxy = proxy
+        self.models = set(models) if models else None # None: serves every model
+        self.model_aliases = dict(model_aliases or {}) # Our model name -> the endpoint's name for it
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.outstanding = 0 # Requests routed here and not finished yet; guarded by the pool lock
+        self.health = CircuitBreaker(failure_threshold, cooldown_seconds, name=f"AI endpoint '{name}'")
+        self.client = openai.OpenAI(**self._client_params(httpx.Client))
+        self._async_clients = weakref.WeakKeyDictionary() # Event loop -> AsyncOpenAI client
+
+    def _client_params(self, http_client_cls):
+        # Retries and failover are handled by ai_processor, so the OpenAI clients don't retry on their own
+        client_params = {'api_key': self.api_key, 'max_retries': 0}
+        if self.proxy:
+            try:
+                client_params['http_client'] = _create_http_client(http_client_cls, self.proxy)
+            except Exception as proxy_err:
+                logger.error(f"Failed to configure httpx client with proxy '{self.proxy}' for AI endpoint '{self.name}': {proxy_err}. Proceeding without proxy.")
+        if self.base_url:
+            client_params['base_url'] = self.base_url
+        return client_params
+
+    def serves(self, model):
+        return self.models is None or model in self.models
+
+    def prepare(self, request):
+        """Returns the request with the model renamed to this endpoint's name for it."""
+        model = self.model_aliases.get(request['model'])
+        return dict(request, model=model) if model else request
+
+    def get_async_client(self):
+        """Returns the AsyncOpenAI client for the running event loop (httpx pools are bound to a loop)."""
+        loop = asyncio.get_running_loop()
+        async_client = self._async_clients.get(loop)
+        if async_client is None:
+            async_client = openai.AsyncOpenAI(**self._client_params(httpx.AsyncClient))
+            self._async_clients[loop] = async_client
+            logger.debug(f"Async OpenAI client for AI endpoint '{self.name}' initialized for the running event loop.")
+        return async_client
+
+    async def aclose_async_client(self):
+        async_client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if async_client is not None:
+            await async_client.close()
+
+class ClientPool:
+    """Routes AI requests over several endpoints by least outstanding requests, skipping unhealthy ones.
+
+    An endpoint becomes unhealthy after failure_threshold consecutive endpoint errors (or right away on
+    a 429, for its Retry-After). After the cooldown it gets traffic again; one more failure takes it out.
+    """
+
+    def __init__(self, endpoints):
+        self.endpoints = list(endpoints)
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self.endpoints)
+
+    def _candidates(self, model, exclude):
+        serving = [endpoint for endpoint in self.endpoints if endpoint.serves(model)]
+        if not serving:
+            logger.warning(f"No AI endpoint is configured for model {model}. Using all endpoints.")
+            serving = self.endpoints
+        healthy = [endpoint for endpoint in serving if not endpoint.health.is_open()]
+        return [endpoint for endpoint in healthy if endpoint not in exclude] or healthy or serving
+
+    def acquire(self, model, exclude=()):
+        """Picks the endpoint for a request and counts it as outstanding there. Pair with release()."""
+        with self._lock:
+            # Least outstanding requests, relative to each endpoint's capacity
+            endpoint = min(self._candidates(model, exclude), key=lambda candidate: candidate.outstanding / candidate.max_concurrent)
+            endpoint.outstanding += 1
+        return endpoint
+
+    def has_alternative(self, model, exclude):
+        """True if a healthy endpoint serving the model is left outside `exclude`."""
+        return any(endpoint.serves(model) and endpoint not in exclude and not endpoint.health.is_open()
+                   for endpoint in self.endpoints)
+
+    def release(self, endpoint, error=None):
+        """Records the outcome of a request. Returns True if the error counted against the endpoint."""
+        with self._lock:
+            endpoint.outstanding -= 1
+        if error is None:
+            endpoint.health.record_success()
+            return False
+        if not is_endpoint_error(error):
+            return False # A bad request fails on every endpoint alike
+        endpoint.health.record_failure()
+        if getattr(error, 'status_code', None) == 429:
+            retry_after = parse_retry_after(error.response.headers.get('retry-after'))
+            endpoint.health.open_for(retry_after if retry_after is not None else endpoint.health.cooldown_seconds)
+        return True
+
+    async def aclose_async_clients(self):
+        """Closes the AsyncOpenAI clients of the running event loop."""
+        for endpoint in self.endpoints:
+            await endpoint.aclose_async_client()
+
+def build_client_pool(ai_conf):
+    """Builds the pool from ai_filter.endpoints, or from api_key/api_base_url/proxy if no endpoints are listed.
+
+    Endpoint keys come from the environment variable named by api_key_env (or api_key itself).
+    Returns an empty pool if no endpoint has a key.
+    """
+    health_conf = ai_conf.get('endpoint_health', {})
+    health_settings = {
+        'failure_threshold': health_conf.get('failure_threshold', 3),
+        'cooldown_seconds': health_conf.get('cooldown_seconds', 30),
+    }
+    endpoints = []
+    endpoint_confs = ai_conf.get('endpoints') or []
+    if not endpoint_confs:
+        api_key = ai_conf.get('api_key')
+        if not api_key:
+            logger.warning("OpenAI API key not found. AI processing features will be disabled.")
+            return ClientPool([])
+        base_url = os.getenv('OPENAI_API_BASE_URL', ai_conf.get('api_base_url')) # Env var takes precedence
+        endpoint_confs = [{'name': 'default', 'api_key': api_key, 'base_url': base_url, 'proxy': ai_conf.get('proxy')}]
+
+    for position, endpoint_conf in enumerate(endpoint_confs):
+        name = endpoint_conf.get('name') or f"endpoint-{position + 1}"
+        api_key = os.getenv(endpoint_conf['api_key_env']) if endpoint_conf.get('api_key_env') else endpoint_conf.get('api_key')
+        if not api_key:
+            logger.warning(f"No API key for AI endpoint '{name}' (api_key_env: {endpoint_conf.get('api_key_env')}). Skipping it.")
+            continue
+        try:
+            endpoint = Endpoint(
+                name, api_key,
+                base_url=endpoint_conf.get('base_url'),
+                proxy=endpoint_conf.get('proxy', ai_conf.get('proxy')),
+                models=endpoint_conf.get('models'),
+                model_aliases=endpoint_conf.get('model_aliases'),
+                max_concurrent=endpoint_conf.get('max_concurrent', 8),
+                **health_settings,
+            )
+        except Exception as e:
+            logger.error(f"Failed to initialize OpenAI client for AI endpoint '{name}': {e}")
+            continue
+        endpoints.append(endpoint)
+        logger.info(f"OpenAI client initialized for AI endpoint '{name}'" + (f" ({endpoint.base_url})" if endpoint.base_url else "")
+                    + (f" via proxy {endpoint.proxy}" if endpoint.proxy else ""))
+
+    if not endpoints:
+        logger.warning("No usable AI endpoint configured. AI processing features will be disabled.")
+    return ClientPool(endpoints)
@@ -3,80 +3,731 @@ import json
 import logging
 import time
 import os
-import httpx # Import httpx to support proxies with the openai library
+import asyncio
+import hashlib
+import random
+import re
+import tempfile
+import textwrap
+import threading
+from collections import namedtuple
 from config import config # Import the already loaded config
+from utils import estimate_tokens, split_html_blocks, sample_html_blocks, clean_html
+from markdown_converter import html_to_markdown, apply_annotations
+from concurrent.futures import ThreadPoolExecutor
+import ai_cache
+import glossary
+from rate_limiter import ModelRateLimiter, CircuitBreaker, parse_retry_after
+from ai_client_pool import Endpoint, build_client_pool
+import batch_jobs
 
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
+# AI endpoints: one client per configured endpoint (or the single api_key/api_base_url/proxy endpoint)
 ai_conf = config.get('ai_filter', {})
-api_key = ai_conf.get('api_key')
-api_base_url_from_config = ai_conf.get('api_base_url')
-api_base_url = os.getenv('OPENAI_API_BASE_URL', api_base_url_from_config) # Env var takes precedence
-proxy = ai_conf.get('proxy') # Get proxy setting from loaded config
+_client_pool = build_client_pool(ai_conf)
 
-client = None # Initialize client to None
+# Rate limits and retries are handled here (see _send_with_retries), so the OpenAI clients don't retry on their own
+rate_conf = ai_conf.get('rate_limit', {})
+MAX_RETRIES = max(0, int(rate_conf.get('max_retries', 3)))
+BACKOFF_BASE_SECONDS = float(rate_conf.get('backoff_base_seconds', 2))
+BACKOFF_MAX_SECONDS = float(rate_conf.get('backoff_max_seconds', 60))
+MAX_RETRY_AFTER_SECONDS = float(rate_conf.get('max_retry_after_seconds', 300))
+breaker_conf = rate_conf.get('circuit_breaker', {})
+_circuit_breaker = CircuitBreaker(breaker_conf.get('failure_threshold', 5), breaker_conf.get('cooldown_seconds', 60), name="AI API circuit breaker")
+_model_limiters = {}
+_model_limiters_lock = threading.Lock()
 
-if api_key:
-    try:
-        # Configure httpx client with proxy if provided
-        http_client = None
-        if proxy:
-            try:
-                # Check if socks5h or socks5 specified for specific handling if needed
-                # Basic proxy setup for httpx
-                proxies = {
-                    "http://": proxy,
-                    "https://": proxy,
-                }
-                http_client = httpx.Client(proxies=proxies)
-                logger.info(f"Configuring OpenAI client with proxy: {proxy}")
-            except Exception as proxy_err:
-                logger.error(f"Failed to configure httpx client with proxy '{proxy}': {proxy_err}. Proceeding without proxy.")
-                http_client = None # Fallback to no proxy
-
-        # Recommended: use openai.OpenAI() for client initialization
-        client_params = {
-            'api_key': api_key,
-            'http_client': http_client # Pass the configured httpx client
+async def aclose_async_client():
+    """Closes the AsyncOpenAI clients of the running event loop, if any were created."""
+    await _client_pool.aclose_async_clients()
+
+def _get_model_limiter(model, endpoint):
+    """Returns the shared rate limiter of a model on an endpoint, built from rate_limit.default and its rate_limit.models entry.
+
+    Limits apply per endpoint, since every API key has its own quota.
+    """
+    with _model_limiters_lock:
+        limiter = _model_limiters.get((endpoint.name, model))
+        if limiter is None:
+            limits = dict(rate_conf.get('default') or {})
+            limits.update((rate_conf.get('models') or {}).get(model) or {})
+            limiter = ModelRateLimiter(limits.get('requests_per_minute'), limits.get('tokens_per_minute'))
+            _model_limiters[(endpoint.name, model)] = limiter
+        return limiter
+
+def _estimate_request_tokens(request):
+    """Estimates the prompt tokens of a request, charged against the tokens-per-minute limit up front."""
+    return sum(estimate_tokens(message.get('content')) for message in request['messages'])
+
+def _retry_delay(e, attempt):
+    """Returns the seconds to wait before retrying a failed request, or None if the error is not transient."""
+    retry_after = None
+    if isinstance(e, openai.APIConnectionError): # Includes timeouts
+        pass
+    elif isinstance(e, openai.APIStatusError) and (e.status_code == 429 or e.status_code >= 500):
+        retry_after = parse_retry_after(e.response.headers.get('retry-after'))
+    else:
+        return None
+    if retry_after is not None:
+        return min(retry_after, MAX_RETRY_AFTER_SECONDS)
+    backoff = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt))
+    return backoff / 2 + random.uniform(0, backoff / 2) # Jitter keeps parallel workers from retrying in lockstep
+
+def _before_retry(e, attempt, model, limiter):
+    """Decides whether a failed request is retried. Returns the delay before the next attempt, or None to give up."""
+    delay = _retry_delay(e, attempt)
+    if delay is None:
+        return None
+    _circuit_breaker.record_failure()
+    if attempt >= MAX_RETRIES:
+        logger.error(f"AI request to {model} still failing after {attempt + 1} attempts. Giving up.")
+        return None
+    if getattr(e, 'status_code', None) == 429:
+        limiter.pause(delay) # Other requests to this model wait too
+    logger.warning(f"Transient AI API error from {model}: {e.__class__.__name__} (status {getattr(e, 'status_code', 'N/A')}). Retrying in {delay:.1f}s ({attempt + 1}/{MAX_RETRIES}).")
+    return delay
+
+def _after_success(response, estimated_tokens, limiter, model):
+    """Closes the circuit breaker, charges the tokens the request used beyond the estimate and counts its cached prompt tokens."""
+    _circuit_breaker.record_success()
+    usage = getattr(response, 'usage', None)
+    limiter.record_usage(estimated_tokens, getattr(usage, 'total_tokens', None))
+    _record_prompt_cache_usage(usage, model)
+
+def _fail_over(e, attempt, model, endpoint, tried_endpoints):
+    """Releases the endpoint after an error. Returns True if the request should move on to another endpoint right away."""
+    endpoint_failed = _client_pool.release(endpoint, e)
+    tried_endpoints.add(endpoint)
+    if not endpoint_failed or attempt >= MAX_RETRIES or not _client_pool.has_alternative(model, tried_endpoints):
+        return False
+    logger.warning(f"AI endpoint '{endpoint.name}' failed for {model}: {e.__class__.__name__} (status {getattr(e, 'status_code', 'N/A')}). Failing over to another endpoint ({attempt + 1}/{MAX_RETRIES}).")
+    return True
+
+def _send_with_retries(request, read_stream=None):
+    """Sends a chat completion request within the model's rate limits, retrying transient errors with backoff.
+
+    Each attempt goes to the least busy healthy endpoint; after an endpoint error the next attempt
+    goes to another endpoint without waiting, if there is one. With read_stream, the request is sent with
+    stream=True: read_stream(open_stream) opens and reads the stream, and an error while reading retries the request.
+    """
+    estimated_tokens = _estimate_request_tokens(request)
+    attempt = 0
+    tried_endpoints = set()
+    while True:
+        _circuit_breaker.wait()
+        endpoint = _client_pool.acquire(request['model'], exclude=tried_endpoints)
+        limiter = _get_model_limiter(request['model'], endpoint)
+        try:
+            limiter.acquire(estimated_tokens)
+            if read_stream is None:
+                response = endpoint.client.chat.completions.create(**endpoint.prepare(request))
+            else:
+                response = read_stream(lambda: endpoint.client.chat.completions.create(**_streaming_request(endpoint.prepare(request))))
+        except Exception as e:
+            if _fail_over(e, attempt, request['model'], endpoint, tried_endpoints):
+                attempt += 1
+                continue
+            delay = _before_retry(e, attempt, request['model'], limiter)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+            continue
+        _client_pool.release(endpoint)
+        _after_success(response, estimated_tokens, limiter, request['model'])
+        return response
+
+async def _asend_with_retries(request, read_stream=None):
+    """Async variant of _send_with_retries(). read_stream is a coroutine function here."""
+    estimated_tokens = _estimate_request_tokens(request)
+    attempt = 0
+    tried_endpoints = set()
+    while True:
+        await _circuit_breaker.wait_async()
+        endpoint = _client_pool.acquire(request['model'], exclude=tried_endpoints)
+        limiter = _get_model_limiter(request['model'], endpoint)
+        try:
+            await limiter.acquire_async(estimated_tokens)
+            if read_stream is None:
+                response = await endpoint.get_async_client().chat.completions.create(**endpoint.prepare(request))
+            else:
+                response = await read_stream(lambda: endpoint.get_async_client().chat.completions.create(**_streaming_request(endpoint.prepare(request))))
+        except asyncio.CancelledError:
+            _client_pool.release(endpoint) # Cancelled by the caller (e.g. discarded speculation), not the endpoint's fault
+            raise
+        except Exception as e:
+            if _fail_over(e, attempt, request['model'], endpoint, tried_endpoints):
+                attempt += 1
+                continue
+            delay = _before_retry(e, attempt, request['model'], limiter)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        _client_pool.release(endpoint)
+        _after_success(response, estimated_tokens, limiter, request['model'])
+        return response
+
+def _create_completion(request, parse=None):
+    """Sends a chat completion request and returns the message content, answering from the AI cache when possible.
+
+    With parse, returns parse(content) instead. Answers it rejects (returns None for) are not cached, and a
+    cached one is dropped, so a retry of the article asks the model again instead of reading them back.
+    """
+    cached_content = ai_cache.get(request)
+    if cached_content is not None:
+        result = parse(cached_content) if parse else cached_content
+        if result is None:
+            ai_cache.discard(request)
+        return result
+    response = _send_with_retries(request)
+    content = response.choices[0].message.content
+    result = parse(content) if parse else content
+    if result is not None:
+        ai_cache.put(request, content)
+    return result
+
+async def _acreate_completion(request, parse=None):
+    """Async variant of _create_completion(). The AI cache is read and written in worker threads."""
+    cached_content = await asyncio.to_thread(ai_cache.get, request)
+    if cached_content is not None:
+        result = parse(cached_content) if parse else cached_content
+        if result is None:
+            await asyncio.to_thread(ai_cache.discard, request)
+        return result
+    response = await _asend_with_retries(request)
+    content = response.choices[0].message.content
+    result = parse(content) if parse else content
+    if result is not None:
+        await asyncio.to_thread(ai_cache.put, request, content)
+    return result
+
+# --- Streaming (ai_filter.streaming in config.yaml) --- #
+# Content processing can stream its response: the Markdown is written to a file as it arrives, time to first token
+# and tokens/sec are recorded, and the request is abandoned as soon as the output is obviously broken.
+
+_StreamedResponse = namedtuple('_StreamedResponse', 'content usage')
+_HTML_TAG_PATTERN = re.compile(r'</?(?:p|div|span|section|article|figure|figcaption|img|picture|source|h[1-6]|ul|ol|li|a|'
+                               r'strong|em|b|i|pre|code|blockquote|br|hr|table|thead|tbody|tr|th|td)\b[^>]*>', re.IGNORECASE)
+_streaming_lock = threading.Lock()
+_streaming_stats = {'streamed': 0, 'aborted': 0, 'first_token_seconds': 0.0, 'tokens': 0, 'generation_seconds': 0.0}
+
+class StreamAbortedError(Exception):
+    """Raised when a streamed response is abandoned because its output is obviously broken."""
+
+def _streaming_settings():
+    return config.get('ai_filter', {}).get('streaming', {})
+
+def _streaming_request(request):
+    """Returns the request with streaming switched on, asking for the token usage in the last chunk if configured."""
+    streaming_request = dict(request, stream=True)
+    if _streaming_settings().get('include_usage', True):
+        streaming_request['stream_options'] = {'include_usage': True}
+    return streaming_request
+
+class _OutputCheck:
+    """Watches streamed Markdown for obviously broken output: echoed HTML, one line over and over, runaway length."""
+
+    def __init__(self, source_text):
+        settings = _streaming_settings()
+        self.check_after_chars = max(1, int(settings.get('check_after_chars', 400)))
+        self.max_html_tag_share = float(settings.get('max_html_tag_share', 0.2))
+        self.max_repeated_lines = max(2, int(settings.get('max_repeated_lines', 8)))
+        self.max_output_ratio = float(settings.get('max_output_ratio', 3.0))
+        self.max_output_chars = self.max_output_ratio * len(source_text)
+        self.length = 0
+        self.head = [] # Output up to check_after_chars, for the HTML check; None once checked
+        self.partial_line = ''
+        self.last_line = None
+        self.repeats = 0
+
+    def _check_head(self):
+        head = ''.join(self.head)
+        self.head = None
+        tag_chars = sum(len(tag) for tag in _HTML_TAG_PATTERN.findall(head))
+        if head and tag_chars > self.max_html_tag_share * len(head):
+            return f"the output is HTML ({tag_chars} of its first {len(head)} characters are tags), not Markdown"
+        return None
+
+    def _check_lines(self, lines):
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if line != self.last_line:
+                self.last_line, self.repeats = line, 1
+                continue
+            self.repeats += 1
+            if self.repeats >= self.max_repeated_lines:
+                return f"the line '{line[:60]}' repeats {self.repeats} times"
+        return None
+
+    def feed(self, text):
+        """Checks the next piece of output. Returns why the output is broken, or None."""
+        self.length += len(text)
+        if self.length > self.max_output_chars:
+            return f"the output grew past {self.max_output_ratio}x the length of the input"
+        if self.head is not None:
+            self.head.append(text)
+            if self.length >= self.check_after_chars:
+                reason = self._check_head()
+                if reason:
+                    return reason
+        *lines, self.partial_line = (self.partial_line + text).split('\n')
+        return self._check_lines(lines)
+
+    def finish(self):
+        """Checks what is left once the stream ended. Returns why the output is broken, or None."""
+        reason = self._check_head() if self.head is not None else None
+        return reason or self._check_lines([self.partial_line])
+
+class _StreamReader:
+    """Reads a streamed completion into a writable text file (the sink), checking the output and timing it."""
+
+    def __init__(self, sink, source_text, model, article_url):
+        self.sink = sink
+        self.source_text = source_text
+        self.model = model
+        self.article_url = article_url
+
+    def _start(self):
+        self.sink.seek(0) # A retried request writes its output again from the start
+        self.sink.truncate()
+        self.check = _OutputCheck(self.source_text)
+        self.started_at = time.monotonic()
+        self.first_token_at = None
+        self.usage = None
+
+    def _feed(self, chunk):
+        if getattr(chunk, 'usage', None):
+            self.usage = chunk.usage # Sent in the last chunk if stream_options.include_usage was set
+        text = chunk.choices[0].delta.content if chunk.choices else None
+        if not text:
+            return
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        self.sink.write(text)
+        self._abort_if_broken(self.check.feed(text))
+
+    def _abort_if_broken(self, reason):
+        if reason:
+            with _streaming_lock:
+                _streaming_stats['aborted'] += 1
+            raise StreamAbortedError(reason)
+
+    def _finish(self):
+        self._abort_if_broken(self.check.finish())
+        finished_at = time.monotonic()
+        self.sink.flush()
+        self.sink.seek(0)
+        content = self.sink.read()
+        first_token_at = self.first_token_at or finished_at
+        tokens = getattr(self.usage, 'completion_tokens', None) or estimate_tokens(content)
+        generation_seconds = finished_at - first_token_at
+        with _streaming_lock:
+            _streaming_stats['streamed'] += 1
+            _streaming_stats['first_token_seconds'] += first_token_at - self.started_at
+            _streaming_stats['tokens'] += tokens
+            _streaming_stats['generation_seconds'] += generation_seconds
+        tokens_per_second = f"{tokens / generation_seconds:.1f}" if generation_seconds > 0 else "n/a"
+        logger.info(f"Streamed {self.model} response for {self.article_url}: first token after {first_token_at - self.started_at:.2f}s, "
+                    f"{tokens} tokens at {tokens_per_second} tokens/s")
+        return _StreamedResponse(content, self.usage)
+
+    def read(self, open_stream):
+        """read_stream for _send_with_retries()."""
+        self._start()
+        stream = open_stream()
+        try:
+            for chunk in stream:
+                self._feed(chunk)
+            return self._finish()
+        finally:
+            stream.close() # Also drops the connection of an aborted response
+
+    async def aread(self, open_stream):
+        """read_stream for _asend_with_retries()."""
+        self._start()
+        stream = await open_stream()
+        try:
+            async for chunk in stream:
+                self._feed(chunk)
+            return self._finish()
+        finally:
+            await stream.close()
+
+def _create_streamed_completion(request, sink, source_text, article_url):
+    """Like _create_completion(), but streams the response into sink (a text file open for writing and reading)."""
+    cached_content = ai_cache.get(request)
+    if cached_content is not None:
+        sink.write(cached_content)
+        return cached_content
+    response = _send_with_retries(request, read_stream=_StreamReader(sink, source_text, request['model'], article_url).read)
+    ai_cache.put(request, response.content)
+    return response.content
+
+async def _acreate_streamed_completion(request, sink, source_text, article_url):
+    """Async variant of _create_streamed_completion(). Chunks are written to the sink on the event loop."""
+    cached_content = await asyncio.to_thread(ai_cache.get, request)
+    if cached_content is not None:
+        sink.write(cached_content)
+        return cached_content
+    response = await _asend_with_retries(request, read_stream=_StreamReader(sink, source_text, request['model'], article_url).aread)
+    await asyncio.to_thread(ai_cache.put, request, response.content)
+    return response.content
+
+def _spooled_sink():
+    """Returns a temporary text file that stays in memory up to streaming.spool_max_bytes and moves to disk beyond."""
+    return tempfile.SpooledTemporaryFile(max_size=int(_streaming_settings().get('spool_max_bytes', 1024 * 1024)), mode='w+', encoding='utf-8')
+
+def get_streaming_stats():
+    """Returns the number of streamed and aborted responses, the average time to first token and the tokens/sec."""
+    with _streaming_lock:
+        streamed = _streaming_stats['streamed']
+        return {
+            'streamed': streamed,
+            'aborted': _streaming_stats['aborted'],
+            'avg_first_token_seconds': _streaming_stats['first_token_seconds'] / streamed if streamed else None,
+            'tokens_per_second': _streaming_stats['tokens'] / _streaming_stats['generation_seconds'] if _streaming_stats['generation_seconds'] > 0 else None,
         }
-        if api_base_url:
-            client_params['base_url'] = api_base_url
-            logger.info(f"Using API Base URL: {api_base_url}")
 
-        client = openai.OpenAI(**client_params)
-        logger.info("OpenAI client initialized successfully.")
+# --- Prompt layout --- #
+# Every request starts with a system message holding the instructions and the settings they depend on (interests,
+# dislikes, English level, annotation language), followed by a short user message with the article. The system
+# message is built once per config hash, so its bytes are identical on every call and the provider's prompt cache
+# can reuse it; the cached prompt tokens the provider reports are counted below.
+
+_system_prompts = {} # (kind, variant, config hash) -> system message content
+_system_prompts_lock = threading.Lock()
+_prompt_cache_lock = threading.Lock()
+_prompt_cache_stats = {'requests': 0, 'prompt_tokens': 0, 'cached_tokens': 0}
+
+def _prompt_settings():
+    """Returns the config values the system messages are built from."""
+    ai_conf = config.get('ai_filter', {})
+    return {
+        'interests': ai_conf.get('interests', []),
+        'dislikes': ai_conf.get('dislikes', []),
+        'english_level': ai_conf.get('english_level', 'CEFR C1'),
+        'annotation_language': ai_conf.get('annotation_language') if ai_conf.get('enable_vocabulary_annotation', False) else None,
+        'confidence': _cascade_settings().get('enabled', False),
+    }
+
+def _system_message(kind, *variant):
+    """Returns the system message of a prompt kind (see _SYSTEM_PROMPT_BUILDERS), built once per config hash."""
+    settings = _prompt_settings()
+    config_hash = hashlib.sha256(json.dumps(settings, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+    key = (kind, variant, config_hash)
+    with _system_prompts_lock:
+        content = _system_prompts.get(key)
+        if content is None:
+            content = textwrap.dedent(_SYSTEM_PROMPT_BUILDERS[kind](settings, *variant)).strip()
+            _system_prompts[key] = content
+            logger.debug(f"Built {kind} system prompt for config {config_hash[:12]} (~{estimate_tokens(content)} tokens)")
+    return {"role": "system", "content": content}
+
+def _user_message(template, **values):
+    """Returns the per-article user message. The template is dedented before the values go in, so article text arrives unchanged."""
+    return {"role": "user", "content": textwrap.dedent(template).format(**values).strip()}
+
+def _record_prompt_cache_usage(usage, model):
+    """Counts the prompt tokens of a response and how many of them the provider served from its prompt cache."""
+    prompt_tokens = getattr(usage, 'prompt_tokens', None)
+    if not prompt_tokens:
+        return
+    cached_tokens = getattr(getattr(usage, 'prompt_tokens_details', None), 'cached_tokens', None) or 0
+    with _prompt_cache_lock:
+        _prompt_cache_stats['requests'] += 1
+        _prompt_cache_stats['prompt_tokens'] += prompt_tokens
+        _prompt_cache_stats['cached_tokens'] += cached_tokens
+    logger.debug(f"{model}: {cached_tokens} of {prompt_tokens} prompt tokens served from the provider's prompt cache")
+
+def get_prompt_cache_stats():
+    """Returns the numbers of responses with usage, their prompt tokens and the prompt tokens the provider had cached."""
+    with _prompt_cache_lock:
+        return dict(_prompt_cache_stats)
+
+def _is_context_length_error(e):
+    return isinstance(e, openai.APIError) and getattr(e, 'code', None) == 'context_length_exceeded'
+
+def _log_ai_error(e, task, article_url, model):
+    """Logs a failed AI request for the given task ('filtering', 'content filtering', ...)."""
+    if _is_context_length_error(e):
+        logger.error(f"AI {task} failed for {article_url} due to context length exceeded ({model}). Consider implementing smarter truncation or chunking in code.")
+    elif isinstance(e, openai.APIError):
+        logger.error(f"OpenAI API error during {task} for {article_url}: {e}. Status={getattr(e, 'status_code', 'N/A')}, Message={getattr(e, 'message', str(e))}")
+    else:
+        logger.error(f"Unexpected error during AI {task} for {article_url}: {e}", exc_info=True)
+
+def _parse_verdict(result_content, task, article_url):
+    """Parses a {"relevance", "quality_type"} JSON verdict. Returns the dict, or None if it is invalid."""
+    logger.debug(f"Received AI {task} response: {result_content}")
+    try:
+        result_json = json.loads(result_content)
+    except (TypeError, json.JSONDecodeError) as e:
+        logger.error(f"Failed to decode AI {task} JSON response for {article_url}: {e}. Response: {result_content}")
+        return None
+
+    # Basic validation of the returned JSON structure
+    if not isinstance(result_json, dict) or 'relevance' not in result_json or 'quality_type' not in result_json:
+        logger.error(f"AI {task} returned unexpected JSON format for {article_url}: {result_content}")
+        return None
+    return result_json
+
+# --- Model cascade (ai_filter.cascade in config.yaml) --- #
+# The filtering models answer first, with a confidence. Verdicts with low confidence, or close to the accept/reject
+# boundary without high confidence, are asked again of a stronger model, whose verdict replaces the first one.
+
+# Verdict labels from best to worst, to tell which values sit next to the accept/reject boundary
+RELEVANCE_SCALE = ('High', 'Medium', 'Low', 'None')
+QUALITY_SCALE = ('In-depth', 'Opinion', 'Overview', 'Shallow', 'Promotional', 'Low-Quality')
+
+_cascade_lock = threading.Lock()
+_cascade_stats = {'verdicts': 0, 'escalated': 0}
+
+def _cascade_settings():
+    return config.get('ai_filter', {}).get('cascade', {})
+
+def _confidence_instruction(per_article=False):
+    """Extra output instruction asking for a confidence when the cascade is enabled."""
+    if not _cascade_settings().get('enabled', False):
+        return ""
+    where = " in each article's object" if per_article else ""
+    return f'Also include a key "confidence"{where} with your confidence in the evaluation, from 0.0 (guessing) to 1.0 (certain).'
+
+def _is_near_boundary(value, scale, accepted):
+    """True if value is next to a label on the other side of the accept/reject boundary."""
+    if value not in scale:
+        return False
+    index = scale.index(value)
+    neighbors = scale[max(0, index - 1):index] + scale[index + 1:index + 2]
+    return any((neighbor in accepted) != (value in accepted) for neighbor in neighbors)
+
+def _escalation_reason(verdict, quality_setting):
+    """Returns why a verdict should be asked of the stronger model, or None to keep it.
+
+    quality_setting is the config key with the accepted quality types ('accepted_quality' for stage 1,
+    'accepted_content_quality' for stage 2).
+    """
+    cascade_conf = _cascade_settings()
+    ai_conf = config.get('ai_filter', {})
+    try:
+        confidence = float(verdict.get('confidence'))
+    except (TypeError, ValueError):
+        confidence = 0.0 # No usable confidence: treat as uncertain
+    if confidence < float(cascade_conf.get('min_confidence', 0.7)):
+        return f"confidence {confidence:.2f}"
+
+    accepted_relevance = ai_conf.get('accepted_relevance', ['High', 'Medium'])
+    accepted_quality = ai_conf.get(quality_setting, ai_conf.get('accepted_quality', ['In-depth', 'Opinion', 'Overview']))
+    relevance, quality_type = verdict.get('relevance'), verdict.get('quality_type')
+    # A one-step change of either label flips the decision only if the other label is accepted
+    near_boundary = ((_is_near_boundary(relevance, RELEVANCE_SCALE, accepted_relevance) and quality_type in accepted_quality)
+                     or (_is_near_boundary(quality_type, QUALITY_SCALE, accepted_quality) and relevance in accepted_relevance))
+    if near_boundary and confidence < float(cascade_conf.get('boundary_min_confidence', 0.9)):
+        return f"near the accept/reject boundary ({relevance}/{quality_type}) with confidence {confidence:.2f}"
+    return None
+
+def _plan_escalation(verdict, quality_setting, model_setting, task, article_url):
+    """Returns the stronger model to re-ask for this verdict, or None if the verdict stands."""
+    if verdict is None or not _cascade_settings().get('enabled', False):
+        return None
+    reason = _escalation_reason(verdict, quality_setting)
+    with _cascade_lock:
+        _cascade_stats['verdicts'] += 1
+        if reason:
+            _cascade_stats['escalated'] += 1
+    if not reason:
+        return None
+    cascade_conf = _cascade_settings()
+    model = cascade_conf.get(model_setting) or cascade_conf.get('escalation_model')
+    if not model:
+        return None
+    logger.info(f"Escalating AI {task} verdict for {article_url} to {model}: {reason}")
+    return model
+
+def _escalate_verdict(verdict, build_request, quality_setting, model_setting, task, article_url):
+    """Runs the cascade for a verdict of the fast model. build_request(model) builds the request for the strong model.
+
+    Returns the strong model's verdict, or the original one if no escalation is needed or it fails.
+    """
+    model = _plan_escalation(verdict, quality_setting, model_setting, task, article_url)
+    if model is None:
+        return verdict
+    request = build_request(model)
+    try:
+        escalated = _create_completion(request, parse=lambda content: _parse_verdict(content, task, article_url))
+    except Exception as e:
+        _log_ai_error(e, task, article_url, model)
+        escalated = None
+    return escalated or verdict
+
+async def _aescalate_verdict(verdict, build_request, quality_setting, model_setting, task, article_url):
+    """Async variant of _escalate_verdict()."""
+    model = _plan_escalation(verdict, quality_setting, model_setting, task, article_url)
+    if model is None:
+        return verdict
+    request = build_request(model)
+    try:
+        escalated = await _acreate_completion(request, parse=lambda content: _parse_verdict(content, task, article_url))
     except Exception as e:
-        logger.error(f"Failed to initialize OpenAI client: {e}")
-        client = None
-else:
-    logger.warning("OpenAI API key not found. AI processing features will be disabled.")
-    client = None
+        _log_ai_error(e, task, article_url, model)
+        escalated = None
+    return escalated or verdict
+
+def get_cascade_stats():
+    """Returns the number of filter verdicts checked by the cascade and how many were escalated in this run."""
+    with _cascade_lock:
+        return dict(_cascade_stats)
+
+def _build_filter_request(article_data, model=None):
+    """Builds the stage 1 (title/summary) chat completion request. model overrides filtering_model."""
+    ai_conf = config.get('ai_filter', {})
+    interests = ai_conf.get('interests', [])
+    model = model or ai_conf.get('filtering_model', 'gpt-3.5-turbo')
+
+    if not interests:
+        logger.warning("AI filtering interests not defined in config. Filtering may be ineffective.")
+
+    article = _user_message("""
+    Title: "{title}"
+    Summary: "{summary}"
+    """, title=article_data['title'], summary=article_data['summary'][:1500]) # Limit summary length
+
+    return {
+        'model': model,
+        'messages': [_system_message('filter'), article],
+        'response_format': {"type": "json_object"},
+        'temperature': 0.2 # Lower temperature for more deterministic classification
+    }
+
+def _filter_system_prompt(settings):
+    return f"""
+    Analyze the article given below based ONLY on its title and summary. Assess its relevance to my interests and rigorously evaluate its potential quality and depth.
+
+    My interests are: {settings['interests']}
+    I want to filter out articles that are primarily about: {settings['dislikes']}, OR articles that appear superficial, promotional, clickbaity, or lack substantial content based on this initial information.
+
+    Evaluate the following:
+    1. Relevance: Is the topic highly relevant to my interests? (Answer: High / Medium / Low / None)
+    2. Quality/Type: Based ONLY on the title and summary, estimate the **likely depth and quality**. Does it seem like:
+       - In-depth: Likely contains deep analysis, original research, or rigorous technical detail.
+       - Opinion: Likely a well-reasoned, potentially insightful opinion piece.
+       - Overview: Likely a general summary, possibly lacking depth.
+       - Shallow: Likely superficial, a listicle without substance, generic advice, or philosophical platitudes.
+       - Promotional: Likely marketing, sales-oriented, or primarily promoting a product/service.
+       - Low-Quality: Likely clickbait, poorly written, or lacking credible information.
+       (Answer: In-depth / Opinion / Overview / Shallow / Promotional / Low-Quality)
+
+    Be critical in your quality assessment. Prioritize potential depth and substance. Err on the side of caution; if it looks shallow or promotional, classify it as such.
+
+    Output your evaluation strictly as a JSON object with keys "relevance" and "quality_type".
+    Example: {{"relevance": "High", "quality_type": "In-depth"}}
+    {_confidence_instruction()}
+    """
 
 def filter_article_with_ai(article_data):
     """Filters an article based on title and summary using AI."""
-    if not client:
+    if not _client_pool:
         logger.error("OpenAI client not initialized. Cannot perform AI filtering.")
         return None
 
+    request = _build_filter_request(article_data)
+    logger.debug(f"Sending filtering request to AI for article: {article_data['link']}")
+    try:
+        verdict = _create_completion(request, parse=lambda content: _parse_verdict(content, 'filtering', article_data['link']))
+    except Exception as e:
+        _log_ai_error(e, 'filtering', article_data['link'], request['model'])
+        return None # Return None on failure
+    return _escalate_stage1(verdict, article_data)
+
+def _escalate_stage1(verdict, article_data):
+    return _escalate_verdict(verdict, lambda model: _build_filter_request(article_data, model),
+                             'accepted_quality', 'escalation_model', 'filtering', article_data['link'])
+
+async def _aescalate_stage1(verdict, article_data):
+    return await _aescalate_verdict(verdict, lambda model: _build_filter_request(article_data, model),
+                                    'accepted_quality', 'escalation_model', 'filtering', article_data['link'])
+
+async def afilter_article_with_ai(article_data):
+    """Async variant of filter_article_with_ai()."""
+    if not _client_pool:
+        logger.error("OpenAI client not initialized. Cannot perform AI filtering.")
+        return None
+
+    request = _build_filter_request(article_data)
+    logger.debug(f"Sending filtering request to AI for article: {article_data['link']}")
+    try:
+        verdict = await _acreate_completion(request, parse=lambda content: _parse_verdict(content, 'filtering', article_data['link']))
+    except Exception as e:
+        _log_ai_error(e, 'filtering', article_data['link'], request['model'])
+        return None
+    return await _aescalate_stage1(verdict, article_data)
+
+def _stage1_batch_settings():
+    """Returns (batch_size, max_input_tokens) for batched stage 1 filtering. A batch size of 1 disables batching."""
+    ai_conf = config.get('ai_filter', {})
+    return max(1, int(ai_conf.get('stage1_batch_size', 1))), int(ai_conf.get('stage1_batch_max_tokens', 8000))
+
+def _batch_item_text(position, article_data):
+    """Formats one article of a batched stage 1 prompt."""
+    return f"""
+    [Article id={position}]
+    Title: "{article_data['title']}"
+    Summary: "{article_data['summary'][:1500]}"
+    """
+
+def _plan_stage1_batches(article_list):
+    """Splits articles into batches of at most batch_size items and max_input_tokens estimated prompt tokens.
+
+    Returns lists of indexes into article_list.
+    """
+    batch_size, max_tokens = _stage1_batch_settings()
+    batches, current, current_tokens = [], [], 0
+    for index, article_data in enumerate(article_list):
+        item_tokens = estimate_tokens(_batch_item_text(len(current), article_data))
+        if current and (len(current) >= batch_size or current_tokens + item_tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += item_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def _build_batch_filter_request(articles):
+    """Builds one stage 1 request classifying several articles. Article ids are their positions in `articles`."""
     ai_conf = config.get('ai_filter', {})
     interests = ai_conf.get('interests', [])
-    dislikes = ai_conf.get('dislikes', [])
     model = ai_conf.get('filtering_model', 'gpt-3.5-turbo')
 
     if not interests:
         logger.warning("AI filtering interests not defined in config. Filtering may be ineffective.")
 
-    prompt = f"""
-    Analyze the following article based ONLY on its title and summary. Assess its relevance to my interests and rigorously evaluate its potential quality and depth.
+    items = "\n\n".join(textwrap.dedent(_batch_item_text(position, article_data)).strip() for position, article_data in enumerate(articles))
+    articles_text = _user_message("""
+    {count} articles:
 
-    My interests are: {interests}
-    I want to filter out articles that are primarily about: {dislikes}, OR articles that appear superficial, promotional, clickbaity, or lack substantial content based on this initial information.
+    {items}
+    """, count=len(articles), items=items)
 
-    Title: "{article_data['title']}"
-    Summary: "{article_data['summary'][:1500]}" # Limit summary length
+    return {
+        'model': model,
+        'messages': [_system_message('batch_filter'), articles_text],
+        'response_format': {"type": "json_object"},
+        'temperature': 0.2 # Lower temperature for more deterministic classification
+    }
 
-    Evaluate the following:
+def _batch_filter_system_prompt(settings):
+    return f"""
+    Analyze each of the articles given below based ONLY on its title and summary. Assess its relevance to my interests and rigorously evaluate its potential quality and depth. Judge every article on its own.
+
+    My interests are: {settings['interests']}
+    I want to filter out articles that are primarily about: {settings['dislikes']}, OR articles that appear superficial, promotional, clickbaity, or lack substantial content based on this initial information.
+
+    Evaluate the following for every article:
     1. Relevance: Is the topic highly relevant to my interests? (Answer: High / Medium / Low / None)
     2. Quality/Type: Based ONLY on the title and summary, estimate the **likely depth and quality**. Does it seem like:
        - In-depth: Likely contains deep analysis, original research, or rigorous technical detail.
@@ -89,52 +740,132 @@ def filter_article_with_ai(article_data):
 
     Be critical in your quality assessment. Prioritize potential depth and substance. Err on the side of caution; if it looks shallow or promotional, classify it as such.
 
-    Output your evaluation strictly as a JSON object with keys "relevance" and "quality_type".
-    Example: {{"relevance": "High", "quality_type": "In-depth"}}
+    Output your evaluation strictly as a JSON object with a key "results" holding one object per article, with keys "id", "relevance" and "quality_type".
+    Example: {{"results": [{{"id": 0, "relevance": "High", "quality_type": "In-depth"}}, {{"id": 1, "relevance": "Low", "quality_type": "Shallow"}}]}}
+    {_confidence_instruction(per_article=True)}
     """
 
-    logger.debug(f"Sending filtering request to AI for article: {article_data['link']}")
+def _parse_batch_verdicts(result_content, batch_size):
+    """Parses a batched stage 1 response. Returns {id: verdict} for the valid items only."""
+    logger.debug(f"Received AI batch filtering response: {result_content}")
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"},
-            temperature=0.2 # Lower temperature for more deterministic classification
-        )
-        result_content = response.choices[0].message.content
-        logger.debug(f"Received AI filtering response: {result_content}")
         result_json = json.loads(result_content)
+    except (TypeError, json.JSONDecodeError) as e:
+        logger.error(f"Failed to decode AI batch filtering JSON response: {e}. Response: {result_content}")
+        return {}
+
+    items = result_json.get('results') if isinstance(result_json, dict) else result_json
+    if not isinstance(items, list):
+        logger.error(f"AI batch filtering returned unexpected JSON format: {result_content}")
+        return {}
+
+    verdicts = {}
+    for item in items:
+        if not isinstance(item, dict) or 'relevance' not in item or 'quality_type' not in item:
+            continue
+        try:
+            item_id = int(item.get('id'))
+        except (TypeError, ValueError):
+            continue
+        if 0 <= item_id < batch_size and item_id not in verdicts:
+            verdicts[item_id] = {key: item[key] for key in ('relevance', 'quality_type', 'confidence') if key in item}
+    return verdicts
+
+def _batch_description(articles):
+    return f"batch of {len(articles)} articles ({articles[0]['link']} ...)"
+
+def filter_articles_with_ai_batch(article_list):
+    """Filters several articles based on title and summary, packing them into as few AI calls as configured.
+
+    Returns a list of results in the order of article_list (None where filtering failed).
+    Articles missing from a batch answer are retried individually with filter_article_with_ai().
+    """
+    results = [None] * len(article_list)
+    if not _client_pool:
+        logger.error("OpenAI client not initialized. Cannot perform AI filtering.")
+        return results
 
-        # Basic validation of the returned JSON structure
-        if not isinstance(result_json, dict) or 'relevance' not in result_json or 'quality_type' not in result_json:
-             logger.error(f"AI filtering returned unexpected JSON format for {article_data['link']}: {result_content}")
-             return None
+    for batch in _plan_stage1_batches(article_list):
+        articles = [article_list[index] for index in batch]
+        if len(articles) == 1:
+            results[batch[0]] = filter_article_with_ai(articles[0])
+            continue
 
-        return result_json
+        request = _build_batch_filter_request(articles)
+        logger.debug(f"Sending batched filtering request to AI for {len(articles)} articles.")
+        try:
+            # An answer without a single usable verdict is not cached
+            verdicts = _create_completion(request, parse=lambda content: _parse_batch_verdicts(content, len(articles)) or None) or {}
+        except Exception as e:
+            _log_ai_error(e, 'batch filtering', _batch_description(articles), request['model'])
+            verdicts = {}
 
-    except openai.APIError as e:
-         logger.error(f"OpenAI API error during filtering for {article_data['link']}: {e}. Status={e.status_code}, Message={e.message}")
-         # Implement retry logic if needed, e.g., for rate limits or temporary server errors
-         # time.sleep(5) # Simple backoff
-         # return filter_article_with_ai(article_data) # Beware of recursion depth
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to decode AI filtering JSON response for {article_data['link']}: {e}. Response: {result_content}")
+        if len(verdicts) < len(articles):
+            logger.warning(f"AI batch filtering answered {len(verdicts)} of {len(articles)} articles. Retrying the rest individually.")
+        for position, index in enumerate(batch):
+            if position in verdicts:
+                results[index] = _escalate_stage1(verdicts[position], articles[position])
+            else:
+                results[index] = filter_article_with_ai(articles[position])
+    return results
+
+async def _afilter_stage1_batch(articles):
+    """Runs one batch of afilter_articles_with_ai_batch(). Returns the results in the order of articles."""
+    if len(articles) == 1:
+        return [await afilter_article_with_ai(articles[0])]
+
+    request = _build_batch_filter_request(articles)
+    logger.debug(f"Sending batched filtering request to AI for {len(articles)} articles.")
+    try:
+        verdicts = await _acreate_completion(request, parse=lambda content: _parse_batch_verdicts(content, len(articles)) or None) or {}
     except Exception as e:
-        logger.error(f"Unexpected error during AI filtering for {article_data['link']}: {e}", exc_info=True)
+        _log_ai_error(e, 'batch filtering', _batch_description(articles), request['model'])
+        verdicts = {}
 
-    return None # Return None on failure
+    if len(verdicts) < len(articles):
+        logger.warning(f"AI batch filtering answered {len(verdicts)} of {len(articles)} articles. Retrying the rest individually.")
+    async def complete(position):
+        if position in verdicts:
+            return await _aescalate_stage1(verdicts[position], articles[position])
+        return await afilter_article_with_ai(articles[position])
 
-def filter_article_content_with_ai(full_html_content, article_url):
-    """Filters an article based on its full HTML content using AI."""
-    if not client:
-        logger.error("OpenAI client not initialized. Cannot perform AI content filtering.")
-        return None
+    return list(await asyncio.gather(*(complete(position) for position in range(len(articles)))))
+
+async def afilter_articles_with_ai_batch(article_list, semaphore=None):
+    """Async variant of filter_articles_with_ai_batch(). Batches run concurrently, bounded by the optional semaphore."""
+    if not _client_pool:
+        logger.error("OpenAI client not initialized. Cannot perform AI filtering.")
+        return [None] * len(article_list)
 
+    async def run_batch(batch):
+        articles = [article_list[index] for index in batch]
+        if semaphore is None:
+            return await _afilter_stage1_batch(articles)
+        async with semaphore:
+            return await _afilter_stage1_batch(articles)
+
+    batches = _plan_stage1_batches(article_list)
+    results = [None] * len(article_list)
+    for batch, batch_results in zip(batches, await asyncio.gather(*(run_batch(batch) for batch in batches))):
+        for index, result in zip(batch, batch_results):
+            results[index] = result
+    return results
+
+def _stage2_token_budget(model):
+    """Returns the token budget for the article content in a stage 2 request to `model`."""
+    ai_conf = config.get('ai_filter', {})
+    budgets = ai_conf.get('stage2_model_max_tokens') or {}
+    return max(1, int(budgets.get(model) or ai_conf.get('stage2_max_tokens', 4000)))
+
+def _build_content_filter_request(full_html_content, article_url, model=None):
+    """Builds the stage 2 (full content) chat completion request. Returns None if the content is too short.
+
+    model overrides content_filtering_model.
+    """
     ai_conf = config.get('ai_filter', {})
     interests = ai_conf.get('interests', [])
-    dislikes = ai_conf.get('dislikes', [])
     # Use the same filtering model as the first pass, unless a specific one is defined
-    model = ai_conf.get('content_filtering_model', ai_conf.get('filtering_model', 'gpt-3.5-turbo'))
+    model = model or ai_conf.get('content_filtering_model', ai_conf.get('filtering_model', 'gpt-3.5-turbo'))
 
     if not interests:
         logger.warning("AI filtering interests not defined in config. Content filtering may be ineffective.")
@@ -145,23 +876,34 @@ def filter_article_content_with_ai(full_html_content, article_url):
         # Return a neutral/default result or None? Let's return None to indicate failure.
         return None
 
-    # Consider potential token limits - maybe truncate the input?
-    # For now, send the whole HTML, but be aware of potential context length errors.
-    # A simple truncation might be: max_len = 16000 # Adjust based on model limits
-    # truncated_content = full_html_content[:max_len]
-    # if len(full_html_content) > max_len:
-    #     logger.warning(f"Content for {article_url} truncated to {max_len} chars for AI content filtering.")
-
-    prompt = f"""
-    Critically analyze the following article based on its **full HTML content**. Focus on the main substance, ignoring boilerplate/ads.
-    My interests are: {interests}
-    I want to filter out articles that are primarily about: {dislikes}, AND articles that lack **depth, originality, or rigorous analysis**, even if related to my interests.
+    # Long articles are sampled (beginning, middle sections, conclusion) down to the model's token budget
+    token_budget = _stage2_token_budget(model)
+    middle_sections = ai_conf.get('stage2_middle_sections', 3)
+    content, sampled = sample_html_blocks(full_html_content, token_budget, middle_sections)
+    if sampled:
+        logger.debug(f"Content for {article_url} sampled to ~{token_budget} tokens for AI content filtering.")
 
+    article = _user_message("""
     Article HTML Content (from {article_url}):
     ```html
-    {full_html_content[:16000]} 
+    {content}
     ```
-    { "... (content truncated)" if len(full_html_content) > 16000 else "" }
+    {sampled_note}
+    """, article_url=article_url, content=content,
+         sampled_note="(Long article: only the beginning, sections from the middle and the conclusion are shown; [...] marks omitted parts.)" if sampled else "")
+
+    return {
+        'model': model,
+        'messages': [_system_message('content_filter'), article],
+        'response_format': {"type": "json_object"},
+        'temperature': 0.2 # Low temperature for consistent classification
+    }
+
+def _content_filter_system_prompt(settings):
+    return f"""
+    Critically analyze the article given below based on its **full HTML content**. Focus on the main substance, ignoring boilerplate/ads.
+    My interests are: {settings['interests']}
+    I want to filter out articles that are primarily about: {settings['dislikes']}, AND articles that lack **depth, originality, or rigorous analysis**, even if related to my interests.
 
     Evaluate the following based on the **actual substance, depth, and originality demonstrated in the content**:
     1. Relevance: Is the core topic highly relevant to my interests? (Answer: High / Medium / Low / None)
@@ -178,59 +920,101 @@ def filter_article_content_with_ai(full_html_content, article_url):
 
     Output your evaluation strictly as a JSON object with keys "relevance" and "quality_type".
     Example: {{"relevance": "Medium", "quality_type": "Opinion"}}
+    {_confidence_instruction()}
     """
 
+def filter_article_content_with_ai(full_html_content, article_url):
+    """Filters an article based on its full HTML content using AI."""
+    if not _client_pool:
+        logger.error("OpenAI client not initialized. Cannot perform AI content filtering.")
+        return None
+
+    request = _build_content_filter_request(full_html_content, article_url)
+    if request is None:
+        return None
     logger.debug(f"Sending content filtering request to AI for article: {article_url}")
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"},
-            temperature=0.2 # Low temperature for consistent classification
-        )
-        result_content = response.choices[0].message.content
-        logger.debug(f"Received AI content filtering response: {result_content}")
-        result_json = json.loads(result_content)
+        verdict = _create_completion(request, parse=lambda content: _parse_verdict(content, 'content filtering', article_url))
+    except Exception as e:
+        _log_ai_error(e, 'content filtering', article_url, request['model'])
+        return None # Indicate failure
+    return _escalate_verdict(verdict,
+                             lambda model: _build_content_filter_request(full_html_content, article_url, model),
+                             'accepted_content_quality', 'content_escalation_model', 'content filtering', article_url)
 
-        # Basic validation
-        if not isinstance(result_json, dict) or 'relevance' not in result_json or 'quality_type' not in result_json:
-            logger.error(f"AI content filtering returned unexpected JSON format for {article_url}: {result_content}")
-            return None
+async def afilter_article_content_with_ai(full_html_content, article_url):
+    """Async variant of filter_article_content_with_ai()."""
+    if not _client_pool:
+        logger.error("OpenAI client not initialized. Cannot perform AI content filtering.")
+        return None
 
-        return result_json
-
-    except openai.APIError as e:
-        # Handle context length error specifically if possible
-        if hasattr(e, 'code') and e.code == 'context_length_exceeded':
-             logger.error(f"AI content filtering failed for {article_url} due to context length exceeded ({model}). Consider implementing smarter truncation or chunking in code.")
-             # Return a specific error or None?
-             return None # Indicate failure
-        else:
-            logger.error(f"OpenAI API error during content filtering for {article_url}: {e}. Status={getattr(e, 'status_code', 'N/A')}, Message={getattr(e, 'message', str(e))}")
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to decode AI content filtering JSON response for {article_url}: {e}. Response: {result_content}")
+    request = _build_content_filter_request(full_html_content, article_url)
+    if request is None:
+        return None
+    logger.debug(f"Sending content filtering request to AI for article: {article_url}")
+    try:
+        verdict = await _acreate_completion(request, parse=lambda content: _parse_verdict(content, 'content filtering', article_url))
     except Exception as e:
-        logger.error(f"Unexpected error during AI content filtering for {article_url}: {e}", exc_info=True)
-
-    return None # Indicate failure
+        _log_ai_error(e, 'content filtering', article_url, request['model'])
+        return None
+    return await _aescalate_verdict(verdict,
+                                    lambda model: _build_content_filter_request(full_html_content, article_url, model),
+                                    'accepted_content_quality', 'content_escalation_model', 'content filtering', article_url)
 
-def process_content_with_ai(full_text, article_url):
-    """Uses AI to convert text to Markdown and add vocabulary annotations."""
-    if not client:
-        logger.error("OpenAI client not initialized. Cannot perform AI processing.")
-        return "[Error: AI client not initialized]"
+def _processing_model(full_text):
+    """Picks the processing model by the length of the whole article.
 
+    ai_filter.processing_models lists {max_tokens, model} tiers; the first tier the article fits in is used.
+    Articles longer than every tier (or without tiers configured) use processing_model. The model is picked
+    once per article, so all chunks of a long article go to the same model.
+    """
     ai_conf = config.get('ai_filter', {})
-    english_level = ai_conf.get('english_level', 'CEFR C1')
-    model = ai_conf.get('processing_model', 'gpt-4-turbo') # Use a model suitable for long text
-    # Read new config options
-    enable_annotation = ai_conf.get('enable_vocabulary_annotation', False) # Default to False if not set
-    annotation_language = ai_conf.get('annotation_language', None)
+    text_tokens = estimate_tokens(full_text)
+    for tier in ai_conf.get('processing_models') or []:
+        if tier.get('model') and text_tokens <= int(tier.get('max_tokens') or 0):
+            return tier['model']
+    return ai_conf.get('processing_model', 'gpt-4-turbo')
 
-    # Simple check if text is empty or too short
-    if not full_text or len(full_text) < 100:
-        logger.warning(f"Content for {article_url} is too short or empty. Skipping AI processing.")
-        return full_text # Return original text if too short
+def _build_processing_request(full_text, article_url, model, part=None):
+    """Builds the Markdown conversion/annotation chat completion request for model (see _processing_model).
+
+    part is (index, total) when full_text is one chunk of a longer article.
+    """
+    annotation_language = _prompt_settings()['annotation_language']
+
+    prompt_part_instructions = ""
+    if part:
+        prompt_part_instructions = textwrap.dedent(f"""
+        Note: The HTML below is part {part[0] + 1} of {part[1]} of a longer article; the parts are processed separately and joined afterwards.
+        Convert only this part. Do not add a title, introduction, summary or closing remarks, and do not mention that the text is partial.
+        """).strip()
+
+    # Only the article (and which part of it) follows the static instructions
+    article = _user_message("""
+    {part_instructions}
+
+    Article HTML (from {article_url}):
+    ---
+    {full_text}
+    ---
+    """, part_instructions=prompt_part_instructions, article_url=article_url, full_text=full_text)
+    if part:
+         logger.debug(f"AI processing for {article_url}: part {part[0] + 1}/{part[1]} requested.")
+    elif annotation_language:
+         logger.info(f"AI processing for {article_url}: Markdown conversion and {annotation_language} annotations requested.")
+    else:
+         logger.info(f"AI processing for {article_url}: Markdown conversion ONLY requested.")
+
+    return {
+        'model': model,
+        'messages': [_system_message('processing'), article],
+        # max_tokens=... # Optional: can limit output tokens, but might truncate content
+        'temperature': 0.3 # Keep creativity low for formatting/annotation task
+    }
+
+def _processing_system_prompt(settings):
+    english_level = settings['english_level']
+    annotation_language = settings['annotation_language']
 
     # --- Build the prompt dynamically ---
     prompt_base = f"""
@@ -245,7 +1029,7 @@ def process_content_with_ai(full_text, article_url):
     """
 
     prompt_annotation_instructions = "" # Initialize as empty
-    if enable_annotation and annotation_language:
+    if annotation_language:
         prompt_annotation_instructions = f"""
 
     **Additional Task: Vocabulary Annotation**
@@ -265,65 +1049,459 @@ def process_content_with_ai(full_text, article_url):
         )
 
     # Combine prompts
-    prompt = f"""{prompt_base}{prompt_annotation_instructions}
+    return f"""{prompt_base}{prompt_annotation_instructions}"""
 
-    Article HTML (from {article_url}):
+def _processing_error_result(e, article_url, model):
+    """Logs a failed processing request and returns the error marker string main.py checks for."""
+    if _is_context_length_error(e):
+        logger.error(f"AI processing failed for {article_url} due to context length exceeding model limit ({model}), even in chunks.")
+        return f"[Error: Article too long for model '{model}'.]"
+    _log_ai_error(e, 'processing', article_url, model)
+    return f"[Error: AI processing failed for {article_url}. See logs.]"
+
+def _chunk_settings():
+    """Returns (max_tokens_per_chunk, max_parallel_chunks) for processing long articles."""
+    ai_conf = config.get('ai_filter', {})
+    return max(500, int(ai_conf.get('processing_chunk_tokens', 12000))), max(1, int(ai_conf.get('processing_max_parallel_chunks', 4)))
+
+def _plan_chunks(full_text, article_url, after_context_error=False):
+    """Splits an article for chunked processing. Returns None if it fits in a single request.
+
+    After a context length error the article is split even if its estimate fits the chunk budget.
+    """
+    chunk_tokens, _ = _chunk_settings()
+    text_tokens = estimate_tokens(full_text)
+    if after_context_error:
+        chunk_tokens = min(chunk_tokens, max(500, text_tokens // 2))
+    elif text_tokens <= chunk_tokens:
+        return None
+    chunks = split_html_blocks(full_text, chunk_tokens)
+    if len(chunks) < 2:
+        return None
+    logger.info(f"Processing {article_url} in {len(chunks)} chunks (~{text_tokens} tokens, up to {chunk_tokens} tokens per chunk).")
+    return chunks
+
+def _process_chunk(chunk, index, total, article_url, model):
+    """Processes one chunk. Returns its Markdown, or raises the request error."""
+    return _create_completion(_build_processing_request(chunk, article_url, model, part=(index, total)))
+
+def _process_in_chunks(chunks, article_url, model):
+    """Processes the chunks concurrently and joins their Markdown in document order."""
+    _, max_parallel = _chunk_settings()
+    try:
+        with ThreadPoolExecutor(max_workers=min(max_parallel, len(chunks)), thread_name_prefix="chunk") as executor:
+            # map() yields results in submission order, so the parts are reassembled in order
+            parts = list(executor.map(lambda item: _process_chunk(item[1], item[0], len(chunks), article_url, model), enumerate(chunks)))
+    except Exception as e:
+        return _processing_error_result(e, article_url, model)
+    logger.info(f"AI content processing successful for article: {article_url} ({len(chunks)} chunks)")
+    return "\n\n".join(part.strip() for part in parts)
+
+async def _aprocess_in_chunks(chunks, article_url, model):
+    """Async variant of _process_in_chunks()."""
+    _, max_parallel = _chunk_settings()
+    semaphore = asyncio.Semaphore(max_parallel)
+
+    async def process_chunk(index, chunk):
+        async with semaphore:
+            return await _acreate_completion(_build_processing_request(chunk, article_url, model, part=(index, len(chunks))))
+
+    try:
+        parts = await asyncio.gather(*(process_chunk(index, chunk) for index, chunk in enumerate(chunks)))
+    except Exception as e:
+        return _processing_error_result(e, article_url, model)
+    logger.info(f"AI content processing successful for article: {article_url} ({len(chunks)} chunks)")
+    return "\n\n".join(part.strip() for part in parts)
+
+def _conversion_mode():
+    """Returns 'local' (converter in markdown_converter, AI only for annotations) or 'ai' (the model writes the Markdown)."""
+    mode = str(config.get('ai_filter', {}).get('markdown_conversion', 'ai')).lower()
+    return mode if mode in ('local', 'ai') else 'ai'
+
+def _annotation_settings():
+    """Returns (english_level, annotation_language), with annotation_language None if annotation is disabled."""
+    ai_conf = config.get('ai_filter', {})
+    annotation_language = ai_conf.get('annotation_language') if ai_conf.get('enable_vocabulary_annotation', False) else None
+    return ai_conf.get('english_level', 'CEFR C1'), annotation_language
+
+def _annotation_model(full_text):
+    """Returns the model for an article's term lists: annotation_model, or the processing model for the article."""
+    return config.get('ai_filter', {}).get('annotation_model') or _processing_model(full_text)
+
+def _build_annotation_request(plain_text, article_url, english_level, annotation_language, model, known_terms=()):
+    """Builds a request asking only for the challenging terms of a text and their translations.
+
+    known_terms are glossary terms found in the text; the model is told to skip them.
+    """
+    article = _user_message("""
+    {known_terms_note}
+
+    Article text (from {article_url}):
     ---
-    {full_text}
+    {plain_text}
     ---
+    """, article_url=article_url, plain_text=plain_text,
+         known_terms_note=f"These terms are already in the reader's glossary; do NOT list them: {', '.join(sorted(known_terms))}" if known_terms else "")
+    return {
+        'model': model,
+        'messages': [_system_message('annotation', english_level, annotation_language), article],
+        'response_format': {"type": "json_object"},
+        'temperature': 0.3
+    }
+
+def _annotation_system_prompt(settings, english_level, annotation_language):
+    return f"""
+    You are helping a reader whose English level is approximately {english_level} to read the article text given below.
+
+    Instructions:
+    A. Identify specific words or short technical phrases (1-4 words) in the text that might be challenging for a {english_level} learner reading a technical article. Examples: 'idempotent', 'concurrency control', 'distributed ledger', 'gradient descent'.
+    B. Give a concise translation of each one into **{annotation_language}** that fits its meaning in this text.
+    C. Do NOT include common English words (e.g., 'the', 'is', 'and', 'but', 'article', 'content', 'system'). Focus on domain-specific terms, advanced vocabulary, or idioms that hinder understanding for the target level.
+    D. Spell each term exactly as it appears in the text. List each term only once, and skip terms the reader's glossary already has if they are listed.
+
+    Output strictly a JSON object with a key "terms" holding a list of objects with keys "term" and "translation".
+    Example: {{"terms": [{{"term": "idempotent", "translation": "幂等的"}}, {{"term": "concurrency control", "translation": "并发控制"}}]}}
     """
-    if enable_annotation and annotation_language:
-         logger.info(f"AI processing for {article_url}: Markdown conversion and {annotation_language} annotations requested.")
+
+# Builders of the static system messages, by prompt kind (see _system_message)
+_SYSTEM_PROMPT_BUILDERS = {
+    'filter': _filter_system_prompt,
+    'batch_filter': _batch_filter_system_prompt,
+    'content_filter': _content_filter_system_prompt,
+    'processing': _processing_system_prompt,
+    'annotation': _annotation_system_prompt,
+}
+
+def _parse_annotations(result_content, article_url):
+    """Parses an annotation response into a {term: translation} dict. Returns None if it is invalid."""
+    try:
+        result_json = json.loads(result_content)
+    except (TypeError, json.JSONDecodeError) as e:
+        logger.error(f"Failed to decode AI annotation JSON response for {article_url}: {e}. Response: {result_content}")
+        return None
+    items = result_json.get('terms') if isinstance(result_json, dict) else None
+    if not isinstance(items, list):
+        logger.error(f"AI annotation returned unexpected JSON format for {article_url}: {result_content}")
+        return None
+    return {item['term']: item['translation'] for item in items
+            if isinstance(item, dict) and isinstance(item.get('term'), str) and isinstance(item.get('translation'), str)}
+
+def _annotation_pieces(full_text, english_level, annotation_language):
+    """Returns the article's plain text in pieces that each fit the chunk budget, as (text, known glossary terms) pairs."""
+    chunk_tokens, _ = _chunk_settings()
+    if estimate_tokens(full_text) <= chunk_tokens:
+        texts = [clean_html(full_text)]
     else:
-         logger.info(f"AI processing for {article_url}: Markdown conversion ONLY requested.")
+        texts = [text for text in (clean_html(chunk) for chunk in split_html_blocks(full_text, chunk_tokens)) if text]
+    return [(text, glossary.lookup_terms(text, english_level, annotation_language)) for text in texts]
+
+def _request_annotations(plain_text, known_terms, article_url, english_level, annotation_language, model):
+    """Asks the model for the terms to annotate in a text. Returns {term: translation}, or None on failure."""
+    request = _build_annotation_request(plain_text, article_url, english_level, annotation_language, model, known_terms)
+    try:
+        return _create_completion(request, parse=lambda content: _parse_annotations(content, article_url))
+    except Exception as e:
+        _log_ai_error(e, 'annotation', article_url, request['model'])
+        return None
+
+async def _arequest_annotations(plain_text, known_terms, article_url, english_level, annotation_language, model):
+    """Async variant of _request_annotations()."""
+    request = _build_annotation_request(plain_text, article_url, english_level, annotation_language, model, known_terms)
+    try:
+        return await _acreate_completion(request, parse=lambda content: _parse_annotations(content, article_url))
+    except Exception as e:
+        _log_ai_error(e, 'annotation', article_url, request['model'])
+        return None
+
+def _apply_annotation_results(markdown, pieces, results, article_url, english_level, annotation_language):
+    """Merges the glossary terms and the model's term lists of all pieces, stores the new terms in the glossary
+    and applies all of them to the Markdown. Returns the error marker if any piece failed."""
+    if any(result is None for result in results):
+        return f"[Error: AI annotation failed for {article_url}. See logs.]"
+    annotations = {}
+    for _, known_terms in pieces:
+        annotations.update(known_terms)
+    known_count = len(annotations)
+    new_terms = {}
+    for result in results:
+        for term, translation in result.items():
+            new_terms.setdefault(term, translation)
+            annotations.setdefault(term, translation)
+    glossary.add_terms(new_terms, english_level, annotation_language)
+    markdown, applied_count = apply_annotations(markdown, annotations)
+    logger.info(f"AI content processing successful for article: {article_url} (local Markdown, {applied_count} {annotation_language} annotations, {known_count} terms from the glossary)")
+    return markdown
+
+def _process_locally(full_text, article_url):
+    """Converts the article to Markdown locally; the model is only asked for the vocabulary annotations."""
+    markdown = html_to_markdown(full_text)
+    english_level, annotation_language = _annotation_settings()
+    if not annotation_language:
+        logger.info(f"Converted {article_url} to Markdown locally (annotation disabled, no AI call).")
+        return markdown
+    if not _client_pool:
+        logger.error("OpenAI client not initialized. Cannot perform AI annotation.")
+        return "[Error: AI client not initialized]"
+
+    pieces = _annotation_pieces(full_text, english_level, annotation_language)
+    model = _annotation_model(full_text)
+    _, max_parallel = _chunk_settings()
+    with ThreadPoolExecutor(max_workers=min(max_parallel, len(pieces)), thread_name_prefix="annotate") as executor:
+        results = list(executor.map(lambda piece: _request_annotations(*piece, article_url, english_level, annotation_language, model), pieces))
+    return _apply_annotation_results(markdown, pieces, results, article_url, english_level, annotation_language)
+
+async def _aprocess_locally(full_text, article_url):
+    """Async variant of _process_locally()."""
+    markdown = html_to_markdown(full_text)
+    english_level, annotation_language = _annotation_settings()
+    if not annotation_language:
+        logger.info(f"Converted {article_url} to Markdown locally (annotation disabled, no AI call).")
+        return markdown
+    if not _client_pool:
+        logger.error("OpenAI client not initialized. Cannot perform AI annotation.")
+        return "[Error: AI client not initialized]"
+
+    _, max_parallel = _chunk_settings()
+    semaphore = asyncio.Semaphore(max_parallel)
+    model = _annotation_model(full_text)
+
+    async def annotate(piece):
+        async with semaphore:
+            return await _arequest_annotations(*piece, article_url, english_level, annotation_language, model)
+
+    # The glossary lookups and writes are SQLite calls, so they run in worker threads
+    pieces = await asyncio.to_thread(_annotation_pieces, full_text, english_level, annotation_language)
+    results = await asyncio.gather(*(annotate(piece) for piece in pieces))
+    return await asyncio.to_thread(_apply_annotation_results, markdown, pieces, results, article_url, english_level, annotation_language)
+
+def _send_processing_request(request, full_text, article_url, stream_to):
+    """Sends a single-request processing call, streamed if ai_filter.streaming is enabled. Returns the Markdown."""
+    if not _streaming_settings().get('enabled', False):
+        return _create_completion(request)
+    if stream_to is not None:
+        return _create_streamed_completion(request, stream_to, full_text, article_url)
+    with _spooled_sink() as sink:
+        return _create_streamed_completion(request, sink, full_text, article_url)
+
+async def _asend_processing_request(request, full_text, article_url, stream_to):
+    """Async variant of _send_processing_request()."""
+    if not _streaming_settings().get('enabled', False):
+        return await _acreate_completion(request)
+    if stream_to is not None:
+        return await _acreate_streamed_completion(request, stream_to, full_text, article_url)
+    with _spooled_sink() as sink:
+        return await _acreate_streamed_completion(request, sink, full_text, article_url)
+
+def process_content_with_ai(full_text, article_url, stream_to=None):
+    """Uses AI to convert text to Markdown and add vocabulary annotations.
+
+    With markdown_conversion 'local', the Markdown is produced by markdown_converter and the model only
+    supplies the annotations. Otherwise, articles longer than processing_chunk_tokens are split at block
+    boundaries and their chunks processed in parallel. Articles processed in one request are streamed if
+    ai_filter.streaming is enabled, into stream_to (a text file open for writing and reading) if given.
+    """
+    # Simple check if text is empty or too short
+    if not full_text or len(full_text) < 100:
+        logger.warning(f"Content for {article_url} is too short or empty. Skipping AI processing.")
+        return full_text # Return original text if too short
+
+    if _conversion_mode() == 'local':
+        return _process_locally(full_text, article_url)
+
+    if not _client_pool:
+        logger.error("OpenAI client not initialized. Cannot perform AI processing.")
+        return "[Error: AI client not initialized]"
+
+    model = _processing_model(full_text)
+    chunks = _plan_chunks(full_text, article_url)
+    if chunks:
+        return _process_in_chunks(chunks, article_url, model)
 
+    request = _build_processing_request(full_text, article_url, model)
     logger.debug(f"Sending content processing request to AI for article: {article_url}")
     try:
-        # Consider potential context length limits. Very long articles might need chunking.
-        # A simplified check (adjust based on model limits and typical article lengths):
-        # if len(full_text) > 30000: # Rough estimate for character limit
-        #     logger.warning(f"Article {article_url} is very long ({len(full_text)} characters). Processing may fail or be truncated. Consider implementing chunking.")
-        #     # return process_large_article_in_chunks(full_text, english_level, model) # Placeholder
-
-        response = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            # max_tokens=... # Optional: can limit output tokens, but might truncate content
-            temperature=0.3 # Keep creativity low for formatting/annotation task
-        )
-        processed_markdown = response.choices[0].message.content
-        logger.info(f"AI content processing successful for article: {article_url}")
-        return processed_markdown
-
-    except openai.APIError as e:
-         # Specific check for context length exceeded
-        if hasattr(e, 'code') and e.code == 'context_length_exceeded':
-             logger.error(f"AI processing failed for {article_url} due to context length exceeding model limit ({model}). Article too long for single call. Chunking needed.")
-             return f"[Error: Article too long for model '{model}'. Chunking needed.]"
-        else:
-            logger.error(f"OpenAI API error during processing for {article_url}: {e}. Status={getattr(e, 'status_code', 'N/A')}, Message={getattr(e, 'message', str(e))}")
-
-    except json.JSONDecodeError as e:
-        # This shouldn't happen unless the API response format changes drastically
-        logger.error(f"Failed to decode (unexpected) AI processing JSON response for {article_url}: {e}. Raw response: {response.choices[0].message.content if response and response.choices else 'No response'}")
+        processed_markdown = _send_processing_request(request, full_text, article_url, stream_to)
+    except StreamAbortedError as e:
+        logger.error(f"AI processing of {article_url} aborted while streaming ({request['model']}): {e}")
+        return f"[Error: AI output for {article_url} was aborted: {e}]"
     except Exception as e:
-        logger.error(f"Unexpected error during AI processing for {article_url}: {e}", exc_info=True)
+        # The token estimate is rough; if the model disagrees, fall back to smaller chunks
+        chunks = _plan_chunks(full_text, article_url, after_context_error=True) if _is_context_length_error(e) else None
+        if chunks:
+            return _process_in_chunks(chunks, article_url, model)
+        return _processing_error_result(e, article_url, request['model'])
+    logger.info(f"AI content processing successful for article: {article_url}")
+    return processed_markdown
 
-    return f"[Error: AI processing failed for {article_url}. See logs.]"
+async def aprocess_content_with_ai(full_text, article_url, stream_to=None):
+    """Async variant of process_content_with_ai()."""
+    if not full_text or len(full_text) < 100:
+        logger.warning(f"Content for {article_url} is too short or empty. Skipping AI processing.")
+        return full_text
+
+    if _conversion_mode() == 'local':
+        return await _aprocess_locally(full_text, article_url)
+
+    if not _client_pool:
+        logger.error("OpenAI client not initialized. Cannot perform AI processing.")
+        return "[Error: AI client not initialized]"
+
+    model = _processing_model(full_text)
+    chunks = _plan_chunks(full_text, article_url)
+    if chunks:
+        return await _aprocess_in_chunks(chunks, article_url, model)
+
+    request = _build_processing_request(full_text, article_url, model)
+    logger.debug(f"Sending content processing request to AI for article: {article_url}")
+    try:
+        processed_markdown = await _asend_processing_request(request, full_text, article_url, stream_to)
+    except StreamAbortedError as e:
+        logger.error(f"AI processing of {article_url} aborted while streaming ({request['model']}): {e}")
+        return f"[Error: AI output for {article_url} was aborted: {e}]"
+    except Exception as e:
+        chunks = _plan_chunks(full_text, article_url, after_context_error=True) if _is_context_length_error(e) else None
+        if chunks:
+            return await _aprocess_in_chunks(chunks, article_url, model)
+        return _processing_error_result(e, article_url, request['model'])
+    logger.info(f"AI content processing successful for article: {article_url}")
+    return processed_markdown
+
+# --- Batch jobs (engine: "batch" in config.yaml) --- #
+# A stage's requests for all articles go out together as batch jobs (see batch_jobs) instead of one live request
+# each. Their answers are parsed like live responses. Escalations of low-confidence verdicts are still live requests.
+
+_batch_endpoint = None
+
+def _get_batch_endpoint():
+    """Returns the endpoint batch jobs are submitted to: batch_mode.endpoint (default: the first endpoint),
+    at batch_mode.base_url if one is set. None if there is no such endpoint."""
+    global _batch_endpoint
+    if _batch_endpoint is None and _client_pool:
+        batch_conf = config.get('batch_mode', {})
+        name = batch_conf.get('endpoint')
+        endpoint = next((endpoint for endpoint in _client_pool.endpoints if not name or endpoint.name == name), None)
+        if endpoint is None:
+            logger.error(f"Batch endpoint '{name}' is not among the configured AI endpoints.")
+            return None
+        if batch_conf.get('base_url'):
+            endpoint = Endpoint(f"{endpoint.name} (batch)", endpoint.api_key, base_url=batch_conf['base_url'],
+                                proxy=endpoint.proxy, model_aliases=endpoint.model_aliases)
+        _batch_endpoint = endpoint
+    return _batch_endpoint
+
+def _run_batch_requests(requests, stage):
+    """Sends the requests as batch jobs. Returns their contents in order, None for those without an answer."""
+    endpoint = _get_batch_endpoint()
+    if endpoint is None:
+        logger.error(f"No AI endpoint for batch jobs. Cannot run {stage}.")
+        return [None] * len(requests)
+    return batch_jobs.run_batch_job(requests, stage, endpoint)
+
+def _parse_batch_answer(request, content, parse):
+    """Returns parse(content) for a batch job answer, dropping it from the AI cache if it is unusable (see _create_completion)."""
+    result = parse(content)
+    if result is None:
+        ai_cache.discard(request)
+    return result
+
+def filter_articles_with_batch_job(article_list):
+    """Filters articles based on title and summary with one batch job. Returns a verdict (or None) per article."""
+    if not _client_pool:
+        logger.error("OpenAI client not initialized. Cannot perform AI filtering.")
+        return [None] * len(article_list)
+
+    requests = [_build_filter_request(article_data) for article_data in article_list]
+    contents = _run_batch_requests(requests, 'filter_stage1')
+    verdicts = []
+    for article_data, request, result_content in zip(article_list, requests, contents):
+        if result_content is None:
+            logger.error(f"No batch job answer for filtering {article_data['link']}.")
+            verdicts.append(None)
+            continue
+        verdict = _parse_batch_answer(request, result_content, lambda content: _parse_verdict(content, 'filtering', article_data['link']))
+        verdicts.append(_escalate_stage1(verdict, article_data))
+    return verdicts
+
+def filter_article_contents_with_batch_job(items):
+    """Filters articles based on their full HTML content with one batch job.
+
+    items are (full_html_content, article_url) pairs. Returns a verdict (or None) per item.
+    """
+    if not _client_pool:
+        logger.error("OpenAI client not initialized. Cannot perform AI content filtering.")
+        return [None] * len(items)
+
+    requests = [_build_content_filter_request(full_html_content, article_url) for full_html_content, article_url in items]
+    contents = iter(_run_batch_requests([request for request in requests if request is not None], 'filter_stage2'))
+    verdicts = []
+    for (full_html_content, article_url), request in zip(items, requests):
+        result_content = next(contents) if request is not None else None
+        if result_content is None:
+            if request is not None:
+                logger.error(f"No batch job answer for content filtering {article_url}.")
+            verdicts.append(None)
+            continue
+        verdict = _parse_batch_answer(request, result_content, lambda content: _parse_verdict(content, 'content filtering', article_url))
+        verdicts.append(_escalate_verdict(verdict,
+                                          lambda model, html=full_html_content, url=article_url: _build_content_filter_request(html, url, model),
+                                          'accepted_content_quality', 'content_escalation_model', 'content filtering', article_url))
+    return verdicts
+
+def _plan_batch_processing(full_text, article_url):
+    """Plans processing an article in a batch job, as process_content_with_ai() would process it live.
+
+    Returns (requests, assemble); assemble(contents) turns the answers to the requests into the result.
+    """
+    if not full_text or len(full_text) < 100:
+        logger.warning(f"Content for {article_url} is too short or empty. Skipping AI processing.")
+        return [], lambda contents: full_text
+
+    if _conversion_mode() == 'local':
+        markdown = html_to_markdown(full_text)
+        english_level, annotation_language = _annotation_settings()
+        if not annotation_language:
+            logger.info(f"Converted {article_url} to Markdown locally (annotation disabled, no AI call).")
+            return [], lambda contents: markdown
+        pieces = _annotation_pieces(full_text, english_level, annotation_language)
+        model = _annotation_model(full_text)
+        requests = [_build_annotation_request(text, article_url, english_level, annotation_language, model, known_terms)
+                    for text, known_terms in pieces]
+
+        def assemble_annotations(contents):
+            results = [_parse_batch_answer(request, content, lambda content: _parse_annotations(content, article_url))
+                       if content is not None else None for request, content in zip(requests, contents)]
+            return _apply_annotation_results(markdown, pieces, results, article_url, english_level, annotation_language)
+        return requests, assemble_annotations
+
+    model = _processing_model(full_text)
+    chunks = _plan_chunks(full_text, article_url)
+    if chunks:
+        requests = [_build_processing_request(chunk, article_url, model, part=(index, len(chunks))) for index, chunk in enumerate(chunks)]
+    else:
+        requests = [_build_processing_request(full_text, article_url, model)]
+
+    def assemble_markdown(contents):
+        if any(content is None for content in contents):
+            logger.error(f"No batch job answer for processing {article_url} ({sum(content is None for content in contents)} of {len(contents)} requests).")
+            return f"[Error: AI processing failed for {article_url}. See logs.]"
+        logger.info(f"AI content processing successful for article: {article_url}" + (f" ({len(chunks)} chunks)" if chunks else ""))
+        return "\n\n".join(content.strip() for content in contents) if chunks else contents[0]
+    return requests, assemble_markdown
+
+def process_contents_with_batch_job(items):
+    """Converts articles to annotated Markdown with one batch job (all chunks or annotation pieces of all articles).
+
+    items are (full_text, article_url) pairs. Returns process_content_with_ai()'s result per item.
+    """
+    if not _client_pool:
+        logger.error("OpenAI client not initialized. Cannot perform AI processing.")
+        return ["[Error: AI client not initialized]"] * len(items)
 
-# TODO (Optional): Implement chunking for very long articles
-# def process_large_article_in_chunks(full_text, english_level, model, chunk_size=10000): # Adjust chunk size
-#     logger.warning(f"Attempting to chunk large article...")
-#     # Basic text splitting (could be improved by splitting at paragraph boundaries)
-#     chunks = [full_text[i:i+chunk_size] for i in range(0, len(full_text), chunk_size)]
-#     processed_chunks = []
-#     for i, chunk in enumerate(chunks):
-#         logger.debug(f"Processing chunk {i+1}/{len(chunks)}")
-#         # Modify prompt slightly for chunk?
-#         processed_chunk = process_content_with_ai(chunk, f"[Chunk {i+1}/{len(chunks)}]", english_level, model) # Need to adjust call
-#         if "[Error:" in processed_chunk: # Use Chinese error marker check
-#              logger.error(f"Error in chunk {i+1}. Stopping chunking.")
-#              return "[Error: Failed during chunking]"
-#         processed_chunks.append(processed_chunk)
-#         time.sleep(1) # If processing many chunks quickly, avoid hitting rate limit
-#     return "\n\n".join(processed_chunks) 
\ No newline at end of file
+    plans = [_plan_batch_processing(full_text, article_url) for full_text, article_url in items]
+    contents = _run_batch_requests([request for requests, _ in plans for request in requests], 'process')
+    results = []
+    position = 0
+    for requests, assemble in plans:
+        results.append(assemble(contents[position:position + len(requests)]))
+        position += len(requests)
+    return results
@@ -1,4 +1,5 @@
 import requests
+import httpx
 import json
 import logging
 from config import config # Import the loaded config
@@ -31,15 +32,18 @@ def _get_nested_value(data, key_path):
     except (KeyError, IndexError, TypeError, ValueError):
         return None
 
-def push_to_api(article_data, processed_markdown):
-    """Pushes processed article data to a generically configured API endpoint."""
+def _prepare_push_request(article_data, processed_markdown):
+    """Builds the keyword arguments of the API push request from the target_api config.
+
+    Returns (request_args, article_title), or (None, article_title) if the config does not allow pushing.
+    """
     api_config = config.get('target_api', {})
     output_config = config.get('output', {})
 
     # Ensure this function is only called if output method is 'api'
     if output_config.get('method', 'api').lower() != 'api':
         logger.debug("API push skipped: output method is not 'api'.")
-        return False # Should not happen if called from main.py logic
+        return None, article_data.get('title', 'No Title Provided') # Should not happen if called from main.py logic
 
     # --- Get required configurations ---
     endpoint = api_config.get('endpoint')
@@ -49,13 +53,11 @@ def push_to_api(article_data, processed_markdown):
     auth_type = auth_config.get('type', 'none').lower()
     custom_headers = api_config.get('headers', {})
     payload_mapping = api_config.get('payload_mapping', {})
-    success_check_config = api_config.get('success_check', {})
-    success_check_type = success_check_config.get('type', 'status_code').lower()
 
     # --- Basic validation ---
     if not endpoint or endpoint.startswith('YOUR_'):
         logger.error("Target API endpoint URL is not configured or is a placeholder. Cannot push article.")
-        return False
+        return None, article_data.get('title', 'No Title Provided')
 
     # --- Prepare data placeholders ---
     placeholders = {
@@ -84,7 +86,7 @@ def push_to_api(article_data, processed_markdown):
 
     if auth_type != 'none' and not api_key_env:
         logger.error(f"Authentication type is '{auth_type}' but TARGET_API_KEY environment variable is not set. Cannot authenticate.")
-        return False
+        return None, article_data.get('title', 'No Title Provided')
 
     if auth_type == 'bearer':
         header_name = auth_config.get('header_name', 'Authorization')
@@ -94,7 +96,7 @@ def push_to_api(article_data, processed_markdown):
         header_name = auth_config.get('header_name')
         if not header_name:
             logger.error("Authentication type is 'header_key' but 'header_name' is not specified in config. Cannot authenticate.")
-            return False
+            return None, article_data.get('title', 'No Title Provided')
         headers[header_name] = api_key_env
         logger.debug(f"Using API Key authentication in header '{header_name}'.")
     elif auth_type == 'body_key':
@@ -102,7 +104,7 @@ def push_to_api(article_data, processed_markdown):
         logger.debug(f"API Key will be added to payload body.")
     elif auth_type != 'none':
         logger.error(f"Invalid authentication type specified in config: '{auth_type}'. Valid types: none, bearer, header_key, body_key.")
-        return False
+        return None, article_data.get('title', 'No Title Provided')
 
     # --- Prepare Payload --- # Default to None
     payload = None
@@ -126,7 +128,7 @@ def push_to_api(article_data, processed_markdown):
             body_key_name = auth_config.get('body_key_name')
             if not body_key_name:
                 logger.error("Authentication type is 'body_key' but 'body_key_name' is not specified in config. Cannot authenticate.")
-                return False
+                return None, article_data.get('title', 'No Title Provided')
             payload[body_key_name] = api_key_env
             logger.debug(f"Added API key to payload under key '{body_key_name}'.")
     elif payload_mapping:
@@ -139,69 +141,83 @@ def push_to_api(article_data, processed_markdown):
     # logger.debug(f"Headers: {headers}")
     # logger.debug(f"Payload: {json.dumps(payload, indent=2) if payload else 'None'}")
 
-    response = None
-    try:
-        request_args = {
-            'method': http_method,
-            'url': endpoint,
-            'headers': headers,
-            'timeout': timeout
-        }
-        # Add JSON payload only if it exists and method allows a body
-        if payload is not None and http_method not in ['GET', 'HEAD', 'DELETE']: # Common methods with bodies
-             request_args['json'] = payload
+    request_args = {
+        'method': http_method,
+        'url': endpoint,
+        'headers': headers,
+        'timeout': timeout
+    }
+    # Add JSON payload only if it exists and method allows a body
+    if payload is not None and http_method not in ['GET', 'HEAD', 'DELETE']: # Common methods with bodies
+         request_args['json'] = payload
+    return request_args, article_title_log
 
-        response = requests.request(**request_args)
-        response.raise_for_status() # Check for 4xx/5xx HTTP errors first
+def _is_push_successful(response, article_title_log):
+    """Applies the configured success check to an API response (requests or httpx)."""
+    success_check_config = config.get('target_api', {}).get('success_check', {})
+    success_check_type = success_check_config.get('type', 'status_code').lower()
 
-        # --- Check Success Criteria ---
-        push_successful = False
-        if success_check_type == 'status_code':
-            expected_codes = success_check_config.get('expected_status_codes', [200, 201])
-            if response.status_code in expected_codes:
-                push_successful = True
-                logger.info(f"API push successful for '{article_title_log}' (Status Code: {response.status_code}).")
-            else:
-                logger.error(f"API push failed for '{article_title_log}'. Unexpected status code: {response.status_code} (Expected: {expected_codes}).")
-        elif success_check_type == 'json_field':
-            field_name = success_check_config.get('json_field_name')
-            expected_value = success_check_config.get('expected_json_value')
-            if not field_name:
-                logger.error(f"API push success check failed for '{article_title_log}': Success type is 'json_field' but 'json_field_name' is missing in config.")
-            else:
-                try:
-                    response_json = response.json()
-                    actual_value = _get_nested_value(response_json, field_name) # Use helper for nested keys
-                    # Explicitly check type of expected_value if it's not None, compare accordingly
-                    if actual_value is not None and expected_value is not None and isinstance(expected_value, type(actual_value)) and actual_value == expected_value:
-                         push_successful = True
-                         logger.info(f"API push successful for '{article_title_log}' (JSON field '{field_name}' matched value '{expected_value}').")
-                    elif actual_value is not None and expected_value is None:
-                        # If expected value is null/None, just checking existence might be enough? Or require explicit None match?
-                        # Current logic: only matches if actual_value is also None.
-                         if actual_value is None:
-                            push_successful = True
-                            logger.info(f"API push successful for '{article_title_log}' (JSON field '{field_name}' is null/None as expected)." )
-                         else:
-                            logger.error(f"API push failed for '{article_title_log}'. JSON field '{field_name}' has value '{actual_value}', expected null/None.")
-                    elif expected_value is not None and (actual_value is None or not isinstance(expected_value, type(actual_value))):
-                        logger.error(f"API push failed for '{article_title_log}'. JSON field '{field_name}' type mismatch or not found. Expected type {type(expected_value)}, Got value: {actual_value}")
-                    elif actual_value != expected_value:
-                        logger.error(f"API push failed for '{article_title_log}'. JSON field '{field_name}' has value '{actual_value}', expected '{expected_value}'.")
-                except json.JSONDecodeError:
-                    logger.error(f"API push success check failed for '{article_title_log}': Could not decode JSON response to check field '{field_name}'. Response text: {response.text[:500]}")
-                except Exception as e:
-                     logger.error(f"API push success check failed for '{article_title_log}' while checking JSON field '{field_name}': {e}")
+    # --- Check Success Criteria ---
+    push_successful = False
+    if success_check_type == 'status_code':
+        expected_codes = success_check_config.get('expected_status_codes', [200, 201])
+        if response.status_code in expected_codes:
+            push_successful = True
+            logger.info(f"API push successful for '{article_title_log}' (Status Code: {response.status_code}).")
         else:
-            logger.error(f"Invalid success_check type specified in config: '{success_check_type}'. Defaulting to failure.")
+            logger.error(f"API push failed for '{article_title_log}'. Unexpected status code: {response.status_code} (Expected: {expected_codes}).")
+    elif success_check_type == 'json_field':
+        field_name = success_check_config.get('json_field_name')
+        expected_value = success_check_config.get('expected_json_value')
+        if not field_name:
+            logger.error(f"API push success check failed for '{article_title_log}': Success type is 'json_field' but 'json_field_name' is missing in config.")
+        else:
+            try:
+                response_json = response.json()
+                actual_value = _get_nested_value(response_json, field_name) # Use helper for nested keys
+                # Explicitly check type of expected_value if it's not None, compare accordingly
+                if actual_value is not None and expected_value is not None and isinstance(expected_value, type(actual_value)) and actual_value == expected_value:
+                     push_successful = True
+                     logger.info(f"API push successful for '{article_title_log}' (JSON field '{field_name}' matched value '{expected_value}').")
+                elif actual_value is not None and expected_value is None:
+                    # If expected value is null/None, just checking existence might be enough? Or require explicit None match?
+                    # Current logic: only matches if actual_value is also None.
+                     if actual_value is None:
+                        push_successful = True
+                        logger.info(f"API push successful for '{article_title_log}' (JSON field '{field_name}' is null/None as expected)." )
+                     else:
+                        logger.error(f"API push failed for '{article_title_log}'. JSON field '{field_name}' has value '{actual_value}', expected null/None.")
+                elif expected_value is not None and (actual_value is None or not isinstance(expected_value, type(actual_value))):
+                    logger.error(f"API push failed for '{article_title_log}'. JSON field '{field_name}' type mismatch or not found. Expected type {type(expected_value)}, Got value: {actual_value}")
+                elif actual_value != expected_value:
+                    logger.error(f"API push failed for '{article_title_log}'. JSON field '{field_name}' has value '{actual_value}', expected '{expected_value}'.")
+            except json.JSONDecodeError:
+                logger.error(f"API push success check failed for '{article_title_log}': Could not decode JSON response to check field '{field_name}'. Response text: {response.text[:500]}")
+            except Exception as e:
+                 logger.error(f"API push success check failed for '{article_title_log}' while checking JSON field '{field_name}': {e}")
+    else:
+        logger.error(f"Invalid success_check type specified in config: '{success_check_type}'. Defaulting to failure.")
+
+    if not push_successful:
+         # Log response details on failure if not already logged by status check
+         if success_check_type != 'status_code':
+             try:
+                  logger.error(f"API Response Body on Failure: {response.text[:1000]}") # Limit length
+             except Exception: pass # Ignore errors during logging
+    return push_successful
+
+def push_to_api(article_data, processed_markdown):
+    """Pushes processed article data to a generically configured API endpoint."""
+    request_args, article_title_log = _prepare_push_request(article_data, processed_markdown)
+    if request_args is None:
+        return False
+    endpoint = request_args['url']
+    timeout = request_args['timeout']
 
-        if not push_successful:
-             # Log response details on failure if not already logged by status check
-             if success_check_type != 'status_code':
-                 try:
-                      logger.error(f"API Response Body on Failure: {response.text[:1000]}") # Limit length
-                 except Exception: pass # Ignore errors during logging
-        return push_successful
+    try:
+        response = requests.request(**request_args)
+        response.raise_for_status() # Check for 4xx/5xx HTTP errors first
+        return _is_push_successful(response, article_title_log)
 
     except requests.exceptions.Timeout:
         logger.error(f"Timeout error ({timeout}s) pushing article '{article_title_log}' to {endpoint}.")
@@ -217,4 +233,31 @@ def push_to_api(article_data, processed_markdown):
     except Exception as e:
         logger.error(f"Unexpected error during API push for '{article_title_log}': {e}", exc_info=True)
 
-    return False # Any exception leads to failure 
\ No newline at end of file
+    return False # Any exception leads to failure
+
+async def apush_to_api(article_data, processed_markdown, http_client):
+    """Async variant of push_to_api() that sends the request with an httpx.AsyncClient."""
+    request_args, article_title_log = _prepare_push_request(article_data, processed_markdown)
+    if request_args is None:
+        return False
+    endpoint = request_args['url']
+    timeout = request_args['timeout']
+
+    try:
+        response = await http_client.request(**request_args)
+        response.raise_for_status() # Check for 4xx/5xx HTTP errors first
+        return _is_push_successful(response, article_title_log)
+
+    except httpx.TimeoutException:
+        logger.error(f"Timeout error ({timeout}s) pushing article '{article_title_log}' to {endpoint}.")
+    except httpx.HTTPStatusError as e:
+        logger.error(f"HTTP error pushing article '{article_title_log}' to {endpoint}: {e}")
+        logger.error(f"API Response Status: {e.response.status_code}")
+        try: logger.error(f"API Response Body: {e.response.text[:1000]}") # Limit length
+        except Exception: pass
+    except httpx.HTTPError as e:
+        logger.error(f"Network error pushing article '{article_title_log}' to {endpoint}: {e}")
+    except Exception as e:
+        logger.error(f"Unexpected error during API push for '{article_title_log}': {e}", exc_info=True)
+
+    return False # Any exception leads to failure
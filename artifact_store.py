@@ -0,0 +1,121 @@
+import gzip
+import hashlib
+import logging
+import os
+import threading
+from config import config # Import the already loaded config
+import state_manager as sm
+
+logger = logging.getLogger(__name__)
+
+# Artifacts kept per article, in pipeline order
+ARTIFACT_KINDS = ('raw_html', 'extracted_html', 'stage2_verdict', 'markdown')
+
+store_conf = config.get('artifact_store', {})
+ENABLED = store_conf.get('enabled', False)
+STORE_DIR = store_conf.get('dir', 'artifacts')
+MAX_SIZE_BYTES = int(float(store_conf.get('max_size_mb', 500)) * 1024 * 1024)
+COMPRESSION_LEVEL = int(store_conf.get('compression_level', 6))
+
+_size_lock = threading.Lock()
+_total_size = None # Bytes currently on disk, computed lazily on first save
+
+def _url_hash(url):
+    """Returns the SHA-256 hex digest used as the content address of an article URL."""
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+def _artifact_path(url, kind):
+    """Returns the on-disk path of an artifact. Files are sharded by the first two hash characters."""
+    url_hash = _url_hash(url)
+    return os.path.join(STORE_DIR, url_hash[:2], f"{url_hash}.{kind}.gz")
+
+def _scan_store():
+    """Returns a list of (mtime, size, path) for every artifact file in the store."""
+    entries = []
+    if not os.path.isdir(STORE_DIR):
+        return entries
+    for shard in os.scandir(STORE_DIR):
+        if not shard.is_dir():
+            continue
+        for item in os.scandir(shard.path):
+            if item.is_file() and item.name.endswith('.gz'):
+                stat = item.stat()
+                entries.append((stat.st_mtime, stat.st_size, item.path))
+    return entries
+
+def _evict_if_needed():
+    """Deletes least recently used artifacts until the store is back under MAX_SIZE_BYTES. Caller holds _size_lock."""
+    global _total_size
+    if _total_size <= MAX_SIZE_BYTES:
+        return
+    entries = sorted(_scan_store()) # Oldest mtime first; loads touch the mtime, so this is LRU order
+    _total_size = sum(size for _, size, _ in entries)
+    target_size = int(MAX_SIZE_BYTES * 0.9) # Leave some headroom so we don't evict on every save
+    evicted_paths = []
+    for _, size, path in entries:
+        if _total_size <= target_size:
+            break
+        try:
+            os.remove(path)
+            _total_size -= size
+            evicted_paths.append(path)
+        except OSError as e:
+            logger.warning(f"Failed to evict artifact {path}: {e}")
+    if evicted_paths:
+        sm.delete_artifact_refs(evicted_paths)
+        logger.info(f"Evicted {len(evicted_paths)} artifacts from {STORE_DIR} (store size now {_total_size / 1024 / 1024:.1f} MB)")
+
+def save_artifact(url, kind, content):
+    """Stores a compressed artifact for an article and references it from the state database.
+
+    Returns the artifact path, or None if the store is disabled or the write failed.
+    """
+    if not ENABLED or content is None:
+        return None
+    global _total_size
+    path = _artifact_path(url, kind)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = gzip.compress(content.encode('utf-8'), compresslevel=COMPRESSION_LEVEL)
+        previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+        tmp_path = f"{path}.tmp.{threading.get_ident()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path) # Atomic, readers never see a partial file
+    except OSError as e:
+        logger.error(f"Failed to store '{kind}' artifact for {url}: {e}")
+        return None
+
+    sm.record_artifact_ref(url, kind, path, len(data))
+    with _size_lock:
+        if _total_size is None:
+            _total_size = sum(size for _, size, _ in _scan_store())
+        else:
+            _total_size += len(data) - previous_size
+        _evict_if_needed()
+    logger.debug(f"Stored '{kind}' artifact for {url} ({len(content)} chars, {len(data)} bytes compressed)")
+    return path
+
+def load_artifact(url, kind):
+    """Returns a stored artifact as a string, or None if it is missing or the store is disabled.
+
+    Artifacts are found through the references in the state database; a reference whose file is gone is removed.
+    """
+    if not ENABLED:
+        return None
+    path = sm.get_artifact_refs(url).get(kind)
+    if path is None:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            content = gzip.decompress(f.read()).decode('utf-8')
+        os.utime(path) # Mark as recently used for LRU eviction
+        logger.debug(f"Loaded '{kind}' artifact for {url} from {path}")
+        return content
+    except FileNotFoundError:
+        logger.debug(f"'{kind}' artifact for {url} is referenced but missing from {path}. Dropping the reference.")
+        sm.delete_artifact_refs([path])
+        return None
+    except (OSError, EOFError, UnicodeDecodeError) as e:
+        logger.warning(f"Failed to read '{kind}' artifact for {url} from {path}: {e}")
+        return None
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from config import config # Import the already loaded config
+import ai_cache
+import state_manager as sm
+
+logger = logging.getLogger(__name__)
+
+batch_conf = config.get('batch_mode', {})
+# Where the JSONL input files of submitted jobs are kept
+JOBS_DIR = batch_conf.get('jobs_dir', 'batch_jobs')
+POLL_INTERVAL_SECONDS = max(1.0, float(batch_conf.get('poll_interval_seconds', 60)))
+# After this long the run stops waiting; the job keeps running and its output is collected by a later run
+MAX_WAIT_HOURS = float(batch_conf.get('max_wait_hours', 24))
+COMPLETION_WINDOW = batch_conf.get('completion_window', '24h')
+# The OpenAI Batch API accepts up to 50,000 requests per job; larger stages are split into several jobs
+MAX_REQUESTS_PER_JOB = max(1, int(batch_conf.get('max_requests_per_job', 50000)))
+
+_CHAT_COMPLETIONS_URL = "/v1/chat/completions"
+# Statuses after which a job produces no more output
+_FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+_stats = {'jobs': 0, 'requests': 0, 'answered': 0, 'failed': 0, 'collected': 0}
+_stats_lock = threading.Lock()
+
+def _count(key, amount=1):
+    """Adds to a run summary counter. Safe to call from worker threads."""
+    with _stats_lock:
+        _stats[key] += amount
+
+def _write_job_file(stage, lines):
+    """Writes the job input as JSONL. Returns its path."""
+    content = ''.join(json.dumps(line, ensure_ascii=False) + '\n' for line in lines)
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    path = os.path.join(JOBS_DIR, f"{stage}-{time.strftime('%Y%m%d-%H%M%S')}-{content_hash[:12]}.jsonl")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return path
+
+def _parse_output(text, stage):
+    """Parses a job's output (or error) file into {custom_id: response content}, logging the failed lines."""
+    results = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            logger.error(f"Unreadable line in {stage} batch job output: {e}. Line: {line[:200]}")
+            continue
+        custom_id = item.get('custom_id')
+        response = item.get('response') or {}
+        body = response.get('body') or {}
+        if item.get('error') or response.get('status_code') != 200:
+            error = item.get('error') or body.get('error') or f"status {response.get('status_code')}"
+            logger.error(f"Batch request {custom_id} ({stage}) failed: {error}")
+            continue
+        try:
+            results[custom_id] = body['choices'][0]['message']['content']
+        except (KeyError, IndexError, TypeError):
+            logger.error(f"Batch request {custom_id} ({stage}) returned an unexpected response: {json.dumps(body)[:200]}")
+    return results
+
+def _read_results(client, batch, stage):
+    """Downloads and parses the output of a finished job. Failed requests are logged from its error file."""
+    results = {}
+    if getattr(batch, 'output_file_id', None):
+        results = _parse_output(client.files.content(batch.output_file_id).text, stage)
+    if getattr(batch, 'error_file_id', None):
+        _parse_output(client.files.content(batch.error_file_id).text, stage)
+    return results
+
+def _log_progress(batch, stage):
+    counts = getattr(batch, 'request_counts', None)
+    progress = f", {counts.completed + counts.failed}/{counts.total} done ({counts.failed} failed)" if counts else ''
+    logger.info(f"Batch job {batch.id} ({stage}): {batch.status}{progress}")
+
+def _wait_for(client, batch, stage):
+    """Polls the job until it finishes. Returns the finished job, or None if the wait limit was reached."""
+    deadline = time.monotonic() + MAX_WAIT_HOURS * 3600
+    while batch.status not in _FINAL_STATUSES:
+        if time.monotonic() >= deadline:
+            logger.error(f"Batch job {batch.id} ({stage}) did not finish within {MAX_WAIT_HOURS} hours. "
+                         f"Its articles fail this stage for now; a later run collects its output.")
+            return None
+        time.sleep(POLL_INTERVAL_SECONDS)
+        try:
+            batch = client.batches.retrieve(batch.id)
+        except Exception as e:
+            logger.warning(f"Polling batch job {batch.id} ({stage}) failed: {e}. Retrying in {POLL_INTERVAL_SECONDS:.0f}s.")
+            continue
+        sm.record_batch_job(batch.id, stage, batch.status)
+        _log_progress(batch, stage)
+    if batch.status != 'completed':
+        errors = getattr(getattr(batch, 'errors', None), 'data', None) or []
+        logger.error(f"Batch job {batch.id} ({stage}) ended with status '{batch.status}'"
+                     + (f": {'; '.join(str(getattr(error, 'message', error)) for error in errors)}" if errors else ''))
+    return batch
+
+def _collect_earlier_jobs(client, stage, pending):
+    """Reads the output of jobs earlier runs stopped waiting for. Returns {custom_id: content} of those that finished.
+
+    Every result is stored in the AI cache under its custom_id before the job is marked collected, so answers
+    to requests this run doesn't send (the article was filtered out or processed since) are not lost. With the
+    AI cache off, a job that also answered requests not in pending stays uncollected for a later run to use.
+    """
+    results = {}
+    for batch_id, status in sm.get_uncollected_batch_jobs(stage):
+        try:
+            batch = client.batches.retrieve(batch_id)
+            if batch.status not in _FINAL_STATUSES:
+                sm.record_batch_job(batch_id, stage, batch.status)
+                logger.info(f"Batch job {batch_id} ({stage}) from an earlier run is still {batch.status}.")
+                continue
+            job_results = _read_results(client, batch, stage)
+        except Exception as e:
+            logger.error(f"Failed to collect batch job {batch_id} ({stage}) from an earlier run: {e}")
+            continue
+        results.update(job_results)
+        unused = [key for key in job_results if key not in pending]
+        if unused and not ai_cache.ENABLED:
+            sm.record_batch_job(batch_id, stage, batch.status)
+            logger.info(f"Used {len(job_results) - len(unused)} results of batch job {batch_id} ({stage}) from an earlier run; "
+                        f"it stays uncollected for the other {len(unused)} (enable ai_cache to keep them).")
+            continue
+        for key, content in job_results.items():
+            ai_cache.put_by_key(key, content)
+        sm.record_batch_job(batch_id, stage, 'collected')
+        logger.info(f"Collected {len(job_results)} results of batch job {batch_id} ({stage}) from an earlier run.")
+    return results
+
+def _run_job(client, lines, stage):
+    """Submits one job, waits for it and returns {custom_id: response content} of its successful requests."""
+    path = _write_job_file(stage, lines)
+    try:
+        with open(path, 'rb') as f:
+            input_file = client.files.create(file=f, purpose='batch')
+        batch = client.batches.create(input_file_id=input_file.id, endpoint=_CHAT_COMPLETIONS_URL,
+                                      completion_window=COMPLETION_WINDOW, metadata={'stage': stage})
+    except Exception as e:
+        logger.error(f"Failed to submit {stage} batch job ({len(lines)} requests, {path}): {e}")
+        return {}
+    sm.record_batch_job(batch.id, stage, batch.status, path, len(lines))
+    _count('jobs')
+    logger.info(f"Submitted batch job {batch.id} with {len(lines)} {stage} requests ({path}).")
+
+    batch = _wait_for(client, batch, stage)
+    if batch is None:
+        return {}
+    try:
+        results = _read_results(client, batch, stage)
+    except Exception as e:
+        logger.error(f"Failed to read the output of batch job {batch.id} ({stage}): {e}")
+        return {}
+    sm.record_batch_job(batch.id, stage, 'collected')
+    return results
+
+def run_batch_job(requests, stage, endpoint):
+    """Sends chat completion requests as batch jobs on an endpoint and waits for them.
+
+    Returns the response contents in request order, with None for requests that failed or did not finish.
+    Requests the AI cache can answer are not sent, and answers are stored in the cache like live ones.
+    Identical requests are sent once; their AI cache key is the custom_id, so output of jobs an
+    interrupted run stopped waiting for can still answer the same requests later.
+    """
+    keys = [ai_cache.make_key(request) for request in requests]
+    contents = {}
+    pending = {}
+    for key, request in zip(keys, requests):
+        if key in contents or key in pending:
+            continue
+        cached_content = ai_cache.get(request)
+        if cached_content is not None:
+            contents[key] = cached_content
+        else:
+            pending[key] = request
+
+    if pending:
+        client = endpoint.client
+        earlier_results = _collect_earlier_jobs(client, stage, pending)
+        for key, content in earlier_results.items():
+            if pending.pop(key, None) is not None:
+                contents[key] = content
+                _count('collected')
+        if contents:
+            logger.info(f"{len(contents)} of {len(set(keys))} {stage} requests answered without a new batch job.")
+
+        lines = [{'custom_id': key, 'method': 'POST', 'url': _CHAT_COMPLETIONS_URL, 'body': endpoint.prepare(request)}
+                 for key, request in pending.items()]
+        for start in range(0, len(lines), MAX_REQUESTS_PER_JOB):
+            job_lines = lines[start:start + MAX_REQUESTS_PER_JOB]
+            job_results = _run_job(client, job_lines, stage)
+            _count('requests', len(job_lines))
+            for line in job_lines:
+                key = line['custom_id']
+                if job_results.get(key) is None:
+                    _count('failed')
+                    continue
+                _count('answered')
+                ai_cache.put(pending[key], job_results[key])
+                contents[key] = job_results[key]
+    return [contents.get(key) for key in keys]
+
+def get_stats():
+    """Returns the numbers of batch jobs submitted, requests sent, answered and failed, and results collected from earlier runs."""
+    with _stats_lock:
+        return dict(_stats)
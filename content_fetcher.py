@@ -1,7 +1,16 @@
 import requests
+import httpx
+import asyncio
 import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
 from config import config # Import the already loaded config
-from utils import parse_netscape_cookie_file, extract_main_content_from_html
+from utils import parse_netscape_cookie_file, extract_main_content_from_html, compact_html
+import artifact_store
+from rate_limiter import TokenBucket, parse_retry_after
 # Optional: newspaper3k as a fallback
 # try:
 #     from newspaper import Article
@@ -12,12 +21,154 @@ NEWSPAPER_AVAILABLE = False # Keeping it simple for now
 
 logger = logging.getLogger(__name__)
 
+# Browser-like headers sent with every article request
+DEFAULT_HEADERS = {
+    # Use a realistic User-Agent
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'DNT': '1', # Do Not Track
+    'Upgrade-Insecure-Requests': '1',
+    # Referer might help sometimes, but can be omitted
+    # 'Referer': 'https://medium.com/',
+}
+
+# Rate limiting state shared by all fetch workers
+RETRYABLE_STATUS_CODES = (429, 503)
+_host_buckets = {} # host -> TokenBucket
+_host_buckets_lock = threading.Lock()
+_fetch_semaphore = None # Global cap on concurrent article requests, created on first use
+
+# Module-level pooled session, shared by all article fetches (see _get_session)
+_session = None
+_session_lock = threading.Lock()
+_cookie_mtime = None # mtime of the cookie file when its cookies were loaded into the session
+
+def _create_session(fetch_conf):
+    """Creates a requests session with pooled connections, default headers and proxies."""
+    session = requests.Session()
+    pool_connections = fetch_conf.get('pool_connections', 4) # Number of hosts to keep pools for
+    pool_maxsize = fetch_conf.get('pool_maxsize', 10) # Connections kept alive per host
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(DEFAULT_HEADERS)
+
+    proxy = fetch_conf.get('proxy') # Get proxy setting
+    if proxy:
+        session.proxies.update({
+            'http': proxy,
+            'https': proxy
+        })
+        logger.info(f"Using proxy for fetching: {proxy}")
+    logger.debug(f"Created pooled HTTP session (pool_connections={pool_connections}, pool_maxsize={pool_maxsize})")
+    return session
+
+def _get_session():
+    """Returns the shared session, (re)loading its cookie jar when the cookie file changed.
+
+    Returns None if the cookie file cannot be parsed.
+    """
+    global _session, _cookie_mtime
+    fetch_conf = config.get('fetch_config', {})
+    cookie_file = fetch_conf.get('cookie_file')
+
+    with _session_lock:
+        try:
+            cookie_mtime = os.path.getmtime(cookie_file)
+        except OSError:
+            cookie_mtime = None # Missing file; parse_netscape_cookie_file logs the error
+
+        if _session is not None and cookie_mtime is not None and cookie_mtime == _cookie_mtime:
+            return _session # Cookies unchanged since they were loaded
+
+        # Parse cookies from Netscape format file
+        cookies_dict = parse_netscape_cookie_file(cookie_file)
+        if cookies_dict is None:
+            logger.error(f"Could not parse cookies from {cookie_file}. Cannot proceed with authenticated fetching.")
+            return None # Critical error if cookies cannot be parsed
+        if not cookies_dict:
+             logger.warning(f"Could not load any cookies from {cookie_file}. Fetching might fail or hit paywalls.")
+             # Still continue, maybe some articles are public
+
+        if _session is None:
+            _session = _create_session(fetch_conf)
+        else:
+            logger.info(f"Cookie file {cookie_file} changed on disk. Reloading cookies.")
+        _session.cookies.clear()
+        _session.cookies.update(cookies_dict)
+        _cookie_mtime = cookie_mtime
+        return _session
+
+def _get_host_bucket(host, fetch_conf):
+    """Returns the token bucket limiting the request rate to one host."""
+    with _host_buckets_lock:
+        bucket = _host_buckets.get(host)
+        if bucket is None:
+            rate_conf = fetch_conf.get('rate_limit', {})
+            bucket = TokenBucket(rate_conf.get('requests_per_second', 1.0), rate_conf.get('burst', 3))
+            _host_buckets[host] = bucket
+        return bucket
+
+def _get_fetch_semaphore(fetch_conf):
+    """Returns the semaphore capping the number of article requests in flight across all hosts."""
+    global _fetch_semaphore
+    with _host_buckets_lock:
+        if _fetch_semaphore is None:
+            _fetch_semaphore = threading.BoundedSemaphore(max(1, int(fetch_conf.get('max_concurrent_fetches', 1))))
+        return _fetch_semaphore
+
+def _get_with_backoff(session, url, timeout, fetch_conf):
+    """GETs a URL under the per-host rate limit, retrying on 429/503 with backoff.
+
+    Honors the Retry-After header when present; otherwise waits backoff_base_seconds * 2^attempt.
+    The whole host is paused for that time, so other workers slow down as well. Returns the
+    last response, which may still be a 429/503 if all retries were used up.
+    """
+    rate_conf = fetch_conf.get('rate_limit', {})
+    max_retries = rate_conf.get('max_retries', 3)
+    backoff_base = rate_conf.get('backoff_base_seconds', 2)
+    max_retry_after = rate_conf.get('max_retry_after_seconds', 120)
+    bucket = _get_host_bucket(urlparse(url).netloc.lower(), fetch_conf)
+
+    attempt = 0
+    while True:
+        bucket.acquire()
+        with _get_fetch_semaphore(fetch_conf):
+            response = session.get(
+                url,
+                timeout=timeout,
+                allow_redirects=True # Allow redirects
+            )
+        if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= max_retries:
+            return response
+
+        delay = parse_retry_after(response.headers.get('Retry-After'))
+        if delay is None:
+            delay = backoff_base * (2 ** attempt)
+        delay = min(delay, max_retry_after)
+        attempt += 1
+        logger.warning(f"Received HTTP {response.status_code} for {url}. Backing off {delay:.1f}s before retry {attempt}/{max_retries}.")
+        bucket.pause(delay) # Slow down every worker talking to this host, not just this one
+        response.close()
+
+def _warn_if_paywalled(url, html_content):
+    """Logs a warning if the fetched page looks like Medium's paywall instead of the full article."""
+    # Basic paywall check (very heuristic, might need improvement)
+    # Look for common phrases indicating member-only content when *not* logged in properly
+    # This check might need adjustment based on Medium's current wording
+    if "Member-only story" in html_content and "Upgrade" in html_content and "membership" in html_content:
+         # If possible, check for presence of user-specific elements (hard without knowing structure)
+         # For now, log a warning if common paywall hints are seen
+         logger.warning(f"Potentially encountered a paywall for {url}. Cookies might be invalid/expired or lack permissions.")
+         # Consider returning None or a specific marker if paywall is strongly suspected
+
 def fetch_full_article_content(url):
     """Fetches the full HTML content of an article using cookies."""
     fetch_conf = config.get('fetch_config', {})
     cookie_file = fetch_conf.get('cookie_file')
     timeout = fetch_conf.get('fetch_timeout', 30)
-    proxy = fetch_conf.get('proxy') # Get proxy setting
     # use_newspaper = fetch_conf.get('use_newspaper_fallback', False) and NEWSPAPER_AVAILABLE
     use_newspaper = False # Keep it simple
 
@@ -25,79 +176,154 @@ def fetch_full_article_content(url):
         logger.error("Cookie file path not configured in fetch_config. Cannot fetch full content.")
         return None
 
-    # Parse cookies from Netscape format file
+    session = _get_session()
+    if session is None:
+        return None
+
+    logger.debug(f"Attempting to fetch full content for URL: {url}")
+    try:
+        response = _get_with_backoff(session, url, timeout, fetch_conf)
+        response.raise_for_status() # Check for HTTP errors (4xx, 5xx)
+
+        html_content = response.text
+        _warn_if_paywalled(url, html_content)
+        logger.info(f"Successfully fetched HTML content for URL: {url} (Size: {len(html_content)} bytes)")
+        return html_content # Return the full HTML
+
+    except requests.exceptions.Timeout:
+        logger.error(f"Timeout error fetching full content for {url} after {timeout} seconds.")
+    except requests.exceptions.HTTPError as e:
+        logger.error(f"HTTP error fetching full content for {url}: {e.response.status_code} {e.response.reason}")
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Network error fetching full content for {url}: {e}")
+    except Exception as e:
+         logger.error(f"Unexpected error during full content fetch for {url}: {e}", exc_info=True)
+
+    return None # Return None on any failure
+
+def create_async_http_client():
+    """Creates an httpx.AsyncClient with the Medium cookies, browser headers and proxy for async fetching.
+
+    Returns None if the cookie file cannot be parsed.
+    """
+    fetch_conf = config.get('fetch_config', {})
+    cookie_file = fetch_conf.get('cookie_file')
+    if not cookie_file:
+        logger.error("Cookie file path not configured in fetch_config. Cannot fetch full content.")
+        return None
     cookies_dict = parse_netscape_cookie_file(cookie_file)
     if cookies_dict is None:
         logger.error(f"Could not parse cookies from {cookie_file}. Cannot proceed with authenticated fetching.")
-        return None # Critical error if cookies cannot be parsed
+        return None
     if not cookies_dict:
          logger.warning(f"Could not load any cookies from {cookie_file}. Fetching might fail or hit paywalls.")
-         # Still continue, maybe some articles are public
 
-    # Prepare proxies dictionary if proxy is set
-    proxies = None
+    client_params = {
+        'headers': DEFAULT_HEADERS,
+        'cookies': cookies_dict,
+        'timeout': fetch_conf.get('fetch_timeout', 30),
+        'follow_redirects': True, # Allow redirects
+        'limits': httpx.Limits(max_keepalive_connections=fetch_conf.get('pool_maxsize', 10)),
+    }
+    proxy = fetch_conf.get('proxy')
     if proxy:
-        proxies = {
-            'http': proxy,
-            'https': proxy
-        }
+        client_params['proxy'] = proxy
         logger.info(f"Using proxy for fetching: {proxy}")
+    return httpx.AsyncClient(**client_params)
 
-    headers = {
-        # Use a realistic User-Agent
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'DNT': '1', # Do Not Track
-        'Upgrade-Insecure-Requests': '1',
-        # Referer might help sometimes, but can be omitted
-        # 'Referer': 'https://medium.com/',
-    }
+async def _aget_with_backoff(http_client, url, fetch_conf):
+    """Async variant of _get_with_backoff(); the global concurrency cap is the async engine's fetch semaphore."""
+    rate_conf = fetch_conf.get('rate_limit', {})
+    max_retries = rate_conf.get('max_retries', 3)
+    backoff_base = rate_conf.get('backoff_base_seconds', 2)
+    max_retry_after = rate_conf.get('max_retry_after_seconds', 120)
+    bucket = _get_host_bucket(urlparse(url).netloc.lower(), fetch_conf)
+
+    attempt = 0
+    while True:
+        await bucket.acquire_async()
+        response = await http_client.get(url)
+        if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= max_retries:
+            return response
+
+        delay = parse_retry_after(response.headers.get('Retry-After'))
+        if delay is None:
+            delay = backoff_base * (2 ** attempt)
+        delay = min(delay, max_retry_after)
+        attempt += 1
+        logger.warning(f"Received HTTP {response.status_code} for {url}. Backing off {delay:.1f}s before retry {attempt}/{max_retries}.")
+        bucket.pause(delay)
 
+async def afetch_full_article_content(url, http_client):
+    """Async variant of fetch_full_article_content(), using a client from create_async_http_client()."""
+    if http_client is None:
+        logger.error("No async HTTP client available (see earlier cookie errors). Cannot fetch full content.")
+        return None
+    fetch_conf = config.get('fetch_config', {})
+    timeout = fetch_conf.get('fetch_timeout', 30)
     logger.debug(f"Attempting to fetch full content for URL: {url}")
     try:
-        response = requests.get(
-            url,
-            headers=headers,
-            cookies=cookies_dict, # requests library handles dict format
-            timeout=timeout,
-            allow_redirects=True, # Allow redirects
-            proxies=proxies # Add proxies here
-        )
+        response = await _aget_with_backoff(http_client, url, fetch_conf)
         response.raise_for_status() # Check for HTTP errors (4xx, 5xx)
-
-        # Basic paywall check (very heuristic, might need improvement)
-        # Look for common phrases indicating member-only content when *not* logged in properly
-        # This check might need adjustment based on Medium's current wording
         html_content = response.text
-        if "Member-only story" in html_content and "Upgrade" in html_content and "membership" in html_content:
-             # If possible, check for presence of user-specific elements (hard without knowing structure)
-             # For now, log a warning if common paywall hints are seen
-             logger.warning(f"Potentially encountered a paywall for {url}. Cookies might be invalid/expired or lack permissions.")
-             # Consider returning None or a specific marker if paywall is strongly suspected
-
+        _warn_if_paywalled(url, html_content)
         logger.info(f"Successfully fetched HTML content for URL: {url} (Size: {len(html_content)} bytes)")
-        return html_content # Return the full HTML
-
-    except requests.exceptions.Timeout:
+        return html_content
+    except httpx.TimeoutException:
         logger.error(f"Timeout error fetching full content for {url} after {timeout} seconds.")
-    except requests.exceptions.HTTPError as e:
-        logger.error(f"HTTP error fetching full content for {url}: {e.response.status_code} {e.response.reason}")
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPStatusError as e:
+        logger.error(f"HTTP error fetching full content for {url}: {e.response.status_code} {e.response.reason_phrase}")
+    except httpx.HTTPError as e:
         logger.error(f"Network error fetching full content for {url}: {e}")
     except Exception as e:
          logger.error(f"Unexpected error during full content fetch for {url}: {e}", exc_info=True)
+    return None
 
-    return None # Return None on any failure
+def get_and_extract_article_text(url, reuse_artifacts=True):
+    """Fetches HTML and extracts the main text content.
+
+    With reuse_artifacts, HTML kept in the artifact store by an earlier attempt is
+    used instead of fetching the article again.
+    """
+    stored_text, html_content = _load_stored_article(url) if reuse_artifacts else (None, None)
+    if stored_text:
+        return stored_text
 
-def get_and_extract_article_text(url):
-    """Fetches HTML and extracts the main text content."""
-    html_content = fetch_full_article_content(url)
     if not html_content:
-        logger.error(f"Failed to fetch HTML for {url}, cannot extract text.")
-        return None
+        html_content = fetch_full_article_content(url)
+        if not html_content:
+            logger.error(f"Failed to fetch HTML for {url}, cannot extract text.")
+            return None
+        artifact_store.save_artifact(url, 'raw_html', html_content)
+    return _extract_and_store(url, html_content)
+
+async def aget_and_extract_article_text(url, http_client, reuse_artifacts=True):
+    """Async variant of get_and_extract_article_text(). Artifact store access and extraction run in worker threads."""
+    stored_text, html_content = await asyncio.to_thread(_load_stored_article, url) if reuse_artifacts else (None, None)
+    if stored_text:
+        return stored_text
+
+    if not html_content:
+        html_content = await afetch_full_article_content(url, http_client)
+        if not html_content:
+            logger.error(f"Failed to fetch HTML for {url}, cannot extract text.")
+            return None
+        await asyncio.to_thread(artifact_store.save_artifact, url, 'raw_html', html_content)
+    return await asyncio.to_thread(_extract_and_store, url, html_content)
 
+def _load_stored_article(url):
+    """Returns (extracted_html, raw_html) kept in the artifact store by an earlier attempt; either may be None."""
+    stored_text = artifact_store.load_artifact(url, 'extracted_html')
+    if stored_text:
+        logger.info(f"Reusing stored extracted HTML for: {url} (Approx. size: {len(stored_text)} chars)")
+        return _compact_if_enabled(url, stored_text), None
+    html_content = artifact_store.load_artifact(url, 'raw_html')
+    if html_content:
+        logger.info(f"Reusing stored raw HTML for: {url}")
+    return None, html_content
+
+def _extract_and_store(url, html_content):
+    """Extracts the main content from fetched HTML and keeps it in the artifact store."""
     extracted_text = extract_main_content_from_html(html_content, url)
 
     # --- Optional Newspaper3k fallback --- #
@@ -122,5 +348,33 @@ def get_and_extract_article_text(url):
         logger.error(f"Failed to extract main text content for {url} after trying main method.")
         return None
 
+    artifact_store.save_artifact(url, 'extracted_html', extracted_text)
     logger.info(f"Successfully extracted main text content for: {url} (Approx. size: {len(extracted_text)} chars)")
-    return extracted_text 
\ No newline at end of file
+    return _compact_if_enabled(url, extracted_text)
+
+def _compact_if_enabled(url, extracted_text):
+    """Returns the copy of the extracted HTML the models see: compacted if fetch_config.compact_html is set.
+
+    The artifact store keeps the full extraction, so turning compaction off later doesn't need a refetch.
+    """
+    if not config.get('fetch_config', {}).get('compact_html', False):
+        return extracted_text
+    original_size = len(extracted_text)
+    compacted_text = compact_html(extracted_text)
+    if original_size:
+        logger.info(f"Compacted HTML for {url}: {original_size} -> {len(compacted_text)} chars ({100 - len(compacted_text) * 100 // original_size}% smaller)")
+    return compacted_text
+
+def get_and_extract_articles_parallel(urls):
+    """Fetches and extracts several articles with a worker pool. Returns a dict of url -> extracted HTML (None on failure).
+
+    The number of workers is fetch_config.max_concurrent_fetches; per-host request rates are
+    still limited by the token buckets in _get_with_backoff.
+    """
+    urls = list(dict.fromkeys(urls)) # Drop duplicates, keep order
+    if not urls:
+        return {}
+    workers = max(1, min(int(config.get('fetch_config', {}).get('max_concurrent_fetches', 1)), len(urls)))
+    logger.info(f"Fetching {len(urls)} articles with {workers} workers...")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='article_fetch') as executor:
+        return dict(zip(urls, executor.map(get_and_extract_article_text, urls)))
@@ -0,0 +1,146 @@
+import sqlite3
+import logging
+import os
+import re
+import threading
+import time
+import atexit
+from config import config # Import the already loaded config
+import state_manager as sm
+
+logger = logging.getLogger(__name__)
+
+glossary_conf = config.get('glossary', {})
+# Only the 'local' Markdown conversion asks the model for term lists, so only it can use the glossary
+_LOCAL_CONVERSION = str(config.get('ai_filter', {}).get('markdown_conversion', 'ai')).lower() == 'local'
+ENABLED = glossary_conf.get('enabled', False) and _LOCAL_CONVERSION
+if glossary_conf.get('enabled', False) and not _LOCAL_CONVERSION:
+    logger.info("Vocabulary glossary is enabled but ai_filter.markdown_conversion is not 'local'; the glossary is not used.")
+# Stored next to the state database unless configured otherwise
+DB_FILE = glossary_conf.get('db_file') or os.path.join(os.path.dirname(sm.DB_FILE), 'glossary.db')
+
+# Annotated terms are 1-4 words long (see the annotation prompt)
+_MAX_TERM_WORDS = 4
+_WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9'’-]*")
+
+_SELECT_SQL = "SELECT term_key, term, translation FROM glossary WHERE level = ? AND language = ?"
+_UPSERT_SQL = """
+INSERT INTO glossary (term_key, level, language, term, translation, seen_count, created_at, last_seen_at)
+VALUES (?, ?, ?, ?, ?, 1, ?, ?)
+ON CONFLICT(term_key, level, language) DO UPDATE SET
+    seen_count = glossary.seen_count + 1,
+    last_seen_at = excluded.last_seen_at
+"""
+_TOUCH_SQL = "UPDATE glossary SET seen_count = seen_count + 1, last_seen_at = ? WHERE term_key = ? AND level = ? AND language = ?"
+
+_conn = None
+_conn_lock = threading.Lock() # Guards the connection, the in-memory glossaries and the counters
+_glossaries = {} # (level, language) -> {term_key: (term, translation)}, loaded on first use
+_stats = {'reused': 0, 'learned': 0}
+
+def _get_connection():
+    """Returns the glossary database connection, creating the table on first use. Caller must hold _conn_lock."""
+    global _conn
+    if _conn is None:
+        db_dir = os.path.dirname(DB_FILE)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        _conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute("PRAGMA busy_timeout=5000")
+        with _conn:
+            _conn.execute('''
+            CREATE TABLE IF NOT EXISTS glossary (
+                term_key TEXT NOT NULL,     -- Lowercased term with collapsed whitespace
+                level TEXT NOT NULL,        -- english_level the term was judged challenging for
+                language TEXT NOT NULL,     -- annotation_language of the translation
+                term TEXT NOT NULL,         -- Spelling as first returned by the model
+                translation TEXT NOT NULL,
+                seen_count INTEGER NOT NULL DEFAULT 1, -- Articles the term was annotated in
+                created_at REAL NOT NULL,
+                last_seen_at REAL NOT NULL,
+                PRIMARY KEY (term_key, level, language)
+            )''')
+        logger.debug(f"Opened vocabulary glossary at {DB_FILE}")
+    return _conn
+
+def _term_key(term):
+    return ' '.join(term.lower().split())
+
+def _load_locked(level, language):
+    """Returns the in-memory glossary for a level and language, reading it from the database once. Caller holds _conn_lock."""
+    glossary = _glossaries.get((level, language))
+    if glossary is None:
+        rows = _get_connection().execute(_SELECT_SQL, (level, language)).fetchall()
+        glossary = {term_key: (term, translation) for term_key, term, translation in rows}
+        _glossaries[(level, language)] = glossary
+        logger.debug(f"Loaded {len(glossary)} glossary terms for {level} / {language}")
+    return glossary
+
+def lookup_terms(text, level, language):
+    """Returns {term: translation} for the glossary terms that occur in a plain text. Empty if the glossary is off."""
+    if not ENABLED or not text:
+        return {}
+    words = [word.lower() for word in _WORD_PATTERN.findall(text)]
+    now = time.time()
+    with _conn_lock:
+        try:
+            glossary = _load_locked(level, language)
+        except sqlite3.Error as e:
+            logger.error(f"Glossary lookup failed: {e}")
+            return {}
+        if not glossary:
+            return {}
+        found = {}
+        # Match every 1-4 word sequence of the text against the glossary keys
+        for start in range(len(words)):
+            for length in range(1, min(_MAX_TERM_WORDS, len(words) - start) + 1):
+                term_key = ' '.join(words[start:start + length])
+                if term_key in glossary and term_key not in found:
+                    found[term_key] = glossary[term_key]
+        if found:
+            try:
+                with _get_connection() as conn:
+                    conn.executemany(_TOUCH_SQL, [(now, term_key, level, language) for term_key in found])
+            except sqlite3.Error as e:
+                logger.error(f"Glossary update failed: {e}")
+            _stats['reused'] += len(found)
+    return dict(found.values())
+
+def add_terms(annotations, level, language):
+    """Stores newly annotated terms ({term: translation}). Terms already in the glossary keep their translation."""
+    if not ENABLED or not annotations:
+        return
+    now = time.time()
+    rows = []
+    with _conn_lock:
+        try:
+            glossary = _load_locked(level, language)
+            for term, translation in annotations.items():
+                term_key = _term_key(term)
+                if not term_key or len(term_key.split()) > _MAX_TERM_WORDS:
+                    continue
+                if term_key not in glossary:
+                    glossary[term_key] = (term.strip(), translation.strip())
+                    _stats['learned'] += 1
+                rows.append((term_key, level, language, term.strip(), translation.strip(), now, now))
+            with _get_connection() as conn:
+                conn.executemany(_UPSERT_SQL, rows)
+        except sqlite3.Error as e:
+            logger.error(f"Glossary store failed: {e}")
+
+def get_stats():
+    """Returns the numbers of glossary terms reused and learned in this run."""
+    with _conn_lock:
+        return dict(_stats)
+
+def close():
+    """Closes the glossary database connection."""
+    global _conn
+    with _conn_lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+
+atexit.register(close)
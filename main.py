@@ -2,14 +2,30 @@ import logging
 import json # Used to store filter result strings in the database
 import os # Needed for saving locally
 import re # Needed for filename cleanup
+import asyncio # Used by the optional async engine
+import queue # Bounded queues between the stages of the staged pipeline
+import threading
+import contextlib
+import httpx
+from concurrent.futures import ThreadPoolExecutor
 
 # Import project modules
 from config import config # Ensure config is loaded first and logging is set up
-from rss_fetcher import get_articles_from_config_feeds
-from ai_processor import filter_article_with_ai, filter_article_content_with_ai, process_content_with_ai
-from content_fetcher import get_and_extract_article_text
-from api_pusher import push_to_api # Use the pusher again
+from rss_fetcher import get_articles_from_config_feeds, aget_articles_from_config_feeds, get_fetch_stats, commit_feed_cache
+from ai_processor import filter_article_with_ai, filter_articles_with_ai_batch, filter_article_content_with_ai, process_content_with_ai
+from ai_processor import afilter_article_with_ai, afilter_articles_with_ai_batch, afilter_article_content_with_ai, aprocess_content_with_ai, aclose_async_client
+from ai_processor import get_cascade_stats, get_streaming_stats, get_prompt_cache_stats
+from ai_processor import filter_articles_with_batch_job, filter_article_contents_with_batch_job, process_contents_with_batch_job
+from content_fetcher import get_and_extract_article_text, get_and_extract_articles_parallel
+from content_fetcher import aget_and_extract_article_text, create_async_http_client
+from api_pusher import push_to_api, apush_to_api # Use the pusher again
 import state_manager as sm # Use an alias for the state manager
+import artifact_store
+import ai_cache
+import batch_jobs
+import glossary
+import prefilter
+from utils import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -39,24 +55,24 @@ def sanitize_filename(filename):
         sanitized = "untitled" # If empty after cleaning
     return sanitized
 
+def _local_output_path(article_data, base_output_dir):
+    """Returns the path save_to_local() writes an article to."""
+    # Build directory structure similar to API pusher
+    target_subfolder = f"medium/{article_data.get('source_tag', 'uncategorized')}"
+    # Create a safe filename
+    filename = f"{sanitize_filename(article_data.get('title', 'No Title Provided'))}.md"
+    return os.path.join(base_output_dir, target_subfolder, filename)
+
 def save_to_local(article_data, processed_markdown, base_output_dir):
     """Saves the processed Markdown to a local file."""
     try:
         title = article_data.get('title', 'No Title Provided')
-        source_folder_base = article_data.get('source_tag', 'uncategorized')
-
-        # Build directory structure similar to API pusher
-        target_subfolder = f"medium/{source_folder_base}"
-        full_output_dir = os.path.join(base_output_dir, target_subfolder)
+        target_filepath = _local_output_path(article_data, base_output_dir)
+        full_output_dir = os.path.dirname(target_filepath)
 
         # Create directory (if it doesn't exist)
         os.makedirs(full_output_dir, exist_ok=True)
 
-        # Create a safe filename
-        safe_title = sanitize_filename(title)
-        filename = f"{safe_title}.md"
-        target_filepath = os.path.join(full_output_dir, filename)
-
         # Write the file
         with open(target_filepath, 'w', encoding='utf-8') as f:
             f.write(processed_markdown)
@@ -73,18 +89,48 @@ def save_to_local(article_data, processed_markdown, base_output_dir):
 
     return False, None # Return False for any failure
 
-def main():
-    logger.info("--- Starting Medium Personalized Feed Run ---")
-    # Counters
-    passed_stage1_filter_count = 0
-    passed_stage2_filter_count = 0
-    pushed_count = 0 # Counter for successfully pushed via API
-    saved_local_count = 0 # Counter for successfully saved locally
-    filtered_out_stage1_count = 0
-    filtered_out_stage2_count = 0
-    failed_count = 0 # General failures (fetch, AI, output)
-    skipped_processed_count = 0
+# Stage an article resumes at, keyed by the status it was left in by an earlier run
+RESUME_STAGE_BY_STATUS = {
+    'failed_filter_stage1': 'filter_stage1',
+    'passed_filter_stage1': 'fetch',
+    'failed_fetch': 'fetch',
+    'failed_filter_stage2': 'filter_stage2',
+    'passed_filter_stage2': 'process',
+    'failed_ai_processing': 'process',
+    'processed': 'output',
+    'failed_push': 'output',
+    'failed_save_local': 'output',
+}
+
+def _new_job(article_data, stage='filter_stage1', filter_result=None):
+    """Creates the per-article state carried from stage to stage."""
+    return {
+        'article': article_data,
+        'stage': stage,
+        'resumed': stage != 'filter_stage1',
+        'filter_result': filter_result, # Stage 1 result as a JSON string, stored with every status
+        'html': None,
+        'fetch_done': False, # True once a fetch was attempted (possibly by the parallel prefetch)
+        'markdown': None,
+        'regenerating_markdown': False, # True when a resumed output retry has to re-create its Markdown
+        'speculation': None, # Future/task of processing started alongside stage 2 (speculative processing)
+        'speculation_started': False, # True once the async speculative task got past the process limit
+    }
+
+_stats_lock = threading.Lock() # Pipeline workers update the run counters concurrently
+
+def _count(stats, key):
+    """Increments a run summary counter. Safe to call from pipeline worker threads."""
+    with _stats_lock:
+        stats[key] += 1
 
+def _mark(job, status):
+    """Records the job's status in the state database."""
+    article_data = job['article']
+    sm.mark_article_status(article_data['link'], status, article_data['title'], job['filter_result'], article_data)
+
+def _load_run_settings():
+    """Reads the output and AI acceptance settings used by the pipeline stages."""
     # Get output configuration
     output_config = config.get('output', {})
     output_method = output_config.get('method', 'api').lower() # Default to 'api', ensure lowercase
@@ -96,20 +142,6 @@ def main():
         logger.warning(f"Invalid output method '{output_method}' in config. Falling back to 'api'.")
         output_method = 'api' # Fallback to api
 
-    # 1. Get articles from RSS feeds specified in config
-    try:
-        articles = get_articles_from_config_feeds()
-        if not articles:
-            logger.info("No new articles found in the configured feeds.")
-            logger.info("--- Run Finished ---")
-            return
-        total_articles_fetched = len(articles)
-        logger.info(f"Found {total_articles_fetched} unique articles from RSS feeds.")
-    except Exception as e:
-         logger.critical(f"Failed to fetch or parse RSS feeds: {e}", exc_info=True)
-         logger.info("--- Run Terminated Due to Critical Error ---")
-         return
-
     # Get AI filter configuration
     ai_conf = config.get('ai_filter', {})
     accepted_relevance = ai_conf.get('accepted_relevance', ['High', 'Medium'])
@@ -121,144 +153,902 @@ def main():
     accepted_content_quality_raw = ai_conf.get('accepted_content_quality', accepted_quality)
     accepted_content_quality = list(accepted_content_quality_raw) if isinstance(accepted_content_quality_raw, (list, tuple)) else accepted_quality
 
-    # 2. Process each article
-    for article_data in articles:
-        link = article_data['link']
-        title = article_data['title']
-        logger.info(f"[{articles.index(article_data) + 1}/{total_articles_fetched}] Processing article: '{title}' ({link})")
+    return {
+        'output_method': output_method,
+        'local_output_dir': local_output_dir,
+        'accepted_relevance': accepted_relevance,
+        'accepted_quality': accepted_quality,
+        'accepted_content_quality': accepted_content_quality,
+    }
+
+def _load_resumable_jobs():
+    """Builds jobs for articles left in an intermediate or failed state by earlier runs."""
+    resume_conf = config.get('resume', {})
+    if not resume_conf.get('enabled', False):
+        return []
 
-        # 3. Check if article has already been processed (using state manager)
-        if sm.is_article_processed(link):
-            logger.info(f"Skipping already processed article: {link}")
-            skipped_processed_count += 1
+    rows = sm.get_resumable_articles(
+        RESUME_STAGE_BY_STATUS.keys(),
+        max_attempts=resume_conf.get('max_attempts', 3),
+        backoff_base_seconds=resume_conf.get('backoff_base_seconds', 3600),
+        backoff_max_seconds=resume_conf.get('backoff_max_seconds', 86400),
+    )
+    jobs = []
+    for row in rows:
+        article_data = row['article_data']
+        if not article_data:
+            logger.warning(f"Stored article data for {row['url']} is unreadable. Not resuming it.")
             continue
+        jobs.append(_new_job(article_data, RESUME_STAGE_BY_STATUS[row['status']], row['filter_result']))
+        logger.debug(f"Queued {row['url']} for resume at stage '{jobs[-1]['stage']}' (status: {row['status']}, failed attempts: {row['attempts']})")
+    return jobs
 
-        # 4. AI Filter Stage 1 (Based on title/summary)
-        ai_filter_result_stage1 = filter_article_with_ai(article_data)
-        filter_result_stage1_str = json.dumps(ai_filter_result_stage1) if ai_filter_result_stage1 else None
+def _ensure_html(job, stats):
+    """Makes sure the job has the article HTML, fetching it if a resumed job starts after the fetch stage."""
+    if job['html']:
+        return True
+    return _stage_fetch(job, None, stats) is not None
 
-        if not ai_filter_result_stage1:
-            logger.error(f"AI filtering Stage 1 failed for {link}. Skipping article.")
-            sm.mark_article_status(link, 'failed_filter_stage1', title, filter_result_stage1_str)
-            failed_count += 1
-            continue
+def _stage_filter_stage1(job, settings, stats):
+    """AI Filter Stage 1 (Based on title/summary)."""
+    return _apply_filter_stage1(job, filter_article_with_ai(job['article']), settings, stats)
 
-        relevance_s1 = ai_filter_result_stage1.get('relevance')
-        quality_s1 = ai_filter_result_stage1.get('quality_type')
+def _apply_filter_stage1(job, ai_filter_result_stage1, settings, stats):
+    """Records the stage 1 verdict and returns the next stage (None if the job ends here)."""
+    link = job['article']['link']
+    job['filter_result'] = json.dumps(ai_filter_result_stage1) if ai_filter_result_stage1 else None
 
-        if relevance_s1 not in accepted_relevance or quality_s1 not in accepted_quality:
-            logger.info(f"Article rejected by AI filter Stage 1: {link} (Relevance: {relevance_s1}, Quality: {quality_s1})")
-            sm.mark_article_status(link, 'filtered_out_stage1', title, filter_result_stage1_str)
-            filtered_out_stage1_count += 1
-            continue
+    if not ai_filter_result_stage1:
+        logger.error(f"AI filtering Stage 1 failed for {link}. Skipping article.")
+        _mark(job, 'failed_filter_stage1')
+        _count(stats, 'failed')
+        return None
 
-        logger.info(f"Article passed AI filter Stage 1: {link} (Relevance: {relevance_s1}, Quality: {quality_s1})")
-        sm.mark_article_status(link, 'passed_filter_stage1', title, filter_result_stage1_str) # Mark intermediate state
-        passed_stage1_filter_count += 1
-
-        # 5. Fetch full article HTML content
-        full_article_html = get_and_extract_article_text(link) # Now returns HTML
-        if not full_article_html:
-            logger.error(f"Failed to fetch or extract full HTML content for {link}. Skipping.")
-            # Use the result string from stage 1 filter for marking status
-            sm.mark_article_status(link, 'failed_fetch', title, filter_result_stage1_str)
-            failed_count += 1
-            continue
+    relevance_s1 = ai_filter_result_stage1.get('relevance')
+    quality_s1 = ai_filter_result_stage1.get('quality_type')
 
-        # 6. AI Filter Stage 2 (Based on full HTML content)
-        ai_filter_result_stage2 = filter_article_content_with_ai(full_article_html, link)
-        # We might want to store stage 2 results too, but let's keep using stage 1 for now
+    if relevance_s1 not in settings['accepted_relevance'] or quality_s1 not in settings['accepted_quality']:
+        logger.info(f"Article rejected by AI filter Stage 1: {link} (Relevance: {relevance_s1}, Quality: {quality_s1})")
+        _mark(job, 'filtered_out_stage1')
+        _count(stats, 'filtered_out_stage1')
+        return None
 
-        if not ai_filter_result_stage2:
-            logger.error(f"AI filtering Stage 2 (content) failed for {link}. Skipping article.")
-            sm.mark_article_status(link, 'failed_filter_stage2', title, filter_result_stage1_str)
-            failed_count += 1
-            continue
+    logger.info(f"Article passed AI filter Stage 1: {link} (Relevance: {relevance_s1}, Quality: {quality_s1})")
+    _mark(job, 'passed_filter_stage1') # Mark intermediate state
+    _count(stats, 'passed_stage1')
+    return 'fetch'
+
+def _apply_prefilter(jobs, settings, stats):
+    """Rejects new articles the local pre-filter is confident stage 1 would reject, before any AI call.
+
+    Returns the jobs that still need processing.
+    """
+    classifier = prefilter.train(settings['accepted_relevance'], settings['accepted_quality'])
+    if classifier is None:
+        return jobs
+    remaining = []
+    for job in jobs:
+        if job['stage'] == 'filter_stage1':
+            reject, probability = prefilter.should_reject(classifier, job['article'])
+            if reject:
+                logger.info(f"Article rejected by local pre-filter: {job['article']['link']} (pass probability: {probability:.4f})")
+                job['filter_result'] = json.dumps({'prefilter_pass_probability': round(probability, 4)})
+                job['stage'] = None
+                _mark(job, 'filtered_out_prefilter')
+                _count(stats, 'filtered_out_prefilter')
+                continue
+        remaining.append(job)
+    return remaining
+
+def _stage1_batch_size():
+    """Number of articles per batched stage 1 AI call (1 = one call per article)."""
+    return max(1, int(config.get('ai_filter', {}).get('stage1_batch_size', 1)))
+
+def _filter_stage1_in_batches(jobs, settings, stats):
+    """Runs stage 1 for all jobs waiting for it with batched AI calls.
+
+    Each job's stage is advanced to the stage after stage 1, or None if it ended there.
+    """
+    pending = [job for job in jobs if job['stage'] == 'filter_stage1']
+    if not pending:
+        return
+    logger.info(f"Filtering {len(pending)} articles (Stage 1) in batches of up to {_stage1_batch_size()}.")
+    _apply_filter_stage1_results(pending, filter_articles_with_ai_batch([job['article'] for job in pending]), settings, stats)
+
+def _apply_filter_stage1_results(pending, results, settings, stats):
+    """Advances each job by its stage 1 verdict and writes the stage 1 results."""
+    for job, ai_filter_result_stage1 in zip(pending, results):
+        job['stage'] = _apply_filter_stage1(job, ai_filter_result_stage1, settings, stats)
+    sm.flush() # Stage boundary: stage 1 results are written
+
+def _stage_fetch(job, settings, stats):
+    """Fetch full article HTML content."""
+    if not job['fetch_done']:
+        job['html'] = get_and_extract_article_text(job['article']['link']) # Now returns HTML
+        job['fetch_done'] = True
+    return _apply_fetch(job, stats)
+
+def _apply_fetch(job, stats):
+    """Checks the fetched HTML and returns the next stage (None if the job ends here)."""
+    link = job['article']['link']
+    if not job['html']:
+        logger.error(f"Failed to fetch or extract full HTML content for {link}. Skipping.")
+        _mark(job, 'failed_fetch')
+        _count(stats, 'failed')
+        return None
+    return 'filter_stage2'
+
+def _stage_filter_stage2(job, settings, stats):
+    """AI Filter Stage 2 (Based on full HTML content)."""
+    if not _ensure_html(job, stats):
+        return None
+    link = job['article']['link']
+    ai_filter_result_stage2 = _load_stage2_verdict(link)
+    if ai_filter_result_stage2 is None:
+        _start_speculation(job)
+        ai_filter_result_stage2 = filter_article_content_with_ai(job['html'], link)
+        _store_stage2_verdict(link, ai_filter_result_stage2)
+    next_stage = _apply_filter_stage2(job, ai_filter_result_stage2, settings, stats)
+    if next_stage != 'process':
+        _discard_speculation(job)
+    return next_stage
+
+def _load_stage2_verdict(link):
+    """Returns the stage 2 verdict stored by an earlier attempt, or None."""
+    stored_verdict = artifact_store.load_artifact(link, 'stage2_verdict')
+    if not stored_verdict:
+        return None
+    try:
+        ai_filter_result_stage2 = json.loads(stored_verdict)
+    except (json.JSONDecodeError, ValueError) as e:
+        logger.warning(f"Stored Stage 2 verdict for {link} is unreadable ({e}). Filtering it again.")
+        return None
+    logger.info(f"Reusing stored Stage 2 verdict for {link}")
+    return ai_filter_result_stage2
+
+def _store_stage2_verdict(link, ai_filter_result_stage2):
+    """Keeps a fresh stage 2 verdict so a retry of a later stage doesn't ask the model again."""
+    if ai_filter_result_stage2:
+        artifact_store.save_artifact(link, 'stage2_verdict', json.dumps(ai_filter_result_stage2))
+
+def _apply_filter_stage2(job, ai_filter_result_stage2, settings, stats):
+    """Records the stage 2 verdict and returns the next stage (None if the job ends here)."""
+    link = job['article']['link']
+    # The status row keeps the stage 1 result; the stage 2 verdict lives in the artifact store
+
+    if not ai_filter_result_stage2:
+        logger.error(f"AI filtering Stage 2 (content) failed for {link}. Skipping article.")
+        _mark(job, 'failed_filter_stage2')
+        _count(stats, 'failed')
+        return None
+
+    relevance_s2 = ai_filter_result_stage2.get('relevance')
+    quality_s2 = ai_filter_result_stage2.get('quality_type')
+
+    # Use potentially different quality criteria for content stage
+    if relevance_s2 not in settings['accepted_relevance'] or quality_s2 not in settings['accepted_content_quality']:
+        logger.info(f"Article rejected by AI filter Stage 2 (content): {link} (Relevance: {relevance_s2}, Quality: {quality_s2})")
+        _mark(job, 'filtered_out_stage2') # Still use stage 1 result for simplicity
+        _count(stats, 'filtered_out_stage2')
+        return None
+
+    logger.info(f"Article passed AI filter Stage 2 (content): {link} (Relevance: {relevance_s2}, Quality: {quality_s2})")
+    _mark(job, 'passed_filter_stage2') # Mark intermediate state
+    _count(stats, 'passed_stage2')
+    return 'process'
+
+@contextlib.contextmanager
+def _streaming_output(job, settings):
+    """Yields the file a streamed processing response is written to as it arrives, or None to use a temporary file.
+
+    With local output, that is '<output file>.part' next to where the article will be saved, removed once
+    processing is done (the output stage writes the final file).
+    """
+    if settings['output_method'] != 'local' or not config.get('ai_filter', {}).get('streaming', {}).get('enabled', False):
+        yield None
+        return
+    partial_filepath = _local_output_path(job['article'], settings['local_output_dir']) + '.part'
+    try:
+        os.makedirs(os.path.dirname(partial_filepath), exist_ok=True)
+        partial_file = open(partial_filepath, 'w+', encoding='utf-8')
+    except OSError as e:
+        logger.warning(f"Cannot write streamed output to {partial_filepath}: {e}. Using a temporary file.")
+        yield None
+        return
+    try:
+        with partial_file:
+            yield partial_file
+    finally:
+        with contextlib.suppress(OSError):
+            os.remove(partial_filepath)
+
+def _stage_process(job, settings, stats):
+    """AI Content Processing (Markdown and Vocabulary) - Input is still the HTML."""
+    speculation = job['speculation']
+    if speculation is not None:
+        job['speculation'] = None
+        try:
+            processed_markdown = speculation.result()
+        except Exception as e:
+            _speculation_failed(job, e)
+        else:
+            _use_speculation(job)
+            return _apply_process(job, processed_markdown, stats)
+    if not _ensure_html(job, stats):
+        return None
+    with _streaming_output(job, settings) as stream_to:
+        processed_markdown = process_content_with_ai(job['html'], job['article']['link'], stream_to=stream_to)
+    return _apply_process(job, processed_markdown, stats)
+
+def _apply_process(job, processed_markdown, stats):
+    """Keeps the processed Markdown and returns the next stage (None if processing failed)."""
+    link = job['article']['link']
+    if not processed_markdown or processed_markdown.startswith("[Error:") or processed_markdown.startswith("[错误:"): # Check both English and potential leftover Chinese error prefix
+        logger.error(f"AI content processing failed for {link}. Error: {processed_markdown}")
+        _mark(job, 'failed_ai_processing')
+        _count(stats, 'failed')
+        return None # Skip saving/pushing if processing failed
+
+    job['markdown'] = processed_markdown
+    artifact_store.save_artifact(link, 'markdown', processed_markdown)
+    if not job['regenerating_markdown']:
+        _mark(job, 'processed') # Mark as processed before attempting output
+    # else: keep the failed output status, so its attempt counter keeps counting output failures
+    _count(stats, 'processed')
+    return 'output'
+
+def _ensure_markdown(job):
+    """Makes sure the job has its processed Markdown, loading it from the artifact store for resumed jobs."""
+    if job['markdown'] is None:
+        job['markdown'] = artifact_store.load_artifact(job['article']['link'], 'markdown')
+    if job['markdown'] is None:
+        # A resumed job whose Markdown was not stored (or was evicted) has to produce it again first
+        logger.info(f"No processed Markdown available for {job['article']['link']}. Re-running content processing before output.")
+        job['regenerating_markdown'] = True
+        return False
+    return True
+
+def _stage_output(job, settings, stats):
+    """Output Article (API or Local)."""
+    if not _ensure_markdown(job):
+        return 'process'
+
+    article_data = job['article']
+    if settings['output_method'] == 'api':
+        logger.debug(f"Attempting to push article {article_data['link']} to API")
+        output_result = push_to_api(article_data, job['markdown'])
+    else:
+        logger.debug(f"Attempting to save article {article_data['link']} to local directory {settings['local_output_dir']}")
+        output_result, saved_filepath = save_to_local(article_data, job['markdown'], settings['local_output_dir'])
+    return _apply_output(job, output_result, settings, stats)
+
+def _apply_output(job, output_successful, settings, stats):
+    """Records the outcome of the push or local save. The job ends here."""
+    link = job['article']['link']
+    output_method = settings['output_method']
+
+    if output_method == 'api':
+        push_successful = output_successful
+        if push_successful:
+            logger.info(f"Successfully processed and pushed to API: {link}")
+            _mark(job, 'pushed')
+            _count(stats, 'pushed')
+        else:
+            # Error is logged within push_to_api
+            logger.error(f"Failed to push article {link} to API. See previous logs for details.")
+            _mark(job, 'failed_push')
+            _count(stats, 'failed')
+    elif output_method == 'local':
+        save_successful = output_successful
+        if save_successful:
+            # Logger message already inside save_to_local
+            _mark(job, 'saved_local')
+            _count(stats, 'saved_local')
+        else:
+            # Error is logged within save_to_local
+            logger.error(f"Failed to save article {link} locally. See previous logs for details.")
+            _mark(job, 'failed_save_local')
+            _count(stats, 'failed')
+    # else case is already handled by the initial check and fallback
+
+    # Output has side effects outside our control; persist its status now so a crash can't cause a duplicate push
+    sm.flush()
+    return None
+
+# --- Speculative processing (ai_filter.speculative_processing in config.yaml) --- #
+# Articles whose stage 1 relevance is in the configured list start content processing while stage 2 is still
+# judging them. If stage 2 accepts, the processing result is ready sooner; if it rejects, the speculative
+# request is cancelled or its result discarded, and its tokens count against max_wasted_tokens.
+
+_speculation_lock = threading.Lock()
+_speculation_stats = {'started': 0, 'used': 0, 'discarded': 0, 'wasted_tokens': 0, 'capped': False}
+_speculation_executor = None
+
+def _speculation_settings():
+    return config.get('ai_filter', {}).get('speculative_processing', {})
+
+def _should_speculate(job):
+    """True if processing should start alongside stage 2 for this job."""
+    spec_conf = _speculation_settings()
+    if not spec_conf.get('enabled', False) or job['speculation'] is not None:
+        return False
+    try:
+        relevance_s1 = json.loads(job['filter_result'] or '{}').get('relevance')
+    except (json.JSONDecodeError, AttributeError):
+        return False
+    if relevance_s1 not in spec_conf.get('relevance', ['High']):
+        return False
+    max_wasted_tokens = spec_conf.get('max_wasted_tokens')
+    with _speculation_lock:
+        if max_wasted_tokens is not None and _speculation_stats['wasted_tokens'] >= max_wasted_tokens:
+            if not _speculation_stats['capped']:
+                _speculation_stats['capped'] = True
+                logger.warning(f"Speculative processing wasted ~{_speculation_stats['wasted_tokens']} tokens (cap: {max_wasted_tokens}). Disabled for the rest of this run.")
+            return False
+        _speculation_stats['started'] += 1
+    return True
+
+def _start_speculation(job):
+    """Starts content processing in the background if the job qualifies for speculation."""
+    global _speculation_executor
+    if not _should_speculate(job):
+        return
+    with _speculation_lock:
+        if _speculation_executor is None:
+            workers = max(1, int(_speculation_settings().get('max_parallel', 2)))
+            _speculation_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='speculate')
+    logger.info(f"Starting speculative processing for {job['article']['link']} alongside Stage 2")
+    job['speculation'] = _speculation_executor.submit(process_content_with_ai, job['html'], job['article']['link'])
+
+def _record_speculation_waste(link, html, markdown):
+    """Counts the estimated tokens of a discarded speculative request (the prompt, plus the answer if there was one)."""
+    wasted_tokens = estimate_tokens(html) + estimate_tokens(markdown or '')
+    with _speculation_lock:
+        _speculation_stats['discarded'] += 1
+        _speculation_stats['wasted_tokens'] += wasted_tokens
+        total_wasted = _speculation_stats['wasted_tokens']
+    logger.info(f"Discarded speculative processing of {link} (~{wasted_tokens} tokens wasted, ~{total_wasted} this run)")
+
+def _discard_speculation(job):
+    """Cancels the job's speculative processing, or throws its result away once it finishes."""
+    future = job['speculation']
+    if future is None:
+        return
+    job['speculation'] = None
+    link = job['article']['link']
+    if future.cancel():
+        logger.info(f"Cancelled speculative processing of {link} before it started")
+        with _speculation_lock:
+            _speculation_stats['discarded'] += 1
+        return
+    # Already running: a request in flight can't be recalled, so count its cost when it is done
+    html = job['html']
+    future.add_done_callback(lambda done: _record_speculation_waste(link, html, None if done.exception() else done.result()))
+
+def _use_speculation(job):
+    logger.info(f"Using speculative processing result for {job['article']['link']}")
+    with _speculation_lock:
+        _speculation_stats['used'] += 1
 
-        relevance_s2 = ai_filter_result_stage2.get('relevance')
-        quality_s2 = ai_filter_result_stage2.get('quality_type')
+def _speculation_failed(job, error):
+    """Counts a speculative request that raised as waste; the process stage then sends the normal request."""
+    link = job['article']['link']
+    logger.warning(f"Speculative processing of {link} failed: {error}. Processing it again.")
+    _record_speculation_waste(link, job['html'], None)
 
-        # Use potentially different quality criteria for content stage
-        if relevance_s2 not in accepted_relevance or quality_s2 not in accepted_content_quality:
-            logger.info(f"Article rejected by AI filter Stage 2 (content): {link} (Relevance: {relevance_s2}, Quality: {quality_s2})")
-            sm.mark_article_status(link, 'filtered_out_stage2', title, filter_result_stage1_str) # Still use stage 1 result for simplicity
-            filtered_out_stage2_count += 1
+def _wait_for_speculation():
+    """Waits for discarded speculative requests still in flight, so their cost is counted in the summary."""
+    global _speculation_executor
+    if _speculation_executor is not None:
+        _speculation_executor.shutdown(wait=True)
+        _speculation_executor = None
+
+STAGE_HANDLERS = {
+    'filter_stage1': _stage_filter_stage1,
+    'fetch': _stage_fetch,
+    'filter_stage2': _stage_filter_stage2,
+    'process': _stage_process,
+    'output': _stage_output,
+}
+
+# Stages that need the article HTML, so they wait for the parallel fetch
+STAGES_NEEDING_HTML = ('fetch', 'filter_stage2', 'process')
+
+def _run_job(job, settings, stats, pause_before_html=False):
+    """Runs a job from its current stage until it finishes, is rejected or fails.
+
+    With pause_before_html, the job stops before the first stage that needs HTML it does
+    not have yet. Returns True if the job paused there, False once it is done.
+    """
+    stage = job['stage']
+    while stage:
+        job['stage'] = stage
+        if pause_before_html and stage in STAGES_NEEDING_HTML and not job['fetch_done']:
+            return True
+        stage = STAGE_HANDLERS[stage](job, settings, stats)
+    return False
+
+def _log_job_start(index, total, job):
+    resume_note = f" (resuming at stage '{job['stage']}')" if job['resumed'] else ""
+    logger.info(f"[{index}/{total}] Processing article: '{job['article']['title']}' ({job['article']['link']}){resume_note}")
+
+def _run_jobs_with_parallel_fetch(jobs, settings, stats):
+    """Runs the jobs in three phases so article fetching can use a worker pool.
+
+    Stage 1 filtering runs for every job first, then all jobs that need HTML are fetched
+    in parallel, and finally each job continues with its remaining stages.
+    """
+    paused_jobs = []
+    for index, job in enumerate(jobs, start=1):
+        _log_job_start(index, len(jobs), job)
+        if _run_job(job, settings, stats, pause_before_html=True):
+            paused_jobs.append(job)
+    sm.flush() # Stage boundary: stage 1 results are written before the fetch phase
+
+    fetched = get_and_extract_articles_parallel(job['article']['link'] for job in paused_jobs)
+    for job in paused_jobs:
+        job['html'] = fetched.get(job['article']['link'])
+        job['fetch_done'] = True
+
+    for index, job in enumerate(paused_jobs, start=1):
+        logger.info(f"[{index}/{len(paused_jobs)}] Continuing article after fetch: '{job['article']['title']}' ({job['article']['link']})")
+        _run_job(job, settings, stats)
+
+# --- Batch jobs (engine: "batch" in config.yaml) --- #
+# For backfills that don't need interactive latency: each AI stage sends the requests of all its articles as batch
+# jobs and waits for them, then the next stage starts. Results are recorded with the usual statuses, so articles
+# a job could not answer fail their stage and are resumed by a later run.
+
+def _run_jobs_with_batch_jobs(jobs, settings, stats):
+    """Runs the jobs stage by stage: stage 1, a parallel fetch, stage 2 and processing as batch jobs, then the output."""
+    pending = [job for job in jobs if job['stage'] == 'filter_stage1']
+    if pending:
+        logger.info(f"Filtering {len(pending)} articles (Stage 1) with a batch job.")
+        _apply_filter_stage1_results(pending, filter_articles_with_batch_job([job['article'] for job in pending]), settings, stats)
+
+    needing_html = [job for job in jobs if job['stage'] in STAGES_NEEDING_HTML]
+    fetched = get_and_extract_articles_parallel(job['article']['link'] for job in needing_html)
+    for job in needing_html:
+        job['html'] = fetched.get(job['article']['link'])
+        job['fetch_done'] = True
+        if job['stage'] == 'fetch' or not job['html']:
+            job['stage'] = _apply_fetch(job, stats)
+
+    pending = [job for job in jobs if job['stage'] == 'filter_stage2']
+    verdicts = [_load_stage2_verdict(job['article']['link']) for job in pending]
+    unjudged = [position for position, verdict in enumerate(verdicts) if verdict is None]
+    if unjudged:
+        logger.info(f"Filtering {len(unjudged)} articles (Stage 2) with a batch job.")
+        items = [(pending[position]['html'], pending[position]['article']['link']) for position in unjudged]
+        for position, ai_filter_result_stage2 in zip(unjudged, filter_article_contents_with_batch_job(items)):
+            _store_stage2_verdict(pending[position]['article']['link'], ai_filter_result_stage2)
+            verdicts[position] = ai_filter_result_stage2
+    for job, ai_filter_result_stage2 in zip(pending, verdicts):
+        job['stage'] = _apply_filter_stage2(job, ai_filter_result_stage2, settings, stats)
+    sm.flush() # Stage boundary: stage 2 results are written
+
+    pending = [job for job in jobs if job['stage'] == 'process']
+    if pending:
+        logger.info(f"Processing {len(pending)} articles with a batch job.")
+        items = [(job['html'], job['article']['link']) for job in pending]
+        for job, processed_markdown in zip(pending, process_contents_with_batch_job(items)):
+            job['stage'] = _apply_process(job, processed_markdown, stats)
+        sm.flush() # Stage boundary: processing results are written
+
+    remaining_jobs = [job for job in jobs if job['stage']]
+    for index, job in enumerate(remaining_jobs, start=1):
+        _log_job_start(index, len(remaining_jobs), job)
+        _run_job(job, settings, stats)
+
+# --- Staged pipeline (engine: "pipeline" in config.yaml) --- #
+# Every stage has its own worker threads and a bounded queue in front of it, so a slow stage (AI processing)
+# only holds up the stages before it once its queue is full, instead of blocking every article behind it.
+
+PIPELINE_STAGES = ('filter_stage1', 'fetch', 'filter_stage2', 'process', 'output')
+
+# Default worker threads per stage, overridable in the pipeline config section
+PIPELINE_WORKERS = {
+    'filter_stage1': 4,
+    'fetch': 4,
+    'filter_stage2': 2,
+    'process': 2,
+    'output': 1,
+}
+
+_PIPELINE_DONE = object() # Queue sentinel telling a worker to exit
+
+def _pipeline_worker(stage, queues, settings, stats):
+    """Takes jobs from the stage's queue, runs the stage and hands each job on to the queue of its next stage."""
+    stage_queue = queues[stage]
+    while True:
+        job = stage_queue.get()
+        if job is _PIPELINE_DONE:
+            return
+        try:
+            job['stage'] = stage
+            next_stage = STAGE_HANDLERS[stage](job, settings, stats)
+            if next_stage and PIPELINE_STAGES.index(next_stage) <= PIPELINE_STAGES.index(stage):
+                # Going back (a resumed output job re-creating its Markdown) could deadlock on full queues,
+                # so this worker finishes the job itself
+                job['stage'] = next_stage
+                _run_job(job, settings, stats)
+            elif next_stage:
+                queues[next_stage].put(job) # Blocks while the next stage is saturated (backpressure)
+        except Exception as e:
+            # Keep one broken article from taking down the worker
+            logger.error(f"Unexpected error at stage '{job['stage']}' for {job['article']['link']}: {e}", exc_info=True)
+            _count(stats, 'failed')
+
+def _pipeline_stage1_batch_worker(queues, settings, stats, batch_size):
+    """Stage 1 worker for batched filtering: takes up to batch_size waiting jobs per AI call."""
+    stage_queue = queues['filter_stage1']
+    done = False
+    while not done:
+        batch = [stage_queue.get()]
+        while batch[-1] is not _PIPELINE_DONE and len(batch) < batch_size:
+            try:
+                batch.append(stage_queue.get_nowait())
+            except queue.Empty:
+                break # Don't wait for a full batch, the jobs already taken would stall
+        if batch[-1] is _PIPELINE_DONE:
+            batch.pop()
+            done = True
+        if not batch:
             continue
+        try:
+            results = filter_articles_with_ai_batch([job['article'] for job in batch])
+            for job, ai_filter_result_stage1 in zip(batch, results):
+                next_stage = _apply_filter_stage1(job, ai_filter_result_stage1, settings, stats)
+                if next_stage:
+                    queues[next_stage].put(job)
+        except Exception as e:
+            logger.error(f"Unexpected error at stage 'filter_stage1' for a batch of {len(batch)} articles: {e}", exc_info=True)
+            for _ in batch:
+                _count(stats, 'failed')
+
+def _run_jobs_in_pipeline(jobs, settings, stats):
+    """Runs the jobs through the staged pipeline and returns once every job is finished."""
+    pipeline_conf = config.get('pipeline', {})
+    queue_size = max(1, int(pipeline_conf.get('queue_size', 20)))
+    workers_conf = pipeline_conf.get('workers', {})
+    worker_counts = {stage: max(1, int(workers_conf.get(stage, default))) for stage, default in PIPELINE_WORKERS.items()}
+    logger.info(f"Running {len(jobs)} articles through the staged pipeline (workers: {worker_counts}, queue size: {queue_size})")
+
+    queues = {stage: queue.Queue(maxsize=queue_size) for stage in PIPELINE_STAGES}
+    batch_size = _stage1_batch_size()
+    workers = {}
+    for stage in PIPELINE_STAGES:
+        if stage == 'filter_stage1' and batch_size > 1:
+            target, args = _pipeline_stage1_batch_worker, (queues, settings, stats, batch_size)
+        else:
+            target, args = _pipeline_worker, (stage, queues, settings, stats)
+        workers[stage] = [threading.Thread(target=target, args=args, name=f"pipeline-{stage}-{i + 1}", daemon=True)
+                          for i in range(worker_counts[stage])]
+        for worker in workers[stage]:
+            worker.start()
+
+    for index, job in enumerate(jobs, start=1):
+        _log_job_start(index, len(jobs), job)
+        queues[job['stage']].put(job) # Resumed jobs enter at the stage they left off
+
+    # Stages only hand jobs forward, so once a stage's workers have exited its successor gets no more input
+    for stage in PIPELINE_STAGES:
+        for _ in workers[stage]:
+            queues[stage].put(_PIPELINE_DONE)
+        for worker in workers[stage]:
+            worker.join()
+        if stage == 'filter_stage1':
+            sm.flush() # Stage boundary: all stage 1 results are written
+
+# --- Async engine (engine: "async" in config.yaml) --- #
+# Each stage calls the async variant of its network function and then shares the _apply_* logic above; the
+# _apply_* steps and other state database / artifact store access run in worker threads to keep the loop free.
+# Every job runs as its own task; the per-stage semaphores bound how many are inside a stage at once.
+
+# Default concurrency per stage, overridable in the async_engine config section
+ASYNC_STAGE_LIMITS = {
+    'feed_fetch': 8,
+    'content_fetch': 4,
+    'filter_stage1': 8,
+    'filter_stage2': 4,
+    'process': 2,
+    'output': 4,
+}
+
+async def _aensure_html(job, stats, runtime):
+    """Async variant of _ensure_html()."""
+    if job['html']:
+        return True
+    return await _astage_fetch(job, None, stats, runtime) is not None
+
+async def _astage_filter_stage1(job, settings, stats, runtime):
+    async with runtime['limits']['filter_stage1']:
+        ai_filter_result_stage1 = await afilter_article_with_ai(job['article'])
+    return await asyncio.to_thread(_apply_filter_stage1, job, ai_filter_result_stage1, settings, stats)
+
+async def _astage_fetch(job, settings, stats, runtime):
+    if not job['fetch_done']:
+        async with runtime['limits']['content_fetch']:
+            job['html'] = await aget_and_extract_article_text(job['article']['link'], runtime['article_client'])
+        job['fetch_done'] = True
+    return await asyncio.to_thread(_apply_fetch, job, stats)
+
+async def _astage_filter_stage2(job, settings, stats, runtime):
+    if not await _aensure_html(job, stats, runtime):
+        return None
+    link = job['article']['link']
+    ai_filter_result_stage2 = await asyncio.to_thread(_load_stage2_verdict, link)
+    if ai_filter_result_stage2 is None:
+        if _should_speculate(job):
+            logger.info(f"Starting speculative processing for {link} alongside Stage 2")
+            job['speculation'] = asyncio.create_task(_aspeculate(job, runtime))
+        async with runtime['limits']['filter_stage2']:
+            ai_filter_result_stage2 = await afilter_article_content_with_ai(job['html'], link)
+        await asyncio.to_thread(_store_stage2_verdict, link, ai_filter_result_stage2)
+    next_stage = await asyncio.to_thread(_apply_filter_stage2, job, ai_filter_result_stage2, settings, stats)
+    if next_stage != 'process':
+        _adiscard_speculation(job)
+    return next_stage
 
-        logger.info(f"Article passed AI filter Stage 2 (content): {link} (Relevance: {relevance_s2}, Quality: {quality_s2})")
-        sm.mark_article_status(link, 'passed_filter_stage2', title, filter_result_stage1_str) # Mark intermediate state
-        passed_stage2_filter_count += 1
-
-        # 7. AI Content Processing (Markdown and Vocabulary) - Input is still the HTML
-        processed_markdown = process_content_with_ai(full_article_html, link)
-        if not processed_markdown or processed_markdown.startswith("[Error:") or processed_markdown.startswith("[错误:"): # Check both English and potential leftover Chinese error prefix
-             logger.error(f"AI content processing failed for {link}. Error: {processed_markdown}")
-             sm.mark_article_status(link, 'failed_ai_processing', title, filter_result_stage1_str)
-             failed_count += 1
-             continue # Skip saving/pushing if processing failed
-
-        sm.mark_article_status(link, 'processed', title, filter_result_stage1_str) # Mark as processed before attempting output
-
-        # 8. Output Article (API or Local)
-        output_successful = False
-        output_target = None # Can store API response details or local filepath
-
-        if output_method == 'api':
-            logger.debug(f"Attempting to push article {link} to API")
-            push_successful = push_to_api(article_data, processed_markdown)
-            if push_successful:
-                output_successful = True
-                output_target = "API" # Or capture filename from API response if needed later
-                logger.info(f"Successfully processed and pushed to API: {link}")
-                sm.mark_article_status(link, 'pushed', title, filter_result_stage1_str)
-                pushed_count += 1
-            else:
-                # Error is logged within push_to_api
-                logger.error(f"Failed to push article {link} to API. See previous logs for details.")
-                sm.mark_article_status(link, 'failed_push', title, filter_result_stage1_str)
-                failed_count += 1
-        elif output_method == 'local':
-            logger.debug(f"Attempting to save article {link} to local directory {local_output_dir}")
-            save_successful, saved_filepath = save_to_local(article_data, processed_markdown, local_output_dir)
-            if save_successful:
-                output_successful = True
-                output_target = saved_filepath
-                # Logger message already inside save_to_local
-                sm.mark_article_status(link, 'saved_local', title, filter_result_stage1_str)
-                saved_local_count += 1
-            else:
-                # Error is logged within save_to_local
-                logger.error(f"Failed to save article {link} locally. See previous logs for details.")
-                sm.mark_article_status(link, 'failed_save_local', title, filter_result_stage1_str)
-                failed_count += 1
-        # else case is already handled by the initial check and fallback
+async def _aspeculate(job, runtime):
+    """Speculative processing task of the async engine; it shares the process stage limit."""
+    async with runtime['limits']['process']:
+        job['speculation_started'] = True
+        return await aprocess_content_with_ai(job['html'], job['article']['link'])
+
+def _adiscard_speculation(job):
+    """Async variant of _discard_speculation(). Unlike a worker thread, a task can be cancelled mid-request."""
+    task = job['speculation']
+    if task is None:
+        return
+    job['speculation'] = None
+    link = job['article']['link']
+    if task.done():
+        _record_speculation_waste(link, job['html'], None if task.cancelled() or task.exception() else task.result())
+        return
+    task.cancel()
+    if job['speculation_started']:
+        _record_speculation_waste(link, job['html'], None) # The prompt may already have been billed
+    else:
+        logger.info(f"Cancelled speculative processing of {link} before it started")
+        with _speculation_lock:
+            _speculation_stats['discarded'] += 1
+
+async def _astage_process(job, settings, stats, runtime):
+    speculation = job['speculation']
+    if speculation is not None:
+        job['speculation'] = None
+        try:
+            processed_markdown = await speculation
+        except Exception as e:
+            _speculation_failed(job, e)
+        else:
+            _use_speculation(job)
+            return await asyncio.to_thread(_apply_process, job, processed_markdown, stats)
+    if not await _aensure_html(job, stats, runtime):
+        return None
+    async with runtime['limits']['process']:
+        with _streaming_output(job, settings) as stream_to:
+            processed_markdown = await aprocess_content_with_ai(job['html'], job['article']['link'], stream_to=stream_to)
+    return await asyncio.to_thread(_apply_process, job, processed_markdown, stats)
+
+async def _astage_output(job, settings, stats, runtime):
+    if not await asyncio.to_thread(_ensure_markdown, job):
+        return 'process'
+
+    article_data = job['article']
+    async with runtime['limits']['output']:
+        if settings['output_method'] == 'api':
+            logger.debug(f"Attempting to push article {article_data['link']} to API")
+            output_result = await apush_to_api(article_data, job['markdown'], runtime['push_client'])
+        else:
+            logger.debug(f"Attempting to save article {article_data['link']} to local directory {settings['local_output_dir']}")
+            output_result, saved_filepath = await asyncio.to_thread(save_to_local, article_data, job['markdown'], settings['local_output_dir'])
+    return await asyncio.to_thread(_apply_output, job, output_result, settings, stats)
+
+ASYNC_STAGE_HANDLERS = {
+    'filter_stage1': _astage_filter_stage1,
+    'fetch': _astage_fetch,
+    'filter_stage2': _astage_filter_stage2,
+    'process': _astage_process,
+    'output': _astage_output,
+}
+
+async def _afilter_stage1_in_batches(jobs, settings, stats, runtime):
+    """Async variant of _filter_stage1_in_batches(). Batches run concurrently, bounded by the filter_stage1 limit."""
+    pending = [job for job in jobs if job['stage'] == 'filter_stage1']
+    if not pending:
+        return
+    logger.info(f"Filtering {len(pending)} articles (Stage 1) in batches of up to {_stage1_batch_size()}.")
+    results = await afilter_articles_with_ai_batch([job['article'] for job in pending], runtime['limits']['filter_stage1'])
+    await asyncio.to_thread(_apply_filter_stage1_results, pending, results, settings, stats)
+
+async def _arun_job(index, total, job, settings, stats, runtime):
+    """Async variant of _run_job()."""
+    _log_job_start(index, total, job)
+    stage = job['stage']
+    try:
+        while stage:
+            job['stage'] = stage
+            stage = await ASYNC_STAGE_HANDLERS[stage](job, settings, stats, runtime)
+    except Exception as e:
+        # Keep one broken article from cancelling every other task of the run
+        logger.error(f"Unexpected error at stage '{job['stage']}' for {job['article']['link']}: {e}", exc_info=True)
+        _count(stats, 'failed')
+        _adiscard_speculation(job)
+
+def _async_stage_limits():
+    """Returns the per-stage concurrency limits from the async_engine config section."""
+    engine_conf = config.get('async_engine', {})
+    return {stage: max(1, int(engine_conf.get(stage, default))) for stage, default in ASYNC_STAGE_LIMITS.items()}
+
+async def _afetch_articles():
+    """Fetches the configured feeds concurrently and returns the new articles."""
+    feed_timeout = config.get('feed_config', {}).get('timeout', 30)
+    limits = httpx.Limits(max_connections=_async_stage_limits()['feed_fetch'])
+    async with httpx.AsyncClient(timeout=feed_timeout, follow_redirects=True, limits=limits) as http_client:
+        return await aget_articles_from_config_feeds(http_client, skip_processed=True)
+
+async def _arun_jobs(jobs, settings, stats):
+    """Runs all jobs concurrently on one event loop, bounded by the per-stage semaphores."""
+    stage_limits = _async_stage_limits()
+    logger.info(f"Running {len(jobs)} articles with the async engine (stage limits: {stage_limits})")
+    runtime = {
+        'limits': {stage: asyncio.Semaphore(limit) for stage, limit in stage_limits.items()},
+        'article_client': create_async_http_client(),
+        'push_client': httpx.AsyncClient(follow_redirects=True) if settings['output_method'] == 'api' else None,
+    }
+    try:
+        if _stage1_batch_size() > 1:
+            await _afilter_stage1_in_batches(jobs, settings, stats, runtime)
+            jobs = [job for job in jobs if job['stage']]
+        await asyncio.gather(*(_arun_job(index, len(jobs), job, settings, stats, runtime)
+                               for index, job in enumerate(jobs, start=1)))
+    finally:
+        for http_client in (runtime['article_client'], runtime['push_client']):
+            if http_client is not None:
+                await http_client.aclose()
+        await aclose_async_client()
+
+def main():
+    logger.info("--- Starting Medium Personalized Feed Run ---")
+    # Counters
+    stats = {
+        'passed_stage1': 0,
+        'passed_stage2': 0,
+        'processed': 0, # Counter for successful AI content processing
+        'pushed': 0, # Counter for successfully pushed via API
+        'saved_local': 0, # Counter for successfully saved locally
+        'filtered_out_prefilter': 0,
+        'filtered_out_stage1': 0,
+        'filtered_out_stage2': 0,
+        'failed': 0, # General failures (fetch, AI, output)
+    }
+    settings = _load_run_settings()
+    engine = str(config.get('engine', 'sync')).lower()
+    if engine not in ('sync', 'pipeline', 'async', 'batch'):
+        logger.warning(f"Invalid engine '{engine}' in config. Falling back to 'sync'.")
+        engine = 'sync'
+
+    # 1. Get articles from RSS feeds specified in config
+    # 2. Already processed articles are dropped here with one bulk lookup (using state manager)
+    try:
+        if engine == 'async':
+            articles = asyncio.run(_afetch_articles())
+        else:
+            articles = get_articles_from_config_feeds(skip_processed=True)
+        skipped_processed_count = get_fetch_stats()['skipped_processed']
+        total_articles_fetched = len(articles) + skipped_processed_count
+        logger.info(f"Found {total_articles_fetched} unique articles from RSS feeds ({skipped_processed_count} already processed).")
+    except Exception as e:
+         logger.critical(f"Failed to fetch or parse RSS feeds: {e}", exc_info=True)
+         logger.info("--- Run Terminated Due to Critical Error ---")
+         return
+
+    # Articles left unfinished by earlier runs continue from the stage after their last status
+    resumed_jobs = _load_resumable_jobs()
+    if resumed_jobs:
+        logger.info(f"Resuming {len(resumed_jobs)} articles left unfinished by earlier runs.")
+
+    jobs = resumed_jobs + [_new_job(article_data) for article_data in articles]
+    if not jobs:
+        logger.info("No new articles found in the configured feeds.")
+        commit_feed_cache()
+        logger.info("--- Run Finished ---")
+        return
+
+    # Obvious rejects are decided locally, from the history of stage 1 verdicts
+    if prefilter.ENABLED:
+        jobs = _apply_prefilter(jobs, settings, stats)
+
+    # 3. Process each article
+    if engine == 'async':
+        asyncio.run(_arun_jobs(jobs, settings, stats))
+    elif engine == 'pipeline':
+        _run_jobs_in_pipeline(jobs, settings, stats)
+    elif engine == 'batch':
+        _run_jobs_with_batch_jobs(jobs, settings, stats)
+    else:
+        remaining_jobs = jobs
+        if _stage1_batch_size() > 1:
+            _filter_stage1_in_batches(jobs, settings, stats)
+            remaining_jobs = [job for job in jobs if job['stage']]
+        if int(config.get('fetch_config', {}).get('max_concurrent_fetches', 1)) > 1:
+            _run_jobs_with_parallel_fetch(remaining_jobs, settings, stats)
+        else:
+            for index, job in enumerate(remaining_jobs, start=1):
+                _log_job_start(index, len(remaining_jobs), job)
+                _run_job(job, settings, stats)
+
+    _wait_for_speculation()
+    sm.flush() # Stage boundary: all article statuses of this run are written
+    # Every fetched entry has been handled, so the feed validators can be saved for the next run
+    commit_feed_cache()
 
     # --- Run Summary --- #
     logger.info("--- Medium Personalized Feed Run Summary ---")
     logger.info(f"Total unique articles found in feeds: {total_articles_fetched}")
     logger.info(f"Articles previously processed (skipped): {skipped_processed_count}")
-    attempted_count = total_articles_fetched - skipped_processed_count
-    logger.info(f"Articles attempted for processing: {attempted_count}")
+    logger.info(f"Articles resumed from earlier runs: {len(resumed_jobs)}")
+    if prefilter.ENABLED:
+        logger.info(f"Articles rejected by the local pre-filter (no AI call): {stats['filtered_out_prefilter']}")
+    logger.info(f"Articles attempted for processing: {len(jobs)}")
     logger.info(f"--- AI Filter Stage 1 (Title/Summary) ---")
-    logger.info(f"   Articles filtered out: {filtered_out_stage1_count}")
-    logger.info(f"   Articles passed: {passed_stage1_filter_count}")
+    logger.info(f"   Articles filtered out: {stats['filtered_out_stage1']}")
+    logger.info(f"   Articles passed: {stats['passed_stage1']}")
     logger.info(f"--- AI Filter Stage 2 (Full Content) ---")
-    logger.info(f"   Articles filtered out: {filtered_out_stage2_count}")
-    logger.info(f"   Articles passed (proceeded to processing): {passed_stage2_filter_count}")
+    logger.info(f"   Articles filtered out: {stats['filtered_out_stage2']}")
+    logger.info(f"   Articles passed (proceeded to processing): {stats['passed_stage2']}")
 
     # Adjust summary based on output method
-    processed_successfully_count = pushed_count + saved_local_count # Count of articles that made it through processing and output
     logger.info(f"--- Content Processing & Output ---")
-    logger.info(f"   Articles successfully processed (AI): {processed_successfully_count + failed_count - filtered_out_stage1_count - filtered_out_stage2_count}") # Approximation might be slightly off if AI processing fails but content filter passed
-    if output_method == 'api':
-        logger.info(f"   Articles successfully pushed to API: {pushed_count}")
-    elif output_method == 'local':
-        logger.info(f"   Articles successfully saved locally: {saved_local_count}")
-    logger.info(f"   Articles failed during fetch, AI processing, or output: {failed_count}")
+    logger.info(f"   Articles successfully processed (AI): {stats['processed']}")
+    if settings['output_method'] == 'api':
+        logger.info(f"   Articles successfully pushed to API: {stats['pushed']}")
+    elif settings['output_method'] == 'local':
+        logger.info(f"   Articles successfully saved locally: {stats['saved_local']}")
+    logger.info(f"   Articles failed during fetch, AI processing, or output: {stats['failed']}")
+    if config.get('ai_filter', {}).get('cascade', {}).get('enabled', False):
+        cascade_stats = get_cascade_stats()
+        logger.info(f"--- AI Model Cascade ---")
+        logger.info(f"   Filter verdicts escalated to the stronger model: {cascade_stats['escalated']} of {cascade_stats['verdicts']}")
+    if engine == 'batch':
+        batch_stats = batch_jobs.get_stats()
+        logger.info(f"--- Batch Jobs ---")
+        logger.info(f"   Jobs submitted: {batch_stats['jobs']}, requests sent: {batch_stats['requests']} "
+                    f"(answered: {batch_stats['answered']}, failed or unfinished: {batch_stats['failed']})")
+        logger.info(f"   Answers collected from jobs of earlier runs: {batch_stats['collected']}")
+    if config.get('ai_filter', {}).get('streaming', {}).get('enabled', False):
+        streaming_stats = get_streaming_stats()
+        avg_first_token = f"{streaming_stats['avg_first_token_seconds']:.2f}s" if streaming_stats['avg_first_token_seconds'] is not None else "n/a"
+        tokens_per_second = f"{streaming_stats['tokens_per_second']:.1f}" if streaming_stats['tokens_per_second'] is not None else "n/a"
+        logger.info(f"--- Streamed Processing ---")
+        logger.info(f"   Responses streamed: {streaming_stats['streamed']}, aborted as broken: {streaming_stats['aborted']}")
+        logger.info(f"   Average time to first token: {avg_first_token}, tokens/sec: {tokens_per_second}")
+    if _speculation_settings().get('enabled', False):
+        logger.info(f"--- Speculative Processing ---")
+        logger.info(f"   Started: {_speculation_stats['started']}, used: {_speculation_stats['used']}, "
+                    f"discarded: {_speculation_stats['discarded']} (~{_speculation_stats['wasted_tokens']} tokens wasted)")
+    prompt_cache_stats = get_prompt_cache_stats()
+    if prompt_cache_stats['prompt_tokens']:
+        logger.info(f"--- Provider Prompt Cache ---")
+        logger.info(f"   Prompt tokens cached by the provider: {prompt_cache_stats['cached_tokens']} of {prompt_cache_stats['prompt_tokens']} "
+                    f"({prompt_cache_stats['cached_tokens'] / prompt_cache_stats['prompt_tokens']:.1%}, {prompt_cache_stats['requests']} responses)")
+    if ai_cache.ENABLED:
+        cache_stats = ai_cache.get_stats()
+        logger.info(f"--- AI Response Cache{' (bypassed)' if ai_cache.BYPASS else ''} ---")
+        logger.info(f"   Cache hits: {cache_stats['hits']}, misses: {cache_stats['misses']}")
+    if glossary.ENABLED:
+        glossary_stats = glossary.get_stats()
+        logger.info(f"--- Vocabulary Glossary ---")
+        logger.info(f"   Terms annotated from the glossary: {glossary_stats['reused']}, new terms learned: {glossary_stats['learned']}")
     logger.info(f"--- Run Finished ---")
 
 
 if __name__ == "__main__":
     # Ensure the state manager initializes the database if it doesn't exist
-    sm.initialize_database()
-    main()
\ No newline at end of file
+    sm.initialize_db()
+    try:
+        main()
+    finally:
+        sm.close() # Flush queued status updates even if the run is interrupted
@@ -0,0 +1,225 @@
+import logging
+import re
+from bs4 import BeautifulSoup, NavigableString, Tag
+
+logger = logging.getLogger(__name__)
+
+# Tags whose content is dropped entirely
+_SKIPPED_TAGS = {'script', 'style', 'noscript', 'svg', 'button', 'nav', 'header', 'footer', 'aside'}
+_HEADING_LEVELS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4, 'h5': 5, 'h6': 6}
+_INLINE_WRAPPERS = {'strong': '**', 'b': '**', 'em': '*', 'i': '*', 's': '~~', 'del': '~~', 'strike': '~~'}
+
+def _collapse_whitespace(text):
+    return re.sub(r'\s+', ' ', text)
+
+def _escape_text(text):
+    """Escapes characters that would otherwise start Markdown syntax inside running text."""
+    return re.sub(r'([\\`*_\[\]])', r'\\\1', text)
+
+def _convert_inline(node):
+    """Converts the inline content of a node (text, emphasis, links, code, images) to a Markdown string."""
+    return _convert_inline_nodes(node.children)
+
+def _convert_inline_nodes(nodes):
+    parts = []
+    for child in nodes:
+        if isinstance(child, NavigableString):
+            if child.__class__.__name__ in ('Comment', 'Doctype', 'Declaration', 'ProcessingInstruction'):
+                continue
+            parts.append(_escape_text(_collapse_whitespace(str(child))))
+            continue
+        if not isinstance(child, Tag) or child.name in _SKIPPED_TAGS:
+            continue
+        name = child.name
+        if name == 'br':
+            parts.append('  \n')
+        elif name == 'img':
+            parts.append(_convert_image(child))
+        elif name == 'code':
+            code = child.get_text()
+            fence = '``' if '`' in code else '`'
+            parts.append(f"{fence}{code}{fence}")
+        elif name == 'a':
+            text = _convert_inline(child).strip()
+            href = child.get('href')
+            if href and text:
+                parts.append(f"[{text}]({href})")
+            else:
+                parts.append(text)
+        elif name in _INLINE_WRAPPERS:
+            text = _convert_inline(child)
+            stripped = text.strip()
+            if stripped:
+                marker = _INLINE_WRAPPERS[name]
+                # Keep surrounding spaces outside the markers, or the emphasis won't render
+                leading = ' ' if text[:1].isspace() else ''
+                trailing = ' ' if text[-1:].isspace() else ''
+                parts.append(f"{leading}{marker}{stripped}{marker}{trailing}")
+        else:
+            parts.append(_convert_inline(child))
+    return ''.join(parts)
+
+def _convert_image(img):
+    alt = (img.get('alt') or '').strip() or 'image'
+    src = img.get('src') or img.get('data-src') or ''
+    if not src and img.get('srcset'):
+        src = img['srcset'].split(',')[0].strip().split(' ')[0]
+    return f"![{alt}]({src})" if src else ''
+
+def _convert_list(list_tag, depth):
+    """Converts a <ul>/<ol> to Markdown lines, indenting nested lists."""
+    lines = []
+    ordered = list_tag.name == 'ol'
+    index = int(list_tag.get('start', 1)) if str(list_tag.get('start', '1')).isdigit() else 1
+    indent = '   ' * depth
+    for item in list_tag.find_all('li', recursive=False):
+        nested = [child for child in item.children if isinstance(child, Tag) and child.name in ('ul', 'ol')]
+        for child in nested:
+            child.extract()
+        text = ' '.join(_convert_inline(item).split())
+        marker = f"{index}." if ordered else '-'
+        lines.append(f"{indent}{marker} {text}")
+        index += 1
+        for child in nested:
+            lines.extend(_convert_list(child, depth + 1))
+    return lines
+
+def _convert_table(table):
+    rows = []
+    for tr in table.find_all('tr'):
+        cells = [' '.join(_convert_inline(cell).split()).replace('|', '\\|') for cell in tr.find_all(['th', 'td'])]
+        if cells:
+            rows.append(cells)
+    if not rows:
+        return ''
+    width = max(len(row) for row in rows)
+    rows = [row + [''] * (width - len(row)) for row in rows]
+    lines = ['| ' + ' | '.join(rows[0]) + ' |', '|' + ' --- |' * width]
+    lines.extend('| ' + ' | '.join(row) + ' |' for row in rows[1:])
+    return '\n'.join(lines)
+
+def _convert_blocks(node):
+    """Converts the block-level children of a node to a list of Markdown blocks."""
+    blocks = []
+    inline_run = [] # Consecutive inline children are collected into one paragraph
+
+    def flush_inline():
+        if inline_run:
+            text = _convert_inline_nodes(inline_run).strip()
+            if text:
+                blocks.append(text)
+            inline_run.clear()
+
+    for child in node.children:
+        if isinstance(child, NavigableString):
+            if child.__class__.__name__ == 'NavigableString' and str(child).strip():
+                inline_run.append(child)
+            continue
+        if not isinstance(child, Tag) or child.name in _SKIPPED_TAGS:
+            continue
+        name = child.name
+        if name in _HEADING_LEVELS:
+            flush_inline()
+            text = ' '.join(_convert_inline(child).split())
+            if text:
+                blocks.append(f"{'#' * _HEADING_LEVELS[name]} {text}")
+        elif name == 'p':
+            flush_inline()
+            text = _convert_inline(child).strip()
+            if text:
+                blocks.append(text)
+        elif name in ('ul', 'ol'):
+            flush_inline()
+            lines = _convert_list(child, 0)
+            if lines:
+                blocks.append('\n'.join(lines))
+        elif name == 'blockquote':
+            flush_inline()
+            inner = '\n\n'.join(_convert_blocks(child))
+            if inner:
+                blocks.append('\n'.join(f"> {line}" if line else '>' for line in inner.split('\n')))
+        elif name == 'pre':
+            flush_inline()
+            code = child.get_text()
+            fence = '````' if '```' in code else '```'
+            blocks.append(f"{fence}\n{code.strip(chr(10))}\n{fence}")
+        elif name == 'hr':
+            flush_inline()
+            blocks.append('---')
+        elif name == 'img':
+            flush_inline()
+            image = _convert_image(child)
+            if image:
+                blocks.append(image)
+        elif name == 'figure':
+            flush_inline()
+            for image in child.find_all('img'):
+                markdown_image = _convert_image(image)
+                if markdown_image:
+                    blocks.append(markdown_image)
+                    break # Medium figures carry several <img>/<source> variants of the same picture
+            caption = child.find('figcaption')
+            if caption:
+                caption_text = ' '.join(_convert_inline(caption).split())
+                if caption_text:
+                    blocks.append(f"*{caption_text}*")
+        elif name == 'table':
+            flush_inline()
+            table = _convert_table(child)
+            if table:
+                blocks.append(table)
+        elif name in ('a', 'code', 'strong', 'b', 'em', 'i', 'span', 'br', 's', 'del', 'strike', 'sup', 'sub', 'mark', 'u'):
+            inline_run.append(child)
+        else:
+            # Containers (div, section, article, ...) contribute their own blocks
+            flush_inline()
+            blocks.extend(_convert_blocks(child))
+    flush_inline()
+    return blocks
+
+def html_to_markdown(html_content):
+    """Converts an article HTML fragment to Markdown without calling a model.
+
+    Handles headings, paragraphs, emphasis, links, inline and block code, lists (nested),
+    blockquotes, images (alt text or 'image'), figures with captions, horizontal rules and tables.
+    """
+    if not html_content:
+        return ''
+    try:
+        soup = BeautifulSoup(html_content, 'lxml')
+    except Exception:
+        soup = BeautifulSoup(html_content, 'html.parser')
+    root = soup.body or soup
+    markdown = '\n\n'.join(_convert_blocks(root))
+    return re.sub(r'\n{3,}', '\n\n', markdown).strip() + '\n'
+
+# Markdown that annotations must not touch: code, images, and the URL part of links
+_PROTECTED_MARKDOWN = re.compile(r'(```.*?```|````.*?````|`[^`\n]*`|!\[[^\]]*\]\([^)]*\)|\]\([^)]*\))', re.DOTALL)
+
+def apply_annotations(markdown, annotations):
+    """Inserts ' (translation)' after the first occurrence of each annotated term in the Markdown text.
+
+    annotations maps terms to translations. Matching is case-insensitive on word boundaries; code,
+    images and link URLs are left alone, and longer terms win over terms they contain.
+    Returns the annotated Markdown and the number of terms applied.
+    """
+    terms = {term.strip(): translation.strip() for term, translation in annotations.items()
+             if isinstance(term, str) and isinstance(translation, str) and term.strip() and translation.strip()}
+    if not markdown or not terms:
+        return markdown, 0
+    by_lower = {term.lower(): translation for term, translation in terms.items()}
+    pattern = re.compile(r'(?<![\w-])(' + '|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True)) + r')(?![\w-])', re.IGNORECASE)
+    applied = set()
+
+    def annotate(match):
+        key = match.group(1).lower()
+        if key in applied:
+            return match.group(0)
+        applied.add(key)
+        return f"{match.group(0)} ({by_lower[key]})"
+
+    segments = _PROTECTED_MARKDOWN.split(markdown)
+    # split() with one capturing group alternates text (even indexes) and protected segments (odd indexes)
+    for index in range(0, len(segments), 2):
+        segments[index] = pattern.sub(annotate, segments[index])
+    return ''.join(segments), len(applied)
@@ -0,0 +1,154 @@
+import json
+import logging
+import math
+import random
+import re
+import zlib
+from config import config # Import the already loaded config
+import state_manager as sm
+
+logger = logging.getLogger(__name__)
+
+prefilter_conf = config.get('prefilter', {})
+ENABLED = prefilter_conf.get('enabled', False)
+# Articles whose estimated probability of passing stage 1 is below this are rejected without an AI call
+REJECT_THRESHOLD = float(prefilter_conf.get('reject_threshold', 0.02))
+# Share of would-be rejects still sent to the AI, so the training data keeps covering them
+AUDIT_RATE = float(prefilter_conf.get('audit_rate', 0.05))
+# No pre-filtering until the history holds this many AI verdicts (and both outcomes)
+MIN_TRAINING_SAMPLES = int(prefilter_conf.get('min_training_samples', 300))
+HASH_BUCKETS = int(prefilter_conf.get('hash_buckets', 2 ** 18))
+
+# Thresholds compared by the agreement report
+REPORT_THRESHOLDS = (0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.3)
+_REPORT_FOLDS = 5
+_TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9'’-]*")
+
+def article_features(article_data):
+    """Returns the hashed unigram and bigram features of an article's title and summary."""
+    text = f"{article_data.get('title') or ''} {article_data.get('summary') or ''}".lower()
+    words = _TOKEN_PATTERN.findall(text)
+    tokens = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+    # crc32 instead of hash(): Python's string hashes change between runs
+    return {zlib.crc32(token.encode('utf-8')) % HASH_BUCKETS for token in tokens}
+
+class NaiveBayesPrefilter:
+    """Naive Bayes over hashed title/summary features, predicting whether stage 1 would accept an article."""
+
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+        self.feature_counts = ({}, {}) # Per class (rejected, passed): feature -> number of articles containing it
+        self.article_counts = [0, 0]
+        self.feature_totals = [0, 0]
+
+    def fit(self, feature_sets, labels):
+        for features, passed in zip(feature_sets, labels):
+            label = 1 if passed else 0
+            self.article_counts[label] += 1
+            self.feature_totals[label] += len(features)
+            counts = self.feature_counts[label]
+            for feature in features:
+                counts[feature] = counts.get(feature, 0) + 1
+        return self
+
+    def pass_probability(self, features):
+        """Returns the estimated probability that stage 1 accepts an article with these features."""
+        log_odds = math.log((self.article_counts[1] + 1) / (self.article_counts[0] + 1))
+        denominators = [self.feature_totals[label] + self.alpha * HASH_BUCKETS for label in (0, 1)]
+        for feature in features:
+            log_odds += math.log((self.feature_counts[1].get(feature, 0) + self.alpha) / denominators[1])
+            log_odds -= math.log((self.feature_counts[0].get(feature, 0) + self.alpha) / denominators[0])
+        if log_odds < -700:
+            return 0.0
+        return 1.0 / (1.0 + math.exp(-log_odds)) if log_odds < 700 else 1.0
+
+def _verdict_label(filter_result, accepted_relevance, accepted_quality):
+    """Returns True/False for a stored AI stage 1 verdict, or None if the row holds no AI verdict."""
+    try:
+        verdict = json.loads(filter_result)
+    except (TypeError, json.JSONDecodeError):
+        return None
+    if not isinstance(verdict, dict) or 'relevance' not in verdict or 'quality_type' not in verdict:
+        return None # e.g. a pre-filter rejection, which must not train the pre-filter
+    return verdict['relevance'] in accepted_relevance and verdict['quality_type'] in accepted_quality
+
+def load_training_data(accepted_relevance, accepted_quality):
+    """Returns (feature_sets, labels) from the AI stage 1 verdicts in the state database."""
+    feature_sets, labels = [], []
+    for title, filter_result, article_data in sm.get_filter_results():
+        label = _verdict_label(filter_result, accepted_relevance, accepted_quality)
+        if label is None:
+            continue
+        feature_sets.append(article_features(article_data or {'title': title}))
+        labels.append(label)
+    return feature_sets, labels
+
+def _has_enough_data(labels):
+    return len(labels) >= MIN_TRAINING_SAMPLES and 0 < sum(labels) < len(labels)
+
+def train(accepted_relevance, accepted_quality):
+    """Trains the pre-filter on the stored verdicts. Returns None if there isn't enough history yet."""
+    feature_sets, labels = load_training_data(accepted_relevance, accepted_quality)
+    if not _has_enough_data(labels):
+        logger.info(f"Local pre-filter inactive: {len(labels)} AI verdicts stored ({sum(labels)} passed), need at least {MIN_TRAINING_SAMPLES} with both outcomes.")
+        return None
+    logger.info(f"Trained local pre-filter on {len(labels)} AI verdicts ({sum(labels)} passed).")
+    return NaiveBayesPrefilter().fit(feature_sets, labels)
+
+def should_reject(classifier, article_data):
+    """Returns (reject, pass_probability) for an article. A small random share of rejects is audited by the AI instead."""
+    probability = classifier.pass_probability(article_features(article_data))
+    if probability >= REJECT_THRESHOLD:
+        return False, probability
+    if random.random() < AUDIT_RATE:
+        logger.debug(f"Pre-filter reject of {article_data.get('link')} (pass probability {probability:.4f}) sent to the AI for auditing.")
+        return False, probability
+    return True, probability
+
+def agreement_report(feature_sets, labels, thresholds=REPORT_THRESHOLDS, folds=_REPORT_FOLDS):
+    """Cross-validates the pre-filter against the AI verdicts.
+
+    Returns one dict per threshold with the share of articles that would skip the AI call and how
+    many of those the AI actually passed (false rejects).
+    """
+    order = list(range(len(labels)))
+    random.Random(0).shuffle(order)
+    probabilities = [0.0] * len(labels)
+    for fold in range(folds):
+        held_out = set(order[fold::folds])
+        classifier = NaiveBayesPrefilter().fit(
+            [feature_sets[i] for i in order if i not in held_out], [labels[i] for i in order if i not in held_out])
+        for i in held_out:
+            probabilities[i] = classifier.pass_probability(feature_sets[i])
+
+    report = []
+    for threshold in thresholds:
+        rejected = [labels[i] for i in range(len(labels)) if probabilities[i] < threshold]
+        false_rejects = sum(rejected)
+        report.append({
+            'threshold': threshold,
+            'skipped': len(rejected),
+            'skipped_share': len(rejected) / len(labels) if labels else 0.0,
+            'false_rejects': false_rejects,
+            'missed_share': false_rejects / max(1, sum(labels)), # Share of all AI-passed articles lost
+            'agreement': 1 - false_rejects / len(rejected) if rejected else 1.0,
+        })
+    return report
+
+def log_agreement_report(accepted_relevance, accepted_quality):
+    """Logs the agreement report for the stored verdicts, to help choose reject_threshold."""
+    feature_sets, labels = load_training_data(accepted_relevance, accepted_quality)
+    if not _has_enough_data(labels):
+        logger.info(f"Not enough AI verdicts for a pre-filter report: {len(labels)} stored ({sum(labels)} passed).")
+        return
+    logger.info(f"Pre-filter agreement with the AI ({_REPORT_FOLDS}-fold cross-validation on {len(labels)} verdicts, {sum(labels)} passed):")
+    for row in agreement_report(feature_sets, labels):
+        marker = ' <- configured' if row['threshold'] == REJECT_THRESHOLD else ''
+        logger.info(f"   threshold {row['threshold']:<6}: skips {row['skipped']} ({row['skipped_share']:.1%}) of AI calls, "
+                    f"agreement on skips {row['agreement']:.1%}, AI-passed articles lost {row['false_rejects']} ({row['missed_share']:.1%}){marker}")
+
+if __name__ == "__main__":
+    # python prefilter.py: print the agreement report for the current acceptance settings
+    ai_conf = config.get('ai_filter', {})
+    log_agreement_report(ai_conf.get('accepted_relevance', ['High', 'Medium']),
+                         ai_conf.get('accepted_quality', ['In-depth', 'Opinion', 'Overview']))
@@ -0,0 +1,176 @@
+import asyncio
+import email.utils
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Thread-safe token bucket: allows `rate` tokens per second with bursts of up to `capacity` tokens."""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        """Adds the tokens earned since the last update. Caller holds _lock."""
+        if now <= self._updated_at: # Nothing is earned before a pause ends
+            return
+        elapsed = now - self._updated_at
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated_at = now
+
+    def _try_acquire(self, tokens):
+        """Takes `tokens` if available and returns 0, otherwise returns the seconds to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._refill(now)
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate if self.rate > 0 else 1.0
+
+    def acquire(self, tokens=1):
+        """Blocks until `tokens` tokens are available, then takes them. Returns the seconds spent waiting."""
+        tokens = min(float(tokens), self.capacity) # A request larger than the bucket would wait forever
+        waited = 0.0
+        while True:
+            delay = self._try_acquire(tokens)
+            if delay <= 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    async def acquire_async(self, tokens=1):
+        """Async variant of acquire() that waits without blocking the event loop."""
+        tokens = min(float(tokens), self.capacity)
+        waited = 0.0
+        while True:
+            delay = self._try_acquire(tokens)
+            if delay <= 0:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def debit(self, tokens):
+        """Takes `tokens` without waiting; the balance may go negative, which delays later acquires."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= tokens
+
+    def pause(self, seconds):
+        """Stops handing out tokens for `seconds`, e.g. after the server asked us to slow down."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            self._updated_at = self._paused_until # Refill starts when the pause ends
+
+class ModelRateLimiter:
+    """Requests-per-minute and tokens-per-minute limits for one model. A limit of None or 0 is not enforced."""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.request_bucket = TokenBucket(requests_per_minute / 60.0, requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute) if tokens_per_minute else None
+
+    def acquire(self, tokens):
+        """Blocks until one request with about `tokens` tokens fits in both limits."""
+        if self.request_bucket:
+            self.request_bucket.acquire()
+        if self.token_bucket:
+            self.token_bucket.acquire(tokens)
+
+    async def acquire_async(self, tokens):
+        """Async variant of acquire()."""
+        if self.request_bucket:
+            await self.request_bucket.acquire_async()
+        if self.token_bucket:
+            await self.token_bucket.acquire_async(tokens)
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """Charges the difference between the estimate taken up front and the tokens the request really used."""
+        if self.token_bucket and actual_tokens and actual_tokens > estimated_tokens:
+            self.token_bucket.debit(actual_tokens - estimated_tokens)
+
+    def pause(self, seconds):
+        """Stops sending requests for `seconds`, e.g. after a 429 with Retry-After."""
+        if self.request_bucket:
+            self.request_bucket.pause(seconds)
+        if self.token_bucket:
+            self.token_bucket.pause(seconds)
+
+class CircuitBreaker:
+    """Pauses all callers for `cooldown_seconds` after `failure_threshold` consecutive failures.
+
+    While open, wait() blocks instead of letting callers fail one after another. After the cooldown
+    the next call is let through; one more failure re-opens the breaker, a success closes it.
+    """
+
+    def __init__(self, failure_threshold, cooldown_seconds, name='circuit breaker'):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cooldown_seconds = float(cooldown_seconds)
+        self.name = name
+        self._failures = 0
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    def _remaining(self):
+        with self._lock:
+            return self._open_until - time.monotonic()
+
+    def wait(self):
+        """Blocks while the breaker is open. Returns the seconds spent waiting."""
+        waited = 0.0
+        while (remaining := self._remaining()) > 0:
+            time.sleep(remaining)
+            waited += remaining
+        return waited
+
+    async def wait_async(self):
+        """Async variant of wait()."""
+        waited = 0.0
+        while (remaining := self._remaining()) > 0:
+            await asyncio.sleep(remaining)
+            waited += remaining
+        return waited
+
+    def is_open(self):
+        return self._remaining() > 0
+
+    def open_for(self, seconds):
+        """Opens the breaker for at least `seconds`, e.g. when the server asked us to back off."""
+        with self._lock:
+            self._open_until = max(self._open_until, time.monotonic() + seconds)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold and time.monotonic() >= self._open_until:
+                self._open_until = time.monotonic() + self.cooldown_seconds
+                logger.warning(f"{self.name} opened after {self._failures} consecutive failures. Pausing for {self.cooldown_seconds:.0f}s.")
+
+def parse_retry_after(value):
+    """Parses a Retry-After header (delta seconds or HTTP date) into seconds. Returns None if absent or invalid."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        logger.debug(f"Could not parse Retry-After header value: {value}")
+        return None
@@ -1,14 +1,29 @@
 import feedparser
+import requests
+import hashlib
 import logging
 import time
 import datetime
+import threading
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 from utils import clean_html
 from config import config # Import the already loaded config
+import state_manager as sm
 
 # Configure logging for this module
 logger = logging.getLogger(__name__)
 
+FEED_USER_AGENT = 'MediumPersonalizedFeedFetcher/1.0' # Add a user-agent for politeness
+
+# Feed validators gathered during the current run, written by commit_feed_cache()
+_pending_feed_cache = {}
+_pending_feed_cache_lock = threading.Lock()
+
+# Counters from the last get_articles_from_config_feeds() call, see get_fetch_stats()
+_fetch_stats = {'skipped_processed': 0}
+
 def _extract_source_tag_from_url(url):
     """Extracts a usable tag/name from a Medium feed URL."""
     try:
@@ -32,50 +47,189 @@ def _extract_source_tag_from_url(url):
         logger.warning(f"Could not parse source tag from URL {url}: {e}")
     return "unknown_source" # Default if parsing fails
 
-def fetch_feeds(feed_urls):
-    """Fetches and parses multiple RSS feeds, including source tags."""
-    all_entries_with_source = []
+def _conditional_headers(cache_entry):
+    """Returns request headers carrying the cached validators of a feed."""
+    headers = {'User-Agent': FEED_USER_AGENT}
+    if cache_entry:
+        if cache_entry.get('etag'):
+            headers['If-None-Match'] = cache_entry['etag']
+        if cache_entry.get('modified'):
+            headers['If-Modified-Since'] = cache_entry['modified']
+    return headers
+
+def _download_feed(url, cache_entry, timeout):
+    """Downloads a feed body, sending cached validators as a conditional GET.
+
+    Returns a tuple (body, cache_update). body is None when the feed is unchanged
+    (HTTP 304 or an identical body), in which case parsing can be skipped entirely.
+    """
+    response = requests.get(url, headers=_conditional_headers(cache_entry), timeout=timeout)
+    if response.status_code == 304:
+        logger.info(f"Feed not modified since last run (304): {url}")
+        return None, None
+    response.raise_for_status()
+    return _check_feed_body(url, response.content, response.headers, cache_entry)
+
+def _check_feed_body(url, body, response_headers, cache_entry):
+    """Builds the new cache entry for a downloaded feed and compares it with the cached one.
+
+    Returns (body, cache_update), with body set to None if it is identical to the last run's.
+    """
+    cache_update = {
+        'etag': response_headers.get('ETag'),
+        'modified': response_headers.get('Last-Modified'),
+        'content_hash': hashlib.sha256(body).hexdigest(),
+    }
+    if cache_entry and cache_entry.get('content_hash') == cache_update['content_hash']:
+        logger.info(f"Feed body unchanged since last run (identical content hash): {url}")
+        return None, cache_update
+    return body, cache_update
+
+def _fetch_single_feed(url, cache_entry=None):
+    """Fetches and parses a single RSS feed, returning its valid entries tagged with the source tag."""
+    source_tag = _extract_source_tag_from_url(url)
+    feed_conf = config.get('feed_config', {})
+    use_conditional_get = feed_conf.get('conditional_get', True)
+    timeout = feed_conf.get('timeout', 30)
+    try:
+        logger.debug(f"Fetching feed: {url} (Source Tag: {source_tag})")
+        body, cache_update = _download_feed(url, cache_entry if use_conditional_get else None, timeout)
+        if use_conditional_get and cache_update:
+            _stage_feed_cache_update(url, cache_update)
+        if body is None:
+            return [] # Unchanged since the last completed run, nothing new to parse
+        return _parse_feed_entries(url, body, source_tag)
+    except Exception as e:
+        logger.error(f"Failed to fetch or parse feed {url}: {e}", exc_info=True) # Include traceback
+        return []
+
+def _parse_feed_entries(url, body, source_tag):
+    """Parses a feed body and returns its valid entries tagged with the source tag."""
+    try:
+        feed = feedparser.parse(body, response_headers={'content-location': url})
+
+        # Check the bozo flag (indicates potential parsing issues)
+        if feed.bozo:
+            bozo_reason = feed.bozo_exception
+            # Sometimes it's just a character encoding issue handled by feedparser
+            if isinstance(bozo_reason, feedparser.CharacterEncodingOverride):
+                logger.warning(f"Feed encoding issue detected for {url}, but parsed successfully.")
+            else:
+                logger.warning(f"Feed may be ill-formed: {url} - Error: {bozo_reason}")
+
+        # Check if entries exist and are valid
+        if not hasattr(feed, 'entries') or not feed.entries:
+            logger.warning(f"No entries found in feed: {url}. Status: {getattr(feed, 'status', 'N/A')}")
+            return []
+
+        # Filter out entries without links (essential)
+        valid_entries = [entry for entry in feed.entries if hasattr(entry, 'link') and entry.link]
+
+        if len(valid_entries) < len(feed.entries):
+            logger.warning(f"Excluded {len(feed.entries) - len(valid_entries)} entries without links from {url}")
+
+        # Add source tag to each entry
+        for entry in valid_entries:
+            entry.source_tag = source_tag # Add the tag to the entry object
+
+        logger.info(f"Successfully fetched and parsed {len(valid_entries)} valid entries from {url}")
+        return valid_entries
+
+    except Exception as e:
+        logger.error(f"Failed to parse feed {url}: {e}", exc_info=True) # Include traceback
+        return []
+
+async def _afetch_single_feed(url, cache_entry, http_client, host_semaphores):
+    """Async variant of _fetch_single_feed(), using a shared httpx.AsyncClient."""
+    source_tag = _extract_source_tag_from_url(url)
+    use_conditional_get = config.get('feed_config', {}).get('conditional_get', True)
+    try:
+        logger.debug(f"Fetching feed: {url} (Source Tag: {source_tag})")
+        async with host_semaphores[urlparse(url).netloc.lower()]:
+            response = await http_client.get(url, headers=_conditional_headers(cache_entry if use_conditional_get else None))
+        if response.status_code == 304:
+            logger.info(f"Feed not modified since last run (304): {url}")
+            return []
+        response.raise_for_status()
+        body, cache_update = _check_feed_body(url, response.content, response.headers, cache_entry if use_conditional_get else None)
+        if use_conditional_get and cache_update:
+            _stage_feed_cache_update(url, cache_update)
+        if body is None:
+            return []
+        return _parse_feed_entries(url, body, source_tag)
+    except Exception as e:
+        logger.error(f"Failed to fetch or parse feed {url}: {e}", exc_info=True)
+        return []
+
+async def afetch_feeds(feed_urls, http_client):
+    """Async variant of fetch_feeds(). Entries are returned in the order of feed_urls."""
     if not feed_urls:
         logger.warning("No feed URLs provided in configuration.")
         return []
+    feed_conf = config.get('feed_config', {})
+    max_per_host = max(1, int(feed_conf.get('max_per_host', 4)))
+    feed_cache = sm.get_feed_cache_entries() if feed_conf.get('conditional_get', True) else {}
+    host_semaphores = {urlparse(url).netloc.lower(): asyncio.Semaphore(max_per_host) for url in feed_urls}
 
-    logger.info(f"Starting to fetch {len(feed_urls)} feeds...")
-    for url in feed_urls:
-        source_tag = _extract_source_tag_from_url(url)
-        try:
-            logger.debug(f"Fetching feed: {url} (Source Tag: {source_tag})")
-            # Add a user-agent for politeness
-            feed = feedparser.parse(url, agent='MediumPersonalizedFeedFetcher/1.0')
+    logger.info(f"Starting to fetch {len(feed_urls)} feeds asynchronously (max per host: {max_per_host})...")
+    # gather() returns results in argument order, keeping the output deterministic
+    results = await asyncio.gather(*(_afetch_single_feed(url, feed_cache.get(url), http_client, host_semaphores) for url in feed_urls))
+    all_entries_with_source = [entry for entries in results for entry in entries]
+    logger.info(f"Total valid entries fetched from all feeds: {len(all_entries_with_source)}")
+    return all_entries_with_source
+
+def _fetch_feed_with_host_limit(url, cache_entry, host_semaphores):
+    """Fetches a single feed while holding the concurrency slot for its host."""
+    host = urlparse(url).netloc.lower()
+    with host_semaphores[host]:
+        return _fetch_single_feed(url, cache_entry)
 
-            # Check the bozo flag (indicates potential parsing issues)
-            if feed.bozo:
-                bozo_reason = feed.bozo_exception
-                # Sometimes it's just a character encoding issue handled by feedparser
-                if isinstance(bozo_reason, feedparser.CharacterEncodingOverride):
-                    logger.warning(f"Feed encoding issue detected for {url}, but parsed successfully.")
-                else:
-                    logger.warning(f"Feed may be ill-formed: {url} - Error: {bozo_reason}")
+def _stage_feed_cache_update(url, cache_update):
+    """Records new feed validators; they are persisted by commit_feed_cache() once the run completes."""
+    with _pending_feed_cache_lock:
+        _pending_feed_cache[url] = cache_update
 
-            # Check if entries exist and are valid
-            if not hasattr(feed, 'entries') or not feed.entries:
-                logger.warning(f"No entries found in feed: {url}. Status: {getattr(feed, 'status', 'N/A')}")
-                continue
+def commit_feed_cache():
+    """Persists the validators of all feeds fetched in this run to the state database.
 
-            # Filter out entries without links (essential)
-            valid_entries = [entry for entry in feed.entries if hasattr(entry, 'link') and entry.link]
+    Called after every article of the run has been handled, so a crashed run
+    re-parses its feeds next time instead of losing their entries.
+    """
+    with _pending_feed_cache_lock:
+        entries = dict(_pending_feed_cache)
+        _pending_feed_cache.clear()
+    sm.update_feed_cache(entries)
 
-            if len(valid_entries) < len(feed.entries):
-                logger.warning(f"Excluded {len(feed.entries) - len(valid_entries)} entries without links from {url}")
+def fetch_feeds(feed_urls):
+    """Fetches and parses multiple RSS feeds, including source tags.
+
+    Feeds are fetched concurrently when 'feed_config.max_workers' is greater than 1.
+    Entries are always returned in the order of feed_urls, so source tag assignment
+    and duplicate handling are identical to a sequential run.
+    """
+    all_entries_with_source = []
+    if not feed_urls:
+        logger.warning("No feed URLs provided in configuration.")
+        return []
 
-            # Add source tag to each entry
-            for entry in valid_entries:
-                entry.source_tag = source_tag # Add the tag to the entry object
+    feed_conf = config.get('feed_config', {})
+    max_workers = max(1, int(feed_conf.get('max_workers', 1)))
+    max_per_host = max(1, int(feed_conf.get('max_per_host', 4)))
+    feed_cache = sm.get_feed_cache_entries() if feed_conf.get('conditional_get', True) else {}
 
-            all_entries_with_source.extend(valid_entries)
-            logger.info(f"Successfully fetched and parsed {len(valid_entries)} valid entries from {url}")
+    if max_workers == 1 or len(feed_urls) == 1:
+        logger.info(f"Starting to fetch {len(feed_urls)} feeds...")
+        results = [_fetch_single_feed(url, feed_cache.get(url)) for url in feed_urls]
+    else:
+        workers = min(max_workers, len(feed_urls))
+        logger.info(f"Starting to fetch {len(feed_urls)} feeds concurrently (workers: {workers}, max per host: {max_per_host})...")
+        host_semaphores = {urlparse(url).netloc.lower(): threading.BoundedSemaphore(max_per_host) for url in feed_urls}
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='feed_fetch') as executor:
+            # executor.map yields results in submission order, keeping the output deterministic
+            results = list(executor.map(lambda url: _fetch_feed_with_host_limit(url, feed_cache.get(url), host_semaphores), feed_urls))
 
-        except Exception as e:
-            logger.error(f"Failed to fetch or parse feed {url}: {e}", exc_info=True) # Include traceback
+    for entries in results:
+        all_entries_with_source.extend(entries)
 
     logger.info(f"Total valid entries fetched from all feeds: {len(all_entries_with_source)}")
     return all_entries_with_source
@@ -126,8 +280,17 @@ def extract_entry_data(entry):
         logger.error(f"Failed to extract data for entry {entry_link_for_log}: {e}", exc_info=True)
         return None
 
-def get_articles_from_config_feeds():
-    """Fetches all feeds from config and extracts data for each entry."""
+def get_fetch_stats():
+    """Returns counters from the most recent get_articles_from_config_feeds() call."""
+    return dict(_fetch_stats)
+
+def get_articles_from_config_feeds(skip_processed=False):
+    """Fetches all feeds from config and extracts data for each entry.
+
+    With skip_processed=True, entries whose link is already in the state database
+    are dropped with a single bulk lookup, before any extraction or HTML cleaning.
+    """
+    _fetch_stats['skipped_processed'] = 0
     feed_urls = config.get('medium_feeds', [])
     if not feed_urls:
         logger.warning("No RSS feeds configured in config.yaml.")
@@ -135,16 +298,40 @@ def get_articles_from_config_feeds():
 
     # fetch_feeds now returns entries with source_tag attached
     raw_entries = fetch_feeds(feed_urls)
+    return _collect_articles(raw_entries, skip_processed)
+
+async def aget_articles_from_config_feeds(http_client, skip_processed=False):
+    """Async variant of get_articles_from_config_feeds()."""
+    _fetch_stats['skipped_processed'] = 0
+    feed_urls = config.get('medium_feeds', [])
+    if not feed_urls:
+        logger.warning("No RSS feeds configured in config.yaml.")
+        return []
+    raw_entries = await afetch_feeds(feed_urls, http_client)
+    return _collect_articles(raw_entries, skip_processed)
+
+def _collect_articles(raw_entries, skip_processed):
+    """Extracts article data from feed entries, dropping duplicates and (optionally) already processed links."""
     article_data_list = []
     processed_links = set() # Avoid duplicates if an article appears in multiple feeds
+    known_links = sm.get_processed_urls({entry.link for entry in raw_entries}) if skip_processed else set()
+    skipped_known_links = set()
 
     for entry in raw_entries:
+        if entry.link in known_links:
+            skipped_known_links.add(entry.link)
+            continue
+        if entry.link in processed_links:
+            logger.debug(f"Skipping duplicate entry from a different feed: {entry.link}")
+            continue
         article_data = extract_entry_data(entry)
-        if article_data and article_data['link'] not in processed_links:
+        if article_data:
             article_data_list.append(article_data)
             processed_links.add(article_data['link'])
-        elif article_data:
-             logger.debug(f"Skipping duplicate entry from a different feed: {article_data['link']}")
+
+    if skipped_known_links:
+        logger.info(f"Skipped {len(skipped_known_links)} already processed articles before extraction.")
+    _fetch_stats['skipped_processed'] = len(skipped_known_links)
 
     logger.info(f"Extracted data for {len(article_data_list)} unique articles.")
-    return article_data_list
\ No newline at end of file
+    return article_data_list
@@ -2,11 +2,51 @@ import sqlite3
 import logging
 import datetime
 import os
+import threading
+import atexit
+import json
 from config import config # Import the already loaded config
 
 # Get the database file path from config, ensure directory exists
 db_config = config.get('state_database', {})
 DB_FILE = db_config.get('db_file', 'processed_articles.db') # Use default name if not in config
+# Number of queued status updates that triggers a write; flush() also writes at stage boundaries
+STATUS_BATCH_SIZE = max(1, int(db_config.get('status_batch_size', 50)))
+
+# SQLite limits the number of bound parameters per statement (999 on older builds)
+_LOOKUP_CHUNK_SIZE = 500
+
+# Pragmas applied once to the long-lived connection
+_CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",    # Readers don't block the writer, and commits append to the WAL instead of rewriting pages
+    "PRAGMA synchronous=NORMAL",  # Safe with WAL; fsync only at checkpoints instead of on every commit
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",    # ~8 MB page cache
+    "PRAGMA busy_timeout=5000",   # Wait instead of failing if another process holds the lock
+)
+
+# SQL statements are module constants so sqlite3's statement cache reuses the prepared statements
+_UPSERT_STATUS_SQL = """
+INSERT INTO processed_articles (url, processed_at, status, title, filter_result, attempts, article_data)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(url) DO UPDATE SET
+    processed_at = excluded.processed_at,
+    status = excluded.status,
+    title = excluded.title,
+    filter_result = excluded.filter_result,
+    attempts = CASE
+        WHEN excluded.attempts = 0 THEN 0                                            -- Not a failure, reset
+        WHEN processed_articles.status = excluded.status THEN processed_articles.attempts + 1 -- Same stage failed again
+        ELSE 1                                                                        -- First failure at this stage
+    END,
+    article_data = COALESCE(excluded.article_data, processed_articles.article_data);
+"""
+_SELECT_URL_SQL = "SELECT 1 FROM processed_articles WHERE url = ?"
+_COUNT_SQL = "SELECT COUNT(*) FROM processed_articles"
+
+_conn = None
+_conn_lock = threading.RLock() # Guards the shared connection and the pending status queue
+_pending_status_rows = []
 
 def _ensure_db_directory_exists():
     """Ensures the directory for the SQLite database file exists."""
@@ -19,87 +59,351 @@ def _ensure_db_directory_exists():
             logging.error(f"Failed to create directory for database {db_dir}: {e}")
             raise
 
-def initialize_db():
-    """Initializes the SQLite database, creating the table if it doesn't exist."""
-    _ensure_db_directory_exists()
+def _get_connection():
+    """Returns the long-lived database connection, opening it on first use. Caller must hold _conn_lock."""
+    global _conn
+    if _conn is None:
+        _ensure_db_directory_exists()
+        # check_same_thread=False: the connection is shared across worker threads, serialized by _conn_lock
+        _conn = sqlite3.connect(DB_FILE, check_same_thread=False, cached_statements=64)
+        for pragma in _CONNECTION_PRAGMAS:
+            _conn.execute(pragma)
+        logging.debug(f"Opened persistent database connection to {DB_FILE}")
+    return _conn
+
+def _flush_locked():
+    """Writes all queued status updates in a single transaction. Caller must hold _conn_lock.
+
+    The updates stay queued if the transaction fails, so the next flush retries them.
+    """
+    if not _pending_status_rows:
+        return
+    rows = list(_pending_status_rows)
+    conn = _get_connection()
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS processed_articles (
-            url TEXT PRIMARY KEY,
-            processed_at TIMESTAMP NOT NULL,
-            status TEXT,          -- e.g., 'filtered', 'processed', 'pushed', 'failed_fetch', 'failed_ai', 'failed_push'
-            title TEXT,           -- Store title for easier debugging
-            filter_result TEXT    -- Store AI filter decision (optional)
-        )''')
-        conn.commit()
-        logging.info(f"Database initialized successfully at {DB_FILE}")
+        with conn: # Commits on success, rolls back on error
+            conn.executemany(_UPSERT_STATUS_SQL, rows)
     except sqlite3.Error as e:
-        logging.error(f"Database error during initialization at {DB_FILE}: {e}")
-        raise # Propagate error if DB can't be initialized
-    finally:
-        if conn:
-            conn.close()
+        logging.error(f"Database error flushing {len(rows)} article status updates (kept queued for the next flush): {e}")
+        return
+    _pending_status_rows.clear()
+    logging.debug(f"Flushed {len(rows)} article status updates to the database")
+
+def _migrate_processed_articles(cursor):
+    """Adds columns introduced after the first release to an existing processed_articles table."""
+    cursor.execute("PRAGMA table_info(processed_articles)")
+    existing_columns = {row[1] for row in cursor.fetchall()}
+    for column, definition in (('attempts', 'INTEGER NOT NULL DEFAULT 0'), ('article_data', 'TEXT')):
+        if column not in existing_columns:
+            cursor.execute(f"ALTER TABLE processed_articles ADD COLUMN {column} {definition}")
+            logging.info(f"Added column '{column}' to processed_articles table")
+
+def initialize_db():
+    """Initializes the SQLite database, creating the tables if they don't exist."""
+    with _conn_lock:
+        try:
+            conn = _get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS processed_articles (
+                url TEXT PRIMARY KEY,
+                processed_at TIMESTAMP NOT NULL,
+                status TEXT,          -- e.g., 'filtered', 'processed', 'pushed', 'failed_fetch', 'failed_ai', 'failed_push'
+                title TEXT,           -- Store title for easier debugging
+                filter_result TEXT,   -- Store AI filter decision (optional)
+                attempts INTEGER NOT NULL DEFAULT 0, -- Consecutive failures at the current status
+                article_data TEXT     -- JSON of the feed entry data, needed to resume the article later
+            )''')
+            _migrate_processed_articles(cursor)
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS feed_cache (
+                url TEXT PRIMARY KEY,
+                etag TEXT,            -- ETag header from the last successful fetch
+                modified TEXT,        -- Last-Modified header from the last successful fetch
+                content_hash TEXT,    -- SHA-256 of the last fetched feed body
+                fetched_at TIMESTAMP NOT NULL
+            )''')
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS article_artifacts (
+                url TEXT NOT NULL,    -- Article the artifact belongs to (processed_articles.url)
+                kind TEXT NOT NULL,   -- 'raw_html', 'extracted_html', 'stage2_verdict' or 'markdown'
+                path TEXT NOT NULL,   -- Location of the compressed artifact in the artifact store
+                size INTEGER,         -- Compressed size in bytes
+                stored_at TIMESTAMP NOT NULL,
+                PRIMARY KEY (url, kind)
+            )''')
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_article_artifacts_path ON article_artifacts (path)")
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS batch_jobs (
+                batch_id TEXT PRIMARY KEY, -- ID assigned by the batch endpoint
+                stage TEXT NOT NULL,       -- 'filter_stage1', 'filter_stage2' or 'process'
+                status TEXT NOT NULL,      -- Last status seen at the endpoint, or 'collected' once its output was read
+                input_file TEXT,           -- Local JSONL file the job was submitted from
+                request_count INTEGER,
+                created_at TIMESTAMP NOT NULL,
+                updated_at TIMESTAMP NOT NULL
+            )''')
+            conn.commit()
+            logging.info(f"Database initialized successfully at {DB_FILE}")
+        except sqlite3.Error as e:
+            logging.error(f"Database error during initialization at {DB_FILE}: {e}")
+            raise # Propagate error if DB can't be initialized
 
 def is_article_processed(url):
     """Checks if an article URL exists in the processed articles database."""
-    conn = None
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1 FROM processed_articles WHERE url = ?", (url,))
-        result = cursor.fetchone()
-        return result is not None
-    except sqlite3.Error as e:
-        logging.error(f"Database error while checking URL {url}: {e}")
-        return False # Assume not processed if DB error occurs
-    finally:
-        if conn:
-            conn.close()
-
-def mark_article_status(url, status, title="N/A", filter_result=None):
-    """Marks an article URL with a specific status in the database. Inserts or updates."""
-    conn = None
+    with _conn_lock:
+        try:
+            _flush_locked() # Make queued status updates visible
+            cursor = _get_connection().execute(_SELECT_URL_SQL, (url,))
+            return cursor.fetchone() is not None
+        except sqlite3.Error as e:
+            logging.error(f"Database error while checking URL {url}: {e}")
+            return False # Assume not processed if DB error occurs
+
+def get_processed_urls(urls):
+    """Returns the subset of the given URLs that already exist in the processed articles database.
+
+    Uses one query per chunk of URLs instead of a lookup per URL.
+    """
+    urls = list(urls)
+    found = set()
+    if not urls:
+        return found
+    with _conn_lock:
+        try:
+            _flush_locked()
+            conn = _get_connection()
+            for start in range(0, len(urls), _LOOKUP_CHUNK_SIZE):
+                chunk = urls[start:start + _LOOKUP_CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                cursor = conn.execute(f"SELECT url FROM processed_articles WHERE url IN ({placeholders})", chunk)
+                found.update(row[0] for row in cursor.fetchall())
+            return found
+        except sqlite3.Error as e:
+            logging.error(f"Database error during bulk lookup of {len(urls)} URLs: {e}")
+            return set() # Assume nothing processed if DB error occurs, same as is_article_processed
+
+def mark_article_status(url, status, title="N/A", filter_result=None, article_data=None):
+    """Marks an article URL with a specific status in the database. Inserts or updates.
+
+    Statuses starting with 'failed_' count as an attempt at the current stage; any
+    other status resets the attempt counter. article_data (the feed entry dict) is
+    stored so the article can be resumed later; an existing value is kept if None.
+
+    Updates are queued and written in batches of STATUS_BATCH_SIZE; call flush()
+    at stage boundaries to write them immediately.
+    """
     timestamp = datetime.datetime.now().isoformat()
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        # Use INSERT OR REPLACE (or ON CONFLICT UPDATE) to handle existing entries
-        cursor.execute("""
-        INSERT INTO processed_articles (url, processed_at, status, title, filter_result)
-        VALUES (?, ?, ?, ?, ?)
-        ON CONFLICT(url) DO UPDATE SET
-            processed_at = excluded.processed_at,
-            status = excluded.status,
-            title = excluded.title,
-            filter_result = excluded.filter_result;
-        """, (url, timestamp, status, title, filter_result))
-        conn.commit()
+    attempts = 1 if status.startswith('failed_') else 0
+    article_json = json.dumps(article_data) if article_data else None
+    with _conn_lock:
+        _pending_status_rows.append((url, timestamp, status, title, filter_result, attempts, article_json))
         logging.debug(f"Marked article '{url}' with status '{status}'")
-    except sqlite3.Error as e:
-        logging.error(f"Database error marking status '{status}' for {url}: {e}")
-    finally:
-        if conn:
-            conn.close()
+        if len(_pending_status_rows) >= STATUS_BATCH_SIZE:
+            _flush_locked()
+
+def get_resumable_articles(statuses, max_attempts=3, backoff_base_seconds=3600, backoff_max_seconds=86400):
+    """Returns articles whose status is in `statuses` and that are due for another attempt.
+
+    Failed articles are retried with exponential backoff (backoff_base_seconds * 2^(attempts - 1),
+    capped at backoff_max_seconds) measured from their last status update, and are given up
+    once they have failed max_attempts times at the same stage. Intermediate (non-failed)
+    statuses are always due, since they only remain after an interrupted run.
+    Rows without stored article data (written before resuming existed) are never resumed.
+    """
+    statuses = list(statuses)
+    if not statuses:
+        return []
+    now = datetime.datetime.now()
+    placeholders = ','.join('?' * len(statuses))
+    with _conn_lock:
+        try:
+            _flush_locked()
+            cursor = _get_connection().execute(
+                f"SELECT url, status, title, filter_result, attempts, article_data, processed_at "
+                f"FROM processed_articles WHERE status IN ({placeholders}) AND attempts < ? AND article_data IS NOT NULL ORDER BY processed_at",
+                statuses + [max_attempts])
+            rows = cursor.fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Database error retrieving resumable articles: {e}")
+            return []
+
+    resumable = []
+    for url, status, title, filter_result, attempts, article_json, processed_at in rows:
+        if attempts > 0:
+            backoff = min(backoff_base_seconds * (2 ** (attempts - 1)), backoff_max_seconds)
+            try:
+                due_at = datetime.datetime.fromisoformat(processed_at) + datetime.timedelta(seconds=backoff)
+            except (TypeError, ValueError):
+                due_at = now # Unparseable timestamp, retry now rather than never
+            if due_at > now:
+                continue
+        try:
+            article_data = json.loads(article_json) if article_json else None
+        except json.JSONDecodeError:
+            article_data = None
+        resumable.append({
+            'url': url,
+            'status': status,
+            'title': title,
+            'filter_result': filter_result,
+            'attempts': attempts,
+            'article_data': article_data,
+        })
+    return resumable
+
+def flush():
+    """Writes all queued status updates to the database in one transaction."""
+    with _conn_lock:
+        _flush_locked()
+
+def close():
+    """Flushes queued status updates and closes the persistent connection."""
+    global _conn
+    with _conn_lock:
+        _flush_locked()
+        if _conn is not None:
+            try:
+                _conn.close()
+            except sqlite3.Error as e:
+                logging.error(f"Database error closing connection to {DB_FILE}: {e}")
+            _conn = None
+
+def get_feed_cache_entries():
+    """Returns a dict mapping feed URL to its cached ETag, Last-Modified and content hash."""
+    with _conn_lock:
+        try:
+            cursor = _get_connection().execute("SELECT url, etag, modified, content_hash FROM feed_cache")
+            return {
+                url: {'etag': etag, 'modified': modified, 'content_hash': content_hash}
+                for url, etag, modified, content_hash in cursor.fetchall()
+            }
+        except sqlite3.Error as e:
+            logging.error(f"Database error retrieving feed cache: {e}")
+            return {} # Behave as if nothing is cached
+
+def update_feed_cache(entries):
+    """Stores ETag, Last-Modified and content hash for feeds. Expects a dict of url -> cache entry."""
+    if not entries:
+        return
+    timestamp = datetime.datetime.now().isoformat()
+    with _conn_lock:
+        try:
+            with _get_connection() as conn:
+                conn.executemany("""
+                INSERT INTO feed_cache (url, etag, modified, content_hash, fetched_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    etag = excluded.etag,
+                    modified = excluded.modified,
+                    content_hash = excluded.content_hash,
+                    fetched_at = excluded.fetched_at;
+                """, [(url, entry.get('etag'), entry.get('modified'), entry.get('content_hash'), timestamp)
+                      for url, entry in entries.items()])
+            logging.debug(f"Updated feed cache for {len(entries)} feeds")
+        except sqlite3.Error as e:
+            logging.error(f"Database error updating feed cache: {e}")
+
+def record_artifact_ref(url, kind, path, size):
+    """References a stored artifact (see artifact_store) from the article it belongs to."""
+    timestamp = datetime.datetime.now().isoformat()
+    with _conn_lock:
+        try:
+            with _get_connection() as conn:
+                conn.execute("""
+                INSERT INTO article_artifacts (url, kind, path, size, stored_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(url, kind) DO UPDATE SET
+                    path = excluded.path,
+                    size = excluded.size,
+                    stored_at = excluded.stored_at;
+                """, (url, kind, path, size, timestamp))
+        except sqlite3.Error as e:
+            logging.error(f"Database error recording '{kind}' artifact for {url}: {e}")
+
+def get_artifact_refs(url):
+    """Returns a dict mapping artifact kind to its path for an article."""
+    with _conn_lock:
+        try:
+            cursor = _get_connection().execute("SELECT kind, path FROM article_artifacts WHERE url = ?", (url,))
+            return dict(cursor.fetchall())
+        except sqlite3.Error as e:
+            logging.error(f"Database error retrieving artifacts for {url}: {e}")
+            return {}
+
+def delete_artifact_refs(paths):
+    """Removes the references to artifacts that were evicted from the artifact store."""
+    if not paths:
+        return
+    with _conn_lock:
+        try:
+            with _get_connection() as conn:
+                conn.executemany("DELETE FROM article_artifacts WHERE path = ?", [(path,) for path in paths])
+        except sqlite3.Error as e:
+            logging.error(f"Database error deleting {len(paths)} artifact references: {e}")
+
+def record_batch_job(batch_id, stage, status, input_file=None, request_count=None):
+    """Records a submitted batch job (see batch_jobs) or updates its status."""
+    timestamp = datetime.datetime.now().isoformat()
+    with _conn_lock:
+        try:
+            with _get_connection() as conn:
+                conn.execute("""
+                INSERT INTO batch_jobs (batch_id, stage, status, input_file, request_count, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(batch_id) DO UPDATE SET
+                    status = excluded.status,
+                    updated_at = excluded.updated_at;
+                """, (batch_id, stage, status, input_file, request_count, timestamp, timestamp))
+        except sqlite3.Error as e:
+            logging.error(f"Database error recording batch job {batch_id}: {e}")
+
+def get_uncollected_batch_jobs(stage):
+    """Returns (batch_id, status) for the batch jobs of a stage whose output has not been read yet."""
+    with _conn_lock:
+        try:
+            cursor = _get_connection().execute(
+                "SELECT batch_id, status FROM batch_jobs WHERE stage = ? AND status != 'collected' ORDER BY created_at", (stage,))
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Database error retrieving batch jobs for stage '{stage}': {e}")
+            return []
 
 # --- Optional: Functions to get stats or specific articles --- #
 
 def get_processed_count():
     """Returns the total number of articles recorded in the database."""
-    conn = None
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM processed_articles")
-        count = cursor.fetchone()[0]
-        return count
-    except sqlite3.Error as e:
-        logging.error(f"Database error retrieving processed count: {e}")
-        return 0
-    finally:
-        if conn:
-            conn.close()
+    with _conn_lock:
+        try:
+            _flush_locked()
+            return _get_connection().execute(_COUNT_SQL).fetchone()[0]
+        except sqlite3.Error as e:
+            logging.error(f"Database error retrieving processed count: {e}")
+            return 0
+
+def get_filter_results():
+    """Returns (title, filter_result, article_data) for every article with a recorded filter result.
+
+    article_data is the decoded feed entry (or None for rows written before it was stored).
+    """
+    with _conn_lock:
+        try:
+            _flush_locked()
+            rows = _get_connection().execute(
+                "SELECT title, filter_result, article_data FROM processed_articles WHERE filter_result IS NOT NULL").fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Database error retrieving filter results: {e}")
+            return []
+    results = []
+    for title, filter_result, article_json in rows:
+        try:
+            article_data = json.loads(article_json) if article_json else None
+        except json.JSONDecodeError:
+            article_data = None
+        results.append((title, filter_result, article_data))
+    return results
 
 # Ensure database is initialized on module load
-initialize_db() 
\ No newline at end of file
+initialize_db()
+# Never lose queued status updates on interpreter shutdown
+atexit.register(close)
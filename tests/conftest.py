@@ -0,0 +1,39 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The modules read config.yaml from the working directory when they are imported, and keep their databases and
+# artifacts next to it. Run the tests from a scratch directory with a minimal configuration of their own.
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_CONFIG = """
+medium_feeds:
+  - "http://localhost.invalid/feed"
+ai_filter: {}
+fetch_config:
+  cookie_file: "cookies.txt"
+target_api:
+  url: "http://localhost.invalid/articles"
+state_database:
+  db_file: "state.db"
+logging:
+  level: "WARNING"
+"""
+
+_work_dir = tempfile.mkdtemp(prefix='medium_feed_tests_')
+with open(os.path.join(_work_dir, 'config.yaml'), 'w', encoding='utf-8') as f:
+    f.write(TEST_CONFIG)
+os.chdir(_work_dir)
+sys.path.insert(0, REPO_DIR)
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Gives the test a fresh state database of its own."""
+    import state_manager
+    state_manager.close()
+    monkeypatch.setattr(state_manager, 'DB_FILE', str(tmp_path / 'state.db'))
+    state_manager.initialize_db()
+    yield
+    state_manager.close()
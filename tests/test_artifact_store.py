@@ -0,0 +1,95 @@
+import gzip
+import os
+import random
+import string
+import time
+
+import pytest
+
+import artifact_store
+import state_manager
+
+pytestmark = pytest.mark.usefixtures('database')
+
+URL_A, URL_B, URL_C = 'https://medium.com/p/a', 'https://medium.com/p/b', 'https://medium.com/p/c'
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifact_store, 'ENABLED', True)
+    monkeypatch.setattr(artifact_store, 'STORE_DIR', str(tmp_path / 'artifacts'))
+    monkeypatch.setattr(artifact_store, '_total_size', None)
+    return tmp_path / 'artifacts'
+
+
+def _incompressible(seed, length=4000):
+    rng = random.Random(seed)
+    return ''.join(rng.choice(string.ascii_letters + string.digits) for _ in range(length))
+
+
+def _set_mtime(path, seconds_ago):
+    stamp = time.time() - seconds_ago
+    os.utime(path, (stamp, stamp))
+
+
+def test_round_trip_is_compressed_and_referenced():
+    content = '<p>' + 'hello ' * 500 + '</p>'
+    path = artifact_store.save_artifact(URL_A, 'raw_html', content)
+    assert os.path.getsize(path) < len(content)
+    with open(path, 'rb') as f:
+        assert gzip.decompress(f.read()).decode('utf-8') == content
+    assert state_manager.get_artifact_refs(URL_A) == {'raw_html': path}
+    assert artifact_store.load_artifact(URL_A, 'raw_html') == content
+    assert artifact_store.load_artifact(URL_A, 'markdown') is None
+
+
+def test_overwriting_an_artifact_replaces_it():
+    artifact_store.save_artifact(URL_A, 'markdown', 'first')
+    artifact_store.save_artifact(URL_A, 'markdown', 'second')
+    assert artifact_store.load_artifact(URL_A, 'markdown') == 'second'
+
+
+def test_disabled_store_does_nothing(monkeypatch, store):
+    monkeypatch.setattr(artifact_store, 'ENABLED', False)
+    assert artifact_store.save_artifact(URL_A, 'raw_html', 'x') is None
+    assert artifact_store.load_artifact(URL_A, 'raw_html') is None
+    assert not store.exists()
+
+
+def test_missing_file_drops_its_reference():
+    path = artifact_store.save_artifact(URL_A, 'raw_html', 'x')
+    os.remove(path)
+    assert artifact_store.load_artifact(URL_A, 'raw_html') is None
+    assert state_manager.get_artifact_refs(URL_A) == {}
+
+
+def test_eviction_removes_least_recently_used_artifacts(monkeypatch):
+    path_a = artifact_store.save_artifact(URL_A, 'raw_html', _incompressible(1))
+    path_b = artifact_store.save_artifact(URL_B, 'raw_html', _incompressible(2))
+    size = os.path.getsize(path_a)
+    # Room for two artifacts, and the 90% target still holds two after evicting one
+    monkeypatch.setattr(artifact_store, 'MAX_SIZE_BYTES', int(size * 2.5))
+    _set_mtime(path_a, 200)
+    _set_mtime(path_b, 100)
+    assert artifact_store.load_artifact(URL_A, 'raw_html') == _incompressible(1) # Now the most recently used
+
+    path_c = artifact_store.save_artifact(URL_C, 'raw_html', _incompressible(3))
+
+    assert os.path.exists(path_a) and os.path.exists(path_c)
+    assert not os.path.exists(path_b)
+    assert state_manager.get_artifact_refs(URL_B) == {}
+    assert state_manager.get_artifact_refs(URL_A) == {'raw_html': path_a}
+    assert artifact_store._total_size == os.path.getsize(path_a) + os.path.getsize(path_c)
+
+
+def test_eviction_frees_space_down_to_the_headroom_target(monkeypatch):
+    paths = [artifact_store.save_artifact(f'https://medium.com/p/{i}', 'raw_html', _incompressible(i)) for i in range(4)]
+    for age, path in zip((400, 300, 200, 100), paths):
+        _set_mtime(path, age)
+    size = os.path.getsize(paths[0])
+    monkeypatch.setattr(artifact_store, 'MAX_SIZE_BYTES', int(size * 3.5))
+
+    artifact_store.save_artifact(URL_C, 'raw_html', _incompressible(9))
+
+    # 5 artifacts > 3.5, and the target of 3.15 leaves 3 after evicting the two oldest
+    assert [os.path.exists(path) for path in paths] == [False, False, True, True]
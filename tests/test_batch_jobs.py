@@ -0,0 +1,62 @@
+import json
+import logging
+from types import SimpleNamespace
+
+import batch_jobs
+
+
+def _line(custom_id, content='ok', status_code=200, error=None, body=None):
+    if body is None:
+        body = {'choices': [{'message': {'role': 'assistant', 'content': content}}]}
+    return json.dumps({
+        'id': f'batch_req_{custom_id}',
+        'custom_id': custom_id,
+        'response': {'status_code': status_code, 'request_id': 'r', 'body': body},
+        'error': error,
+    })
+
+
+def test_successful_lines_map_custom_id_to_content():
+    text = '\n'.join([_line('a', 'YES'), '', _line('b', '# Title\n\nText')])
+    assert batch_jobs._parse_output(text, 'process') == {'a': 'YES', 'b': '# Title\n\nText'}
+
+
+def test_failed_requests_are_logged_and_skipped(caplog):
+    text = '\n'.join([
+        _line('ok'),
+        _line('http', status_code=429, body={'error': {'message': 'Rate limit reached'}}),
+        json.dumps({'custom_id': 'expired', 'response': None, 'error': {'code': 'batch_expired', 'message': 'expired'}}),
+        _line('flagged', error={'code': 'server_error'}),
+    ])
+    with caplog.at_level(logging.ERROR, logger='batch_jobs'):
+        assert batch_jobs._parse_output(text, 'filter_stage1') == {'ok': 'ok'}
+    messages = '\n'.join(record.getMessage() for record in caplog.records)
+    assert 'http (filter_stage1) failed' in messages and 'Rate limit reached' in messages
+    assert 'expired (filter_stage1) failed' in messages
+    assert 'flagged (filter_stage1) failed' in messages
+
+
+def test_unreadable_and_unexpected_lines_are_skipped(caplog):
+    text = '\n'.join([
+        '{"custom_id": "truncated", "resp',
+        _line('empty', body={'choices': []}),
+        _line('no_body', body={}),
+        _line('good', 'fine'),
+    ])
+    with caplog.at_level(logging.ERROR, logger='batch_jobs'):
+        assert batch_jobs._parse_output(text, 'process') == {'good': 'fine'}
+    assert len(caplog.records) == 3
+
+
+def test_read_results_returns_output_and_logs_error_file(caplog):
+    files = {'out': _line('a', 'YES'), 'err': _line('b', status_code=500, body={'error': {'message': 'boom'}})}
+    client = SimpleNamespace(files=SimpleNamespace(content=lambda file_id: SimpleNamespace(text=files[file_id])))
+    batch = SimpleNamespace(output_file_id='out', error_file_id='err')
+    with caplog.at_level(logging.ERROR, logger='batch_jobs'):
+        assert batch_jobs._read_results(client, batch, 'process') == {'a': 'YES'}
+    assert 'boom' in caplog.text
+
+
+def test_read_results_without_files():
+    batch = SimpleNamespace(output_file_id=None, error_file_id=None)
+    assert batch_jobs._read_results(object(), batch, 'process') == {}
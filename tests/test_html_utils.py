@@ -0,0 +1,123 @@
+import pytest
+
+import utils
+from utils import HTML_SAMPLE_GAP, compact_html, estimate_tokens, sample_html_blocks, split_html_blocks
+
+
+@pytest.fixture(autouse=True)
+def character_token_estimates(monkeypatch):
+    """Uses the ~4 characters per token estimate whether or not tiktoken is installed."""
+    monkeypatch.setattr(utils, '_get_token_encoding', lambda: None)
+
+
+def paragraphs(count, words=40):
+    return ''.join(f'<p>Paragraph {i} {"word " * words}</p>' for i in range(count))
+
+
+def test_estimate_tokens_without_tiktoken():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens(None) == 0
+    assert estimate_tokens('x' * 400) == 101
+
+
+def test_split_keeps_document_order_and_all_blocks():
+    html = paragraphs(20)
+    chunks = split_html_blocks(f'<article><section>{html}</section></article>', 200)
+    assert len(chunks) > 1
+    assert ''.join(chunks) == html
+    assert all(estimate_tokens(chunk) <= 200 for chunk in chunks)
+
+
+def test_split_descends_into_an_oversized_block_with_children():
+    chunks = split_html_blocks(f'<blockquote>{paragraphs(10)}</blockquote>', 100)
+    assert len(chunks) == 10
+    assert chunks[0].startswith('<p>Paragraph 0 ')
+
+
+def test_split_keeps_an_oversized_leaf_block_whole():
+    code = '<pre>' + 'x = 1\n' * 400 + '</pre>'
+    chunks = split_html_blocks('<p>Intro</p>' + code + '<p>End</p>', 100)
+    assert code in chunks
+
+
+def test_split_empty_content():
+    assert split_html_blocks('', 100) == []
+
+
+def test_sample_returns_content_within_budget_unchanged():
+    html = paragraphs(3)
+    assert sample_html_blocks(html, 10000) == (html, False)
+
+
+def test_sample_keeps_beginning_middle_and_conclusion():
+    html = paragraphs(100)
+    sampled, was_sampled = sample_html_blocks(html, 1000)
+    assert was_sampled
+    assert sampled.startswith('<p>Paragraph 0 ')
+    assert sampled.endswith('<p>Paragraph 99 ' + 'word ' * 40 + '</p>')
+    # Three middle sections around 1/4, 1/2 and 3/4 of the part between head and tail, with a gap on either side
+    assert sampled.count(HTML_SAMPLE_GAP) == 4
+    assert all(f'<p>Paragraph {i} ' in sampled for i in (29, 52, 74))
+    assert HTML_SAMPLE_GAP * 2 not in sampled
+    assert estimate_tokens(sampled.replace(HTML_SAMPLE_GAP, '')) <= 1000
+
+
+def test_sample_cuts_an_oversized_leaf_block_to_the_budget():
+    html = '<pre>' + 'x' * 40000 + '</pre>'
+    sampled, was_sampled = sample_html_blocks(html, 1000)
+    assert was_sampled
+    assert estimate_tokens(sampled) <= 1000
+
+
+def test_sample_plain_text_by_lines():
+    text = '\n'.join(f'Line {i} ' + 'word ' * 20 for i in range(200))
+    sampled, was_sampled = sample_html_blocks(text, 500)
+    assert was_sampled
+    assert sampled.startswith('Line 0 ')
+    assert 'Line 199 ' in sampled
+    assert HTML_SAMPLE_GAP in sampled
+
+
+def test_sample_without_middle_sections():
+    sampled, _ = sample_html_blocks(paragraphs(100), 1000, middle_sections=0)
+    assert sampled.count(HTML_SAMPLE_GAP) == 1
+
+
+def test_compact_drops_wrappers_and_attributes():
+    html = ('<div class="a" data-x="1"><section><p class="pw" style="x" data-selectable-paragraph="">'
+            'Some <strong class="b">bold</strong> and a <a href="https://x.y" rel="noopener" class="z">link</a>.</p></section></div>')
+    assert compact_html(html) == '<p>Some <strong>bold</strong> and a <a href="https://x.y">link</a>.</p>'
+
+
+def test_compact_keeps_image_source_and_alt():
+    html = '<figure><div><picture><img alt="A cat" class="c" width="700" src="cat.jpg"/></picture></div><figcaption>Cat</figcaption></figure>'
+    assert compact_html(html) == '<figure><img alt="A cat" src="cat.jpg"/><figcaption>Cat</figcaption></figure>'
+
+
+def test_compact_takes_lazy_image_source_from_srcset():
+    assert compact_html('<p><img alt="x" srcset="a.jpg 640w, b.jpg 720w"/></p>') == '<p><img alt="x" src="a.jpg"/></p>'
+
+
+def test_compact_removes_scripts_comments_buttons_and_empty_elements():
+    html = '<p>Text</p><!-- note --><script>x()</script><button>Follow</button><p class="empty"><span> </span></p><svg><path/></svg>'
+    assert compact_html(html) == '<p>Text</p>'
+
+
+def test_compact_collapses_whitespace_but_not_in_code():
+    html = '<p>Two   words\n here</p>\n\n<pre><code>def f():\n    return  1</code></pre>'
+    assert compact_html(html) == '<p>Two words here</p><pre><code>def f():\n    return  1</code></pre>'
+
+
+def test_compact_keeps_spaces_between_inline_elements():
+    assert compact_html('<p><em>a</em> <strong>b</strong></p>') == '<p><em>a</em> <strong>b</strong></p>'
+
+
+def test_compact_is_idempotent():
+    once = compact_html('<div><ul class="l"><li class="x">one</li>\n<li>two <code>x  y</code></li></ul></div>')
+    assert once == '<ul><li>one</li><li>two <code>x  y</code></li></ul>'
+    assert compact_html(once) == once
+
+
+@pytest.mark.parametrize('content', ['', None, 'plain text, not HTML'])
+def test_compact_leaves_non_html_alone(content):
+    assert compact_html(content) == content
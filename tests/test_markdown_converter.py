@@ -0,0 +1,106 @@
+import pytest
+
+from markdown_converter import apply_annotations, html_to_markdown
+
+
+@pytest.mark.parametrize('html, markdown', [
+    ('<h2>A  <em>title</em></h2>', '## A *title*\n'),
+    ('<p>Some <strong>bold</strong> and <em>italic</em> text.</p>', 'Some **bold** and *italic* text.\n'),
+    ('<p><strong>bold </strong>word</p>', '**bold** word\n'),
+    ('<p>Read <a href="https://x.y/z">the docs</a>.</p>', 'Read [the docs](https://x.y/z).\n'),
+    ('<p><a href="https://x.y"></a>no link text</p>', 'no link text\n'),
+    ('<p>Call <code>f(x)</code> or <code>a`b</code>.</p>', 'Call `f(x)` or ``a`b``.\n'),
+    ('<p>2 * 3 = [six] and snake_case</p>', '2 \\* 3 = \\[six\\] and snake\\_case\n'),
+    ('<p>line one<br/>line two</p>', 'line one  \nline two\n'),
+    ('<hr/>', '---\n'),
+    ('', ''),
+])
+def test_inline_and_simple_blocks(html, markdown):
+    assert html_to_markdown(html) == markdown
+
+
+def test_paragraphs_are_separated_by_blank_lines():
+    assert html_to_markdown('<article><div><p>One</p></div><section><p>Two</p></section></article>') == 'One\n\nTwo\n'
+
+
+def test_code_block_keeps_its_text_verbatim():
+    html = '<pre><span class="x">def f():\n    return  a*b_c</span></pre>'
+    assert html_to_markdown(html) == '```\ndef f():\n    return  a*b_c\n```\n'
+
+
+def test_code_block_containing_a_fence_uses_a_longer_fence():
+    assert html_to_markdown('<pre>```\nx\n```</pre>') == '````\n```\nx\n```\n````\n'
+
+
+def test_nested_and_ordered_lists():
+    html = '<ol start="3"><li>three<ul><li>inner</li></ul></li><li>four</li></ol>'
+    assert html_to_markdown(html) == '3. three\n   - inner\n4. four\n'
+
+
+def test_blockquote_with_several_paragraphs():
+    assert html_to_markdown('<blockquote><p>One</p><p>Two</p></blockquote>') == '> One\n>\n> Two\n'
+
+
+def test_figure_uses_the_first_image_and_the_caption():
+    html = ('<figure><picture><source srcset="a.webp 640w"/><img alt="" srcset="c.jpg 640w, d.jpg 720w"/></picture>'
+            '<img src="other.jpg"/><figcaption>A cat_photo</figcaption></figure>')
+    assert html_to_markdown(html) == '![image](c.jpg)\n\n*A cat\\_photo*\n'
+
+
+def test_table_pads_short_rows_and_escapes_pipes():
+    html = '<table><tr><th>a</th><th>b</th></tr><tr><td>1|2</td></tr></table>'
+    assert html_to_markdown(html) == '| a | b |\n| --- | --- |\n| 1\\|2 |  |\n'
+
+
+def test_scripts_buttons_and_comments_are_dropped():
+    assert html_to_markdown('<p>Text<!-- c --></p><script>x()</script><button>Follow</button>') == 'Text\n'
+
+
+def test_loose_inline_content_becomes_a_paragraph():
+    assert html_to_markdown('<div>Hello <strong>you</strong><p>Next</p></div>') == 'Hello **you**\n\nNext\n'
+
+
+def test_annotates_first_occurrence_case_insensitively():
+    markdown, applied = apply_annotations('Gradient descent is slow. gradient descent again.', {'gradient descent': '梯度下降'})
+    assert markdown == 'Gradient descent (梯度下降) is slow. gradient descent again.'
+    assert applied == 1
+
+
+def test_longer_terms_win_over_terms_they_contain():
+    markdown, applied = apply_annotations('Use concurrency control here.', {'control': '控制', 'concurrency control': '并发控制'})
+    assert markdown == 'Use concurrency control (并发控制) here.'
+    assert applied == 1
+
+
+def test_matches_whole_words_only():
+    markdown, applied = apply_annotations('Uncontrolled re-entrant entrant.', {'control': '控制', 'entrant': '进入者'})
+    assert markdown == 'Uncontrolled re-entrant entrant (进入者).'
+    assert applied == 1
+
+
+def test_code_spans_and_blocks_are_not_annotated():
+    markdown = 'Run `latency probe` and\n\n```\nlatency\n```\n\nthen check latency.'
+    annotated, applied = apply_annotations(markdown, {'latency': '延迟', 'probe': '探针'})
+    assert annotated == 'Run `latency probe` and\n\n```\nlatency\n```\n\nthen check latency (延迟).'
+    assert applied == 1
+
+
+def test_link_text_is_annotated_but_urls_and_images_are_not():
+    markdown = '![latency chart](https://x.y/latency.png) See [latency notes](https://x.y/latency).'
+    annotated, applied = apply_annotations(markdown, {'latency': '延迟'})
+    assert annotated == '![latency chart](https://x.y/latency.png) See [latency (延迟) notes](https://x.y/latency).'
+    assert applied == 1
+
+
+def test_terms_with_regex_characters_are_matched_literally():
+    annotated, _ = apply_annotations('We use C++ (sometimes). Also Cxx.', {'C++': 'C加加'})
+    assert annotated == 'We use C++ (C加加) (sometimes). Also Cxx.'
+
+
+@pytest.mark.parametrize('annotations', [{}, {' ': 'x'}, {'term': ''}, {'term': None}, {3: 'x'}])
+def test_unusable_annotations_leave_the_text_alone(annotations):
+    assert apply_annotations('A term here.', annotations) == ('A term here.', 0)
+
+
+def test_empty_markdown():
+    assert apply_annotations('', {'term': 'x'}) == ('', 0)
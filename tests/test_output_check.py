@@ -0,0 +1,93 @@
+import pytest
+
+import ai_processor
+from ai_processor import _OutputCheck
+
+SOURCE = 'x' * 2000 # The default 3x ratio allows 6000 characters of output
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    values = {}
+    monkeypatch.setattr(ai_processor, '_streaming_settings', lambda: values)
+    return values
+
+
+def _feed_all(check, pieces):
+    for piece in pieces:
+        reason = check.feed(piece)
+        if reason:
+            return reason
+    return check.finish()
+
+
+def _pieces(text, size=7):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_normal_markdown_passes():
+    markdown = '# Title\n\n' + '\n\n'.join(f'Paragraph {i} with **bold** text and `<div>` in code.' for i in range(40))
+    assert _feed_all(_OutputCheck(SOURCE), _pieces(markdown)) is None
+
+
+def test_echoed_html_is_caught_once_enough_output_arrived():
+    html = '<div class="a"><p>Hi <strong>there</strong></p></div>\n' * 20
+    check = _OutputCheck(SOURCE)
+    assert check.feed(html[:100]) is None # Below check_after_chars
+    reason = check.feed(html[100:])
+    assert reason and 'HTML' in reason
+
+
+def test_short_html_output_is_caught_when_the_stream_ends():
+    check = _OutputCheck(SOURCE)
+    assert check.feed('<p>Short <em>answer</em></p>') is None
+    assert 'HTML' in check.finish()
+
+
+def test_a_few_tags_in_markdown_are_allowed():
+    text = 'Some text with a <br> tag. ' + 'plain words ' * 50
+    assert _feed_all(_OutputCheck(SOURCE), _pieces(text)) is None
+
+
+def test_html_tag_share_is_configurable(settings):
+    settings['max_html_tag_share'] = 0.5
+    text = '<br>' * 30 + 'words ' * 100 # Tags are 30% of the first 400 characters
+    assert _feed_all(_OutputCheck(SOURCE), _pieces(text)) is None
+    settings['max_html_tag_share'] = 0.05
+    assert 'HTML' in _feed_all(_OutputCheck(SOURCE), _pieces(text))
+
+
+def test_repeated_line_is_caught_across_pieces():
+    text = 'Intro\n\n' + 'The same sentence again.\n\n' * 8
+    reason = _feed_all(_OutputCheck(SOURCE), _pieces(text, size=5))
+    assert reason == "the line 'The same sentence again.' repeats 8 times"
+
+
+def test_repeats_must_be_consecutive():
+    text = ('Line A\nLine B\n' * 20)
+    assert _feed_all(_OutputCheck(SOURCE), _pieces(text)) is None
+
+
+def test_repeated_line_without_trailing_newline_is_caught_at_the_end(settings):
+    settings['max_repeated_lines'] = 3
+    check = _OutputCheck(SOURCE)
+    assert check.feed('Again\nAgain\nAgain') is None # The last line is still partial
+    assert 'repeats 3 times' in check.finish()
+
+
+def test_max_repeated_lines_has_a_floor_of_two(settings):
+    settings['max_repeated_lines'] = 0
+    assert _OutputCheck(SOURCE).max_repeated_lines == 2
+
+
+def test_runaway_length_is_caught():
+    check = _OutputCheck(SOURCE)
+    assert check.feed('word ' * 1200) is None # 6000 characters, exactly the limit
+    assert check.feed('w') == 'the output grew past 3.0x the length of the input'
+
+
+def test_output_ratio_is_configurable(settings):
+    settings['max_output_ratio'] = 1
+    check = _OutputCheck('x' * 100)
+    assert check.feed(''.join(f'{i:03}\n' for i in range(25))) is None
+    assert 'past 1.0x' in check.feed('y')
@@ -0,0 +1,186 @@
+import asyncio
+
+import pytest
+
+import rate_limiter
+from rate_limiter import CircuitBreaker, ModelRateLimiter, TokenBucket, parse_retry_after
+
+
+class FakeTime:
+    """Stands in for the time module: sleep() advances the clock instead of waiting."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(rate_limiter, 'time', fake)
+    return fake
+
+
+def test_bucket_allows_a_burst_up_to_capacity(clock):
+    bucket = TokenBucket(rate=1, capacity=3)
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.acquire() == pytest.approx(1.0)
+
+
+def test_bucket_refills_at_rate_but_not_beyond_capacity(clock):
+    bucket = TokenBucket(rate=2, capacity=4)
+    bucket.acquire(4)
+    clock.now += 60
+    assert bucket.acquire(4) == 0.0
+    assert bucket.acquire(1) == pytest.approx(0.5)
+
+
+def test_request_larger_than_capacity_waits_for_a_full_bucket(clock):
+    bucket = TokenBucket(rate=10, capacity=5)
+    bucket.acquire(5)
+    assert bucket.acquire(50) == pytest.approx(0.5)
+
+
+def test_debit_can_go_negative_and_delays_later_acquires(clock):
+    bucket = TokenBucket(rate=1, capacity=2)
+    bucket.debit(4)
+    assert bucket.acquire(1) == pytest.approx(3.0)
+
+
+def test_pause_blocks_and_earns_nothing_while_paused(clock):
+    bucket = TokenBucket(rate=1, capacity=10)
+    bucket.pause(5)
+    assert bucket.acquire(2) == pytest.approx(7.0) # 5s pause, then 2 tokens at 1/s
+
+
+def test_debit_during_pause_does_not_earn_tokens(clock):
+    bucket = TokenBucket(rate=1, capacity=10)
+    bucket.pause(5)
+    clock.now += 1
+    bucket.debit(1)
+    clock.now += 4 # Pause is over, nothing earned yet
+    assert bucket.acquire(1) == pytest.approx(2.0)
+
+
+def test_pause_never_shortens_an_earlier_pause(clock):
+    bucket = TokenBucket(rate=4, capacity=4)
+    bucket.pause(10)
+    bucket.pause(2)
+    assert bucket.acquire(1) == pytest.approx(10.25)
+
+
+def test_acquire_async_waits_like_acquire(clock, monkeypatch):
+    async def fake_sleep(seconds):
+        clock.sleep(seconds)
+    monkeypatch.setattr(rate_limiter.asyncio, 'sleep', fake_sleep)
+    bucket = TokenBucket(rate=1, capacity=1)
+    assert asyncio.run(bucket.acquire_async()) == 0.0
+    assert asyncio.run(bucket.acquire_async()) == pytest.approx(1.0)
+
+
+def test_model_limiter_enforces_both_limits(clock):
+    limiter = ModelRateLimiter(requests_per_minute=60, tokens_per_minute=600)
+    start = clock.now
+    limiter.acquire(600)
+    limiter.acquire(300)
+    assert clock.now - start == pytest.approx(30.0) # The token limit, not the request limit, is the bottleneck
+
+
+def test_model_limiter_charges_usage_beyond_the_estimate(clock):
+    limiter = ModelRateLimiter(tokens_per_minute=600)
+    start = clock.now
+    limiter.acquire(100)
+    limiter.record_usage(100, 700) # 600 more than estimated: the bucket is now 100 tokens short
+    limiter.record_usage(100, 50) # Overestimates are not refunded
+    limiter.acquire(100)
+    assert clock.now - start == pytest.approx(20.0)
+
+
+def test_model_limiter_without_limits_never_waits(clock):
+    limiter = ModelRateLimiter()
+    limiter.acquire(10 ** 9)
+    limiter.pause(30)
+    limiter.acquire(1)
+    assert clock.slept == []
+
+
+def test_breaker_opens_after_threshold_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, cooldown_seconds=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert not breaker.is_open()
+    breaker.record_failure()
+    assert breaker.is_open()
+    assert breaker.wait() == pytest.approx(30.0)
+    assert not breaker.is_open()
+
+
+def test_breaker_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2, cooldown_seconds=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert not breaker.is_open()
+
+
+def test_breaker_half_open_reopens_on_the_next_failure(clock):
+    breaker = CircuitBreaker(failure_threshold=3, cooldown_seconds=30)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30 # Cooldown over: the next call is let through
+    assert not breaker.is_open()
+    breaker.record_failure()
+    assert breaker.is_open()
+
+
+def test_breaker_half_open_closes_on_success(clock):
+    breaker = CircuitBreaker(failure_threshold=3, cooldown_seconds=30)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    breaker.record_success()
+    breaker.record_failure()
+    assert not breaker.is_open()
+
+
+def test_failures_while_open_do_not_extend_the_cooldown(clock):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown_seconds=30)
+    breaker.record_failure()
+    clock.now += 20
+    breaker.record_failure()
+    assert breaker.wait() == pytest.approx(10.0)
+
+
+def test_open_for_keeps_the_later_deadline(clock):
+    breaker = CircuitBreaker(failure_threshold=5, cooldown_seconds=30)
+    breaker.open_for(60)
+    breaker.open_for(5)
+    assert breaker.wait() == pytest.approx(60.0)
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('120', 120.0),
+    (' 1.5 ', 1.5),
+    ('-3', 0.0),
+    ('', None),
+    (None, None),
+    ('soon', None),
+])
+def test_parse_retry_after_seconds(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date(clock):
+    clock.now = 784111777.0 # Sun, 06 Nov 1994 08:49:37 GMT
+    assert parse_retry_after('Sun, 06 Nov 1994 08:50:37 GMT') == pytest.approx(60.0)
+    assert parse_retry_after('Sun, 06 Nov 1994 08:00:00 GMT') == 0.0
@@ -0,0 +1,106 @@
+import json
+import re
+
+import pytest
+
+import ai_processor
+from ai_processor import _parse_batch_verdicts, _plan_stage1_batches
+
+
+def verdict_item(item_id, relevance='High', quality_type='In-depth', **extra):
+    return {'id': item_id, 'relevance': relevance, 'quality_type': quality_type, **extra}
+
+
+def answer(*items):
+    return json.dumps({'results': list(items)})
+
+
+def test_parses_all_items_by_id():
+    verdicts = _parse_batch_verdicts(answer(verdict_item(1, 'Low', 'Shallow'), verdict_item(0)), 2)
+    assert verdicts == {0: {'relevance': 'High', 'quality_type': 'In-depth'},
+                        1: {'relevance': 'Low', 'quality_type': 'Shallow'}}
+
+
+def test_missing_ids_are_left_out():
+    assert set(_parse_batch_verdicts(answer(verdict_item(0), verdict_item(2)), 3)) == {0, 2}
+
+
+def test_duplicate_ids_keep_the_first_answer():
+    verdicts = _parse_batch_verdicts(answer(verdict_item(0, 'High'), verdict_item(0, 'None')), 1)
+    assert verdicts == {0: {'relevance': 'High', 'quality_type': 'In-depth'}}
+
+
+@pytest.mark.parametrize('item_id', [-1, 3, 'x', None])
+def test_out_of_range_or_invalid_ids_are_ignored(item_id):
+    assert list(_parse_batch_verdicts(answer(verdict_item(item_id), verdict_item(0)), 3)) == [0]
+
+
+def test_numeric_string_ids_are_accepted():
+    assert list(_parse_batch_verdicts(answer(verdict_item('1')), 2)) == [1]
+
+
+def test_items_without_both_fields_are_ignored():
+    items = [{'id': 0, 'relevance': 'High'}, {'id': 1, 'quality_type': 'In-depth'}, 'High', verdict_item(2)]
+    assert list(_parse_batch_verdicts(answer(*items), 3)) == [2]
+
+
+def test_keeps_confidence_and_drops_other_keys():
+    verdicts = _parse_batch_verdicts(answer(verdict_item(0, confidence=0.8, reason='long text')), 1)
+    assert verdicts == {0: {'relevance': 'High', 'quality_type': 'In-depth', 'confidence': 0.8}}
+
+
+def test_accepts_a_bare_list():
+    assert list(_parse_batch_verdicts(json.dumps([verdict_item(0)]), 1)) == [0]
+
+
+@pytest.mark.parametrize('content', ['not json', None, json.dumps({'verdicts': []}), json.dumps('text')])
+def test_unusable_answers_give_no_verdicts(content):
+    assert _parse_batch_verdicts(content, 2) == {}
+
+
+def articles(count, summary_length=100):
+    return [{'title': f'Title {i}', 'link': f'https://medium.com/p/{i}', 'summary': 's' * summary_length}
+            for i in range(count)]
+
+
+def test_batches_are_cut_at_the_batch_size(monkeypatch):
+    monkeypatch.setitem(ai_processor.config['ai_filter'], 'stage1_batch_size', 4)
+    assert _plan_stage1_batches(articles(10)) == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+
+def test_batches_are_cut_at_the_token_budget(monkeypatch):
+    monkeypatch.setitem(ai_processor.config['ai_filter'], 'stage1_batch_size', 10)
+    monkeypatch.setitem(ai_processor.config['ai_filter'], 'stage1_batch_max_tokens', 200)
+    batches = _plan_stage1_batches(articles(6, summary_length=300))
+    assert [index for batch in batches for index in batch] == list(range(6))
+    assert all(len(batch) < 6 for batch in batches)
+
+
+def test_an_article_over_the_budget_still_gets_a_batch_of_its_own(monkeypatch):
+    monkeypatch.setitem(ai_processor.config['ai_filter'], 'stage1_batch_size', 10)
+    monkeypatch.setitem(ai_processor.config['ai_filter'], 'stage1_batch_max_tokens', 10)
+    assert _plan_stage1_batches(articles(3)) == [[0], [1], [2]]
+
+
+def test_batch_size_one_disables_batching(monkeypatch):
+    monkeypatch.setitem(ai_processor.config['ai_filter'], 'stage1_batch_size', 1)
+    assert _plan_stage1_batches(articles(3)) == [[0], [1], [2]]
+
+
+def test_articles_missing_from_the_answer_are_retried_individually(monkeypatch):
+    monkeypatch.setitem(ai_processor.config['ai_filter'], 'stage1_batch_size', 3)
+    monkeypatch.setattr(ai_processor, '_client_pool', object())
+    requests = []
+
+    def fake_completion(request, parse=None):
+        prompt = ' '.join(message['content'] for message in request['messages'])
+        ids = [int(item_id) for item_id in re.findall(r'\[Article id=(\d+)\]', prompt)]
+        requests.append(ids)
+        content = answer(*(verdict_item(item_id) for item_id in ids if item_id != 1)) if ids else \
+            json.dumps({'relevance': 'Low', 'quality_type': 'Shallow'})
+        return parse(content) if parse else content
+    monkeypatch.setattr(ai_processor, '_create_completion', fake_completion)
+
+    results = ai_processor.filter_articles_with_ai_batch(articles(3))
+    assert requests == [[0, 1, 2], []] # One batched call, then article 1 alone
+    assert [result['relevance'] for result in results] == ['High', 'Low', 'High']
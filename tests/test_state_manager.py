@@ -0,0 +1,102 @@
+import datetime
+
+import pytest
+
+import state_manager
+
+ENTRY = {'link': 'https://medium.com/p/a', 'title': 'A'}
+
+
+pytestmark = pytest.mark.usefixtures('database')
+
+
+def _age(url, hours):
+    """Moves the article's last status update back by the given number of hours."""
+    state_manager.flush()
+    processed_at = (datetime.datetime.now() - datetime.timedelta(hours=hours)).isoformat()
+    with state_manager._conn_lock:
+        with state_manager._get_connection() as conn:
+            conn.execute("UPDATE processed_articles SET processed_at = ? WHERE url = ?", (processed_at, url))
+
+
+def _fail(url, times, status='failed_ai'):
+    for _ in range(times):
+        state_manager.mark_article_status(url, status, 'A', article_data=ENTRY)
+
+
+def _urls(**kwargs):
+    return [row['url'] for row in state_manager.get_resumable_articles(['failed_ai', 'fetched'], **kwargs)]
+
+
+def test_interrupted_articles_are_resumed_immediately():
+    state_manager.mark_article_status('u1', 'fetched', 'A', article_data=ENTRY)
+    [row] = state_manager.get_resumable_articles(['fetched'])
+    assert row['url'] == 'u1'
+    assert row['attempts'] == 0
+    assert row['article_data'] == ENTRY
+
+
+def test_failed_article_waits_for_its_backoff():
+    _fail('u1', 1)
+    assert _urls(backoff_base_seconds=3600) == []
+    _age('u1', 1.1)
+    assert _urls(backoff_base_seconds=3600) == ['u1']
+
+
+def test_backoff_doubles_with_each_attempt():
+    _fail('u1', 2)
+    _age('u1', 1.5)
+    assert _urls(backoff_base_seconds=3600) == [] # Second attempt waits 2 hours
+    _age('u1', 2.1)
+    assert _urls(backoff_base_seconds=3600) == ['u1']
+
+
+def test_backoff_is_capped():
+    _fail('u1', 3)
+    _age('u1', 1.1)
+    assert _urls(max_attempts=5, backoff_base_seconds=3600) == []
+    assert _urls(max_attempts=5, backoff_base_seconds=3600, backoff_max_seconds=3600) == ['u1']
+
+
+def test_articles_are_given_up_after_max_attempts():
+    _fail('u1', 3)
+    _age('u1', 100)
+    assert _urls(max_attempts=3) == []
+    assert _urls(max_attempts=4) == ['u1']
+
+
+def test_attempts_restart_when_the_article_fails_at_another_stage():
+    _fail('u1', 2, 'failed_fetch')
+    _fail('u1', 1)
+    _age('u1', 1.1)
+    [row] = state_manager.get_resumable_articles(['failed_ai'], max_attempts=2)
+    assert row['attempts'] == 1
+
+
+def test_success_resets_attempts_and_keeps_article_data():
+    _fail('u1', 2)
+    state_manager.mark_article_status('u1', 'fetched', 'A')
+    [row] = state_manager.get_resumable_articles(['fetched'])
+    assert row['attempts'] == 0
+    assert row['article_data'] == ENTRY
+
+
+def test_rows_without_article_data_are_not_resumed():
+    state_manager.mark_article_status('u1', 'fetched', 'A')
+    state_manager.mark_article_status('u2', 'failed_ai', 'B')
+    _age('u2', 100)
+    assert _urls() == []
+
+
+def test_unparseable_timestamp_is_retried_now():
+    _fail('u1', 1)
+    state_manager.flush()
+    with state_manager._conn_lock:
+        with state_manager._get_connection() as conn:
+            conn.execute("UPDATE processed_articles SET processed_at = 'not a date' WHERE url = 'u1'")
+    assert _urls() == ['u1']
+
+
+def test_no_statuses():
+    _fail('u1', 1)
+    assert state_manager.get_resumable_articles([]) == []
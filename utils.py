@@ -1,8 +1,20 @@
 import logging
+import re
 import sys
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, Comment
 import http.cookiejar
 import io
+import threading
+
+# Optional: tiktoken for real token counts in estimate_tokens(); without it, a character-based estimate is used
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+_token_encoding = None
+_token_encoding_lock = threading.Lock()
 
 def setup_logging(level_str='INFO', log_file=None):
     """Configures logging for the application."""
@@ -140,4 +152,215 @@ def extract_main_content_from_html(html_content, url):
 
     except Exception as e:
         logging.error(f"Error extracting main content for {url}: {e}")
-        return None 
\ No newline at end of file
+        return None
+
+
+def _get_token_encoding():
+    """Returns the tiktoken encoding used for token counts, or None if tiktoken is missing or can't load it."""
+    global _token_encoding, TIKTOKEN_AVAILABLE
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    with _token_encoding_lock:
+        if _token_encoding is None and TIKTOKEN_AVAILABLE:
+            try:
+                # cl100k_base is only exact for OpenAI models, but close enough to budget other models' prompts too
+                _token_encoding = tiktoken.get_encoding('cl100k_base')
+            except Exception as e:
+                logging.warning(f"Could not load the tiktoken encoding ({e}). Falling back to character-based token estimates.")
+                TIKTOKEN_AVAILABLE = False
+        return _token_encoding
+
+def estimate_tokens(text):
+    """Estimates the number of tokens in a text with tiktoken if installed, else about 4 characters per token."""
+    if not text:
+        return 0
+    encoding = _get_token_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+def split_html_blocks(html_content, max_tokens):
+    """Splits an HTML fragment at block-level element boundaries into chunks of at most ~max_tokens tokens.
+
+    Wrapper elements (e.g. <article><section>...) are descended into, so chunks are sequences of
+    sibling blocks like paragraphs, headings, lists and figures. A single block larger than the budget
+    is split along its own children if it has any, otherwise it becomes a chunk of its own.
+    Returns the chunks as HTML strings, in document order.
+    """
+    if not html_content:
+        return []
+    try:
+        try:
+            soup = BeautifulSoup(html_content, 'lxml')
+        except ImportError:
+            soup = BeautifulSoup(html_content, 'html.parser')
+    except Exception as e:
+        logging.warning(f"HTML parsing failed while splitting into chunks: {e}. Returning a single chunk.")
+        return [html_content]
+
+    chunks = []
+    current, current_tokens = [], 0
+    for block_html, block_tokens in _iter_html_blocks(soup.body or soup, max_tokens):
+        if current and current_tokens + block_tokens > max_tokens:
+            chunks.append("".join(current))
+            current, current_tokens = [], 0
+        current.append(block_html)
+        current_tokens += block_tokens
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+def _iter_html_blocks(element, max_tokens):
+    """Yields (html, tokens) for the blocks of an element, descending into wrappers and blocks larger than max_tokens."""
+    for child in element.children:
+        child_html = str(child)
+        if not child_html.strip():
+            continue
+        child_tokens = estimate_tokens(child_html)
+        # Descend into oversized blocks that have element children; text nodes and leaves stay whole
+        if child_tokens > max_tokens and getattr(child, 'find', None) and child.find(True):
+            yield from _iter_html_blocks(child, max_tokens)
+        else:
+            yield child_html, child_tokens
+
+# Marks the places where sample_html_blocks() left blocks out
+HTML_SAMPLE_GAP = '<p>[...]</p>'
+
+def sample_html_blocks(html_content, max_tokens, middle_sections=3):
+    """Reduces an HTML fragment to about max_tokens tokens by sampling whole blocks (paragraphs, headings, lists...).
+
+    Keeps the beginning (40% of the budget), `middle_sections` evenly spaced sections from the middle (40%)
+    and the conclusion (20%), with HTML_SAMPLE_GAP where blocks were left out. Content within the budget
+    is returned unchanged. Returns (html, sampled), where sampled tells whether the content was reduced.
+    """
+    if not html_content or estimate_tokens(html_content) <= max_tokens:
+        return html_content, False
+
+    middle_sections = max(0, int(middle_sections))
+    head_budget = max_tokens * 2 // 5
+    tail_budget = max_tokens // 5
+    section_budget = (max_tokens - head_budget - tail_budget) // middle_sections if middle_sections else 0
+    head_budget += (max_tokens - head_budget - tail_budget) - section_budget * middle_sections
+    # Blocks larger than the smallest share are split along their children so every share gets whole blocks
+    smallest_budget = max(1, min(budget for budget in (head_budget, tail_budget, section_budget) if budget > 0))
+    if html_content.lstrip().startswith('<'):
+        try:
+            try:
+                soup = BeautifulSoup(html_content, 'lxml')
+            except ImportError:
+                soup = BeautifulSoup(html_content, 'html.parser')
+        except Exception as e:
+            logging.warning(f"HTML parsing failed while sampling blocks: {e}. Truncating instead.")
+            return html_content[:max_tokens * 4], True
+        blocks = list(_iter_html_blocks(soup.body or soup, smallest_budget))
+    else:
+        # Plain text (e.g. the extraction fallback): lines are the blocks
+        blocks = [(line + '\n', estimate_tokens(line)) for line in html_content.splitlines() if line.strip()]
+    if not blocks:
+        return html_content[:max_tokens * 4], True
+
+    def take(indexes, budget):
+        """Takes blocks in the given order until the budget is spent. A first block over budget is cut down to it."""
+        taken, used = [], 0
+        for index in indexes:
+            html, tokens = blocks[index]
+            if used + tokens > budget:
+                if not taken:
+                    blocks[index] = (html[:budget * 4], budget) # Leaf block (e.g. one huge <pre>) with no children to split along
+                    taken.append(index)
+                break
+            taken.append(index)
+            used += tokens
+        return taken
+
+    selected = set(take(range(len(blocks)), head_budget))
+    head_end = max(selected) + 1
+    tail = take(range(len(blocks) - 1, head_end - 1, -1), tail_budget)
+    selected.update(tail)
+    tail_start = min(tail) if tail else len(blocks)
+    middle_length = tail_start - head_end
+    for section in range(middle_sections):
+        if middle_length <= 0:
+            break
+        # Start points spread evenly over the middle, e.g. at 1/4, 2/4 and 3/4 for three sections
+        start = head_end + middle_length * (section + 1) // (middle_sections + 1)
+        selected.update(take(range(start, tail_start), section_budget))
+
+    parts = []
+    for index in range(len(blocks)):
+        if index in selected:
+            parts.append(blocks[index][0])
+        elif not parts or parts[-1] != HTML_SAMPLE_GAP:
+            parts.append(HTML_SAMPLE_GAP)
+    return "".join(parts), True
+
+# Tags kept by compact_html(); everything else is unwrapped (its children are kept) or dropped.
+# <source> is unwrapped rather than dropped: libxml2 doesn't treat it as a void element and may nest the <img> inside it.
+_COMPACT_KEPT_TAGS = {
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'br', 'hr', 'a', 'strong', 'b', 'em', 'i', 's', 'del', 'mark', 'sup', 'sub',
+    'code', 'pre', 'blockquote', 'ul', 'ol', 'li', 'img', 'figure', 'figcaption', 'iframe',
+    'table', 'thead', 'tbody', 'tr', 'th', 'td',
+}
+_COMPACT_DROPPED_TAGS = ['script', 'style', 'noscript', 'svg', 'button', 'form', 'input', 'template', 'link', 'meta', 'nav', 'header', 'footer', 'aside']
+# Attributes kept per tag; all others (class, style, data-*, srcset, width, ...) are removed
+_COMPACT_KEPT_ATTRIBUTES = {'a': ('href',), 'img': ('src', 'alt'), 'iframe': ('src',), 'ol': ('start',), 'th': ('colspan', 'rowspan'), 'td': ('colspan', 'rowspan')}
+# Elements that may stay even without text inside
+_COMPACT_VOID_TAGS = {'br', 'hr', 'img', 'iframe'}
+# Containers in which whitespace between child elements is insignificant
+_COMPACT_BLOCK_CONTAINERS = {'[document]', 'html', 'body', 'ul', 'ol', 'table', 'thead', 'tbody', 'tr', 'blockquote', 'figure'}
+
+def compact_html(html_content):
+    """Reduces an article HTML fragment to its semantic markup, to save tokens in the content-level AI calls.
+
+    Keeps headings, paragraphs, inline formatting, links, code, lists, quotes, figures, images and tables
+    with only their essential attributes (href, src, alt, ...). Wrapper elements like div, span, section
+    and picture are unwrapped, empty elements, comments and scripts are removed, and whitespace outside
+    <pre> is collapsed. Returns the original content if it can't be parsed.
+    """
+    if not html_content or not html_content.lstrip().startswith('<'):
+        return html_content
+    try:
+        try:
+            soup = BeautifulSoup(html_content, 'lxml')
+        except ImportError:
+            soup = BeautifulSoup(html_content, 'html.parser')
+
+        for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
+            comment.extract()
+        for tag in soup(_COMPACT_DROPPED_TAGS):
+            tag.decompose()
+
+        for tag in soup.find_all(True):
+            if tag.name not in _COMPACT_KEPT_TAGS:
+                if tag.name not in ('html', 'body'):
+                    tag.unwrap()
+                continue
+            if tag.name == 'img' and not tag.get('src'):
+                # Lazy-loaded images carry the URL in data-src or srcset only
+                srcset = tag.get('data-src') or (tag.get('srcset') or '').split(',')[0].strip().split(' ')[0]
+                if srcset:
+                    tag['src'] = srcset
+            kept = _COMPACT_KEPT_ATTRIBUTES.get(tag.name, ())
+            tag.attrs = {name: value for name, value in tag.attrs.items() if name in kept}
+
+        # Remove elements left without content, innermost first
+        for tag in reversed(soup.find_all(True)):
+            if tag.name in _COMPACT_VOID_TAGS or tag.name in ('html', 'body'):
+                continue
+            if not tag.get_text(strip=True) and not tag.find(_COMPACT_VOID_TAGS):
+                tag.decompose()
+
+        for text in soup.find_all(string=True):
+            if text.find_parent(['pre', 'code']):
+                continue
+            collapsed = re.sub(r'\s+', ' ', str(text))
+            if collapsed == ' ' and text.parent is not None and text.parent.name in _COMPACT_BLOCK_CONTAINERS:
+                text.extract()
+            elif collapsed != str(text):
+                text.replace_with(collapsed)
+
+        root = soup.body or soup
+        return ''.join(str(child) for child in root.contents).strip()
+    except Exception as e:
+        logging.warning(f"HTML compaction failed: {e}. Returning original content.")
+        return html_content